@@ -1 +1,3 @@
 from .ppo_agent import PPO
+from .ppo_algorithm import PPOAlgorithm
+from .actor_learner import ActorLearner
@@ -0,0 +1,224 @@
+import queue
+import time
+
+import gymnasium as gym
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+
+from custom_env import CUSTOM_ENV_ID, SumoEnvironment
+from .ppo_networks import ActorCritic
+
+
+def _load_shared_weights(policy, shared_params, lock):
+    with lock:
+        params = shared_params.clone()
+    vector_to_parameters(params, policy.parameters())
+
+
+def _actor(index, env_id, env_kwargs, obs_dim, action_dim, shared_params, version,
+           lock, fragments, stop, fragment_length, seed):
+    # Actor process: steps its own env with a read-only copy of the policy and streams
+    # rollout fragments (with the policy version used to collect them) to the learner
+    torch.set_num_threads(1)
+    SumoEnvironment.CONNECTION_LABEL = index  # unique TraCI label per actor (read from the base class)
+    env = gym.make(env_id, **env_kwargs)
+
+    policy = ActorCritic(obs_dim, action_dim)
+    policy.eval()
+    local_version = -1
+
+    obs, _ = env.reset(seed=None if seed is None else seed + index)
+    try:
+        while not stop.is_set():
+            # Pick up the latest published weights before each fragment
+            if version.value != local_version:
+                local_version = version.value
+                _load_shared_weights(policy, shared_params, lock)
+
+            states = np.zeros((fragment_length, obs_dim), dtype=np.float32)
+            actions = np.zeros(fragment_length, dtype=np.int64)
+            logprobs = np.zeros(fragment_length, dtype=np.float32)
+            rewards = np.zeros(fragment_length, dtype=np.float32)
+            dones = np.zeros(fragment_length, dtype=np.float32)
+
+            for t in range(fragment_length):
+                action, logprob, _ = policy.get_action(obs)
+                next_obs, reward, terminated, truncated, _ = env.step(int(action))
+                states[t] = obs
+                actions[t] = int(action)
+                logprobs[t] = float(logprob)
+                rewards[t] = reward
+                dones[t] = terminated or truncated
+                obs = next_obs
+                if terminated or truncated:
+                    obs, _ = env.reset()
+
+            fragment = {
+                "actor": index,
+                "version": local_version,
+                "states": states,
+                "actions": actions,
+                "logprobs": logprobs,
+                "rewards": rewards,
+                "dones": dones,
+                "last_state": np.array(obs, dtype=np.float32),
+            }
+            while not stop.is_set():
+                try:
+                    fragments.put(fragment, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+    finally:
+        env.close()
+
+
+@torch.no_grad()
+def vtrace(behaviour_logprobs, target_logprobs, rewards, values, dones, last_value,
+           gamma, rho_clip=1.0, c_clip=1.0):
+    # V-trace targets and policy-gradient advantages (IMPALA) for (steps, num_fragments)
+    # tensors, corrects for the lag between the behaviour and the learner policy
+    ratios = torch.exp(target_logprobs - behaviour_logprobs)
+    rhos = torch.clamp(ratios, max=rho_clip)
+    cs = torch.clamp(ratios, max=c_clip)
+    not_dones = 1.0 - dones
+
+    next_values = torch.cat([values[1:], last_value.unsqueeze(0)])
+    deltas = rhos * (rewards + gamma * next_values * not_dones - values)
+
+    # Reverse scan over time, vectorized over the fragments
+    vs_minus_v = torch.empty_like(deltas)
+    acc = torch.zeros_like(deltas[0])
+    for i in range(len(deltas) - 1, -1, -1):
+        acc = deltas[i] + gamma * cs[i] * not_dones[i] * acc
+        vs_minus_v[i] = acc
+    vs = vs_minus_v + values
+
+    next_vs = torch.cat([vs[1:], last_value.unsqueeze(0)])
+    advantages = rhos * (rewards + gamma * next_vs * not_dones - values)
+    return vs, advantages
+
+
+class ActorLearner:
+    """Asynchronous actor-learner training for PPO.
+
+    Actor processes run the custom env with a read-only copy of the ActorCritic and
+    stream rollout fragments into a queue while the learner (this process) updates the
+    policy and publishes the new weights through shared memory. Fragments collected
+    with weights older than max_policy_lag updates are dropped, and the remaining lag is
+    corrected with truncated importance ratios (V-trace).
+    """
+
+    def __init__(self, ppo, num_actors=2, env_kwargs=None, env_id=CUSTOM_ENV_ID,
+                 fragment_length=64, fragments_per_update=2, max_policy_lag=2,
+                 rho_clip=1.0, c_clip=1.0, queue_size=None, start_method="spawn", seed=None):
+        self.ppo = ppo
+        self.num_actors = num_actors
+        self.env_kwargs = env_kwargs or {}
+        self.env_id = env_id
+        self.fragment_length = fragment_length
+        self.fragments_per_update = fragments_per_update
+        self.max_policy_lag = max_policy_lag
+        self.rho_clip = rho_clip
+        self.c_clip = c_clip
+        self.queue_size = queue_size or 2 * num_actors
+        self.start_method = start_method
+        self.seed = seed
+
+        self.obs_dim = ppo.policy.shared[0].in_features
+        self.action_dim = ppo.policy.actor[-1].out_features
+
+        self.version = 0
+        self.stats = {"updates": 0, "steps": 0, "dropped_fragments": 0, "policy_lag": []}
+
+    def _publish(self):
+        with self._lock:
+            self._shared_params.copy_(parameters_to_vector(self.ppo.policy.parameters()).detach())
+        self.version += 1
+        self._version.value = self.version
+
+    def _start_actors(self):
+        ctx = mp.get_context(self.start_method)
+        self._shared_params = parameters_to_vector(self.ppo.policy.parameters()).detach().clone().share_memory_()
+        self._version = ctx.Value("i", self.version)
+        self._lock = ctx.Lock()
+        self._fragments = ctx.Queue(maxsize=self.queue_size)
+        self._stop = ctx.Event()
+        self._actors = [
+            ctx.Process(
+                target=_actor,
+                args=(i, self.env_id, self.env_kwargs, self.obs_dim, self.action_dim,
+                      self._shared_params, self._version, self._lock, self._fragments,
+                      self._stop, self.fragment_length, self.seed),
+                daemon=True,
+            )
+            for i in range(self.num_actors)
+        ]
+        for actor in self._actors:
+            actor.start()
+
+    def _stop_actors(self):
+        self._stop.set()
+        # Drain the queue so blocked actors can exit
+        deadline = time.time() + 10
+        while any(actor.is_alive() for actor in self._actors) and time.time() < deadline:
+            try:
+                self._fragments.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in self._actors:
+            actor.join(timeout=1)
+            if actor.is_alive():
+                actor.terminate()
+
+    def _next_batch(self):
+        # Collect fragments_per_update fragments within the policy lag bound
+        batch = []
+        while len(batch) < self.fragments_per_update:
+            try:
+                fragment = self._fragments.get(timeout=1.0)
+            except queue.Empty:
+                if not any(actor.is_alive() for actor in self._actors):
+                    raise RuntimeError("All actor processes exited")
+                continue
+            lag = self.version - fragment["version"]
+            if lag > self.max_policy_lag:
+                self.stats["dropped_fragments"] += 1
+                continue
+            self.stats["policy_lag"].append(lag)
+            batch.append(fragment)
+
+        # Stack fragments along the env axis: (fragment_length, num_fragments, ...)
+        stack = lambda key: torch.as_tensor(np.stack([f[key] for f in batch], axis=1))
+        last_states = torch.as_tensor(np.stack([f["last_state"] for f in batch]))
+        return (stack("states"), stack("actions"), stack("logprobs"),
+                stack("rewards"), stack("dones"), last_states)
+
+    def update(self, states, actions, behaviour_logprobs, rewards, dones, last_states):
+        # Importance-corrected targets with the current learner policy, then PPO epochs
+        with torch.no_grad():
+            logits, values = self.ppo.policy(states)
+            dist = torch.distributions.Categorical(logits=logits)
+            target_logprobs = dist.log_prob(actions)
+            _, last_value = self.ppo.policy(last_states)
+
+        returns, advantages = vtrace(
+            behaviour_logprobs, target_logprobs, rewards, values.squeeze(-1), dones,
+            last_value.squeeze(-1), self.ppo.gamma, self.rho_clip, self.c_clip,
+        )
+        self.ppo.optimize(states, actions, behaviour_logprobs, advantages, returns)
+        self._publish()
+
+    def learn(self, total_steps):
+        self._start_actors()
+        try:
+            while self.stats["steps"] < total_steps:
+                batch = self._next_batch()
+                self.update(*batch)
+                self.stats["updates"] += 1
+                self.stats["steps"] += self.fragment_length * self.fragments_per_update
+        finally:
+            self._stop_actors()
+        return self.stats
@@ -1,68 +1,121 @@
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
 
-from algorithms.ppo_networks import ActorCritic
-from algorithms.rollout_buffer import RolloutBuffer
+from .ppo_networks import ActorCritic
+from .rollout_buffer import RolloutBuffer
 
 
 class PPO:
     def __init__(self, obs_dim, action_dim,
                  lr=3e-4, gamma=0.99, clip=0.2,
-                 gae_lambda=0.95, K=4):
+                 gae_lambda=0.95, K=4, buffer_size=2048, num_envs=1,
+                 minibatch_size=None, max_grad_norm=None):
 
         self.gamma = gamma
         self.clip = clip
-        self.K = K
+        self.K = K  # epochs per update
         self.gae_lambda = gae_lambda
+        self.minibatch_size = minibatch_size  # None: full batch
+        self.max_grad_norm = max_grad_norm  # None: no gradient clipping
 
-        self.buffer = RolloutBuffer()
+        self.buffer = RolloutBuffer(buffer_size, obs_dim, num_envs)
 
         self.policy = ActorCritic(obs_dim, action_dim)
         self.optimizer = optim.Adam(self.policy.parameters(), lr=lr)
 
-    def compute_advantages(self, rewards, values, dones):
-        advantages = []
-        gae = 0
-        values = values + [0]  # bootstrap
-
-        for i in reversed(range(len(rewards))):
-            delta = rewards[i] + self.gamma * values[i+1] * (1 - dones[i]) - values[i]
-            gae = delta + self.gamma * self.gae_lambda * (1 - dones[i]) * gae
-            advantages.insert(0, gae)
-
-        returns = [adv + values[i] for i, adv in enumerate(advantages)]
+    @torch.no_grad()
+    def compute_advantages(self, rewards, values, dones, last_value=None):
+        # Inputs are (steps,) or (steps, num_envs) tensors
+        rewards = torch.as_tensor(rewards, dtype=torch.float32)
+        values = torch.as_tensor(values, dtype=torch.float32)
+        dones = torch.as_tensor(dones, dtype=torch.float32)
+
+        if last_value is None:
+            last_value = torch.zeros_like(values[0])  # bootstrap
+        last_value = torch.as_tensor(last_value, dtype=torch.float32).reshape(values[0].shape)
+        next_values = torch.cat([values[1:], last_value.unsqueeze(0)])
+
+        not_dones = 1.0 - dones
+        deltas = rewards + self.gamma * next_values * not_dones - values
+
+        # Reverse scan over time, vectorized over the parallel envs
+        advantages = torch.empty_like(deltas)
+        gae = torch.zeros_like(deltas[0])
+        decay = self.gamma * self.gae_lambda
+        for i in range(len(deltas) - 1, -1, -1):
+            gae = deltas[i] + decay * not_dones[i] * gae
+            advantages[i] = gae
+
+        returns = advantages + values
         return advantages, returns
 
-    def update(self):
-        states = torch.stack(self.buffer.states)
-        actions = torch.tensor(self.buffer.actions)
-        old_logprobs = torch.tensor(self.buffer.logprobs)
-        rewards = self.buffer.rewards
-        dones = self.buffer.dones
-        values = self.buffer.values
-
-        advantages, returns = self.compute_advantages(rewards, values, dones)
-        advantages = torch.tensor(advantages, dtype=torch.float32)
-        returns = torch.tensor(returns, dtype=torch.float32)
-
-        for _ in range(self.K):
-            logits, new_values = self.policy(states)
-            dist = torch.distributions.Categorical(logits=logits)
+    def update(self, last_value=None):
+        states, actions, old_logprobs, rewards, dones, values = self.buffer.get()
 
-            new_logprobs = dist.log_prob(actions)
-            ratio = torch.exp(new_logprobs - old_logprobs)
+        advantages, returns = self.compute_advantages(rewards, values, dones, last_value)
 
-            surr1 = ratio * advantages
-            surr2 = torch.clamp(ratio, 1 - self.clip, 1 + self.clip) * advantages
-
-            actor_loss = -torch.min(surr1, surr2).mean()
-            critic_loss = (returns - new_values.squeeze()).pow(2).mean()
+        self.optimize(states, actions, old_logprobs, advantages, returns)
+        self.buffer.clear()
 
-            loss = actor_loss + 0.5 * critic_loss
+    def optimize(self, states, actions, old_logprobs, advantages, returns):
+        # Clipped surrogate updates, old_logprobs are the logprobs of the behaviour policy
+        # Flatten (steps, num_envs) into a single batch
+        states = states.reshape(-1, states.shape[-1])
+        actions = actions.reshape(-1)
+        old_logprobs = old_logprobs.reshape(-1)
+        advantages = advantages.reshape(-1)
+        returns = returns.reshape(-1)
 
-            self.optimizer.zero_grad()
-            loss.backward()
-            self.optimizer.step()
+        batch_size = states.shape[0]
+        minibatch_size = min(self.minibatch_size or batch_size, batch_size)
 
-        self.buffer.clear()
+        # K epochs of shuffled minibatches
+        for _ in range(self.K):
+            perm = torch.randperm(batch_size)
+            for start in range(0, batch_size, minibatch_size):
+                idx = perm[start:start + minibatch_size]
+
+                logits, new_values = self.policy(states[idx])
+                dist = torch.distributions.Categorical(logits=logits)
+
+                new_logprobs = dist.log_prob(actions[idx])
+                ratio = torch.exp(new_logprobs - old_logprobs[idx])
+
+                surr1 = ratio * advantages[idx]
+                surr2 = torch.clamp(ratio, 1 - self.clip, 1 + self.clip) * advantages[idx]
+
+                actor_loss = -torch.min(surr1, surr2).mean()
+                critic_loss = (returns[idx] - new_values.squeeze(-1)).pow(2).mean()
+
+                loss = actor_loss + 0.5 * critic_loss
+
+                self.optimizer.zero_grad()
+                loss.backward()
+                if self.max_grad_norm is not None:
+                    nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
+                self.optimizer.step()
+
+    def collect_rollout(self, envs, obs):
+        # Fill the buffer from a vectorized env (e.g. SharedMemoryVectorEnv) with one
+        # batched forward pass per step, returns the last obs and its value (bootstrap)
+        while not self.buffer.full:
+            actions, logprobs, values = self.policy.get_action(obs)
+            next_obs, rewards, terminated, truncated, _ = envs.step(actions.numpy())
+            dones = np.logical_or(terminated, truncated)
+            self.buffer.add(obs, actions, logprobs, rewards, dones, values)
+            obs = next_obs
+
+        _, _, last_value = self.policy.get_action(obs)
+        return obs, last_value
+
+    def learn(self, envs, total_steps):
+        # Alternate rollouts of buffer_size steps per env and minibatch updates
+        obs, _ = envs.reset()
+        steps = 0
+        while steps < total_steps:
+            obs, last_value = self.collect_rollout(envs, obs)
+            steps += len(self.buffer) * self.buffer.num_envs
+            self.update(last_value)
+        return obs
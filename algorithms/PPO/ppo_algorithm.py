@@ -0,0 +1,43 @@
+import torch
+
+from algorithms.base import BaseAlgorithm
+from .ppo_agent import PPO
+
+
+class PPOAlgorithm(BaseAlgorithm):
+    """PPO behind the BaseAlgorithm interface of run_experiments: built from the spaces of
+    the env, one transition per train_step and an update every time the rollout buffer
+    of buffer_size steps is full."""
+
+    def __init__(self, env, **params):
+        self.ppo = PPO(env.observation_space.shape[0], env.action_space.n, **params)
+        self._last = None  # (logprob, value) of the last selected action
+
+    def reset(self):
+        # A new rollout starts (e.g. when a checkpoint is resumed)
+        self.ppo.buffer.clear()
+        self._last = None
+
+    def select_action(self, obs):
+        action, logprob, value = self.ppo.policy.get_action(obs)
+        self._last = (logprob, value)
+        return int(action)
+
+    def train_step(self, transition):
+        obs, action, reward, next_obs, done = transition
+        logprob, value = self._last
+        self.ppo.buffer.add(obs, action, logprob, reward, done, value)
+        if self.ppo.buffer.full:
+            # Bootstrap the unfinished episode with the value of the next observation
+            last_value = None
+            if not done:
+                _, _, last_value = self.ppo.policy.get_action(next_obs)
+            self.ppo.update(last_value)
+
+    def save(self, path):
+        torch.save({"policy": self.ppo.policy.state_dict(), "optimizer": self.ppo.optimizer.state_dict()}, path)
+
+    def load(self, path):
+        state = torch.load(path)
+        self.ppo.policy.load_state_dict(state["policy"])
+        self.ppo.optimizer.load_state_dict(state["optimizer"])
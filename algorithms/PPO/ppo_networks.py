@@ -29,9 +29,11 @@ class ActorCritic(nn.Module):
         value = self.critic(shared)
         return logits, value
 
+    @torch.inference_mode()
     def get_action(self, obs):
-        logits, value = self.forward(obs)
-        dist = torch.distributions.Categorical(logits=logits)
+        # Batched inference: obs is (obs_dim,) or (num_envs, obs_dim), no autograd tracking
+        logits, value = self.forward(torch.as_tensor(obs, dtype=torch.float32))
+        dist = torch.distributions.Categorical(logits=logits, validate_args=False)
         action = dist.sample()
         logprob = dist.log_prob(action)
-        return action.item(), logprob, value
+        return action, logprob, value.squeeze(-1)
@@ -1,18 +1,58 @@
 import torch
 
 class RolloutBuffer:
-    def __init__(self):
-        self.states = []
-        self.actions = []
-        self.logprobs = []
-        self.rewards = []
-        self.dones = []
-        self.values = []
+    """Fixed-capacity rollout storage backed by preallocated tensors.
+
+    Every field has shape (capacity, num_envs, ...) and is allocated once. Stored
+    tensors are detached, so the buffer never keeps the autograd graph of the policy.
+    """
+
+    def __init__(self, capacity, obs_dim, num_envs=1, device="cpu"):
+        self.capacity = capacity
+        self.num_envs = num_envs
+        self.device = torch.device(device)
+
+        self.states = torch.zeros((capacity, num_envs, obs_dim), dtype=torch.float32, device=self.device)
+        self.actions = torch.zeros((capacity, num_envs), dtype=torch.long, device=self.device)
+        self.logprobs = torch.zeros((capacity, num_envs), dtype=torch.float32, device=self.device)
+        self.rewards = torch.zeros((capacity, num_envs), dtype=torch.float32, device=self.device)
+        self.dones = torch.zeros((capacity, num_envs), dtype=torch.float32, device=self.device)
+        self.values = torch.zeros((capacity, num_envs), dtype=torch.float32, device=self.device)
+        self.ptr = 0
+
+    def __len__(self):
+        return self.ptr
+
+    @property
+    def full(self):
+        return self.ptr >= self.capacity
+
+    @torch.no_grad()
+    def add(self, state, action, logprob, reward, done, value):
+        """Store one step of every env (scalars are accepted when num_envs == 1)"""
+        if self.full:
+            raise IndexError(f"RolloutBuffer is full (capacity {self.capacity})")
+        t = self.ptr
+        self.states[t] = torch.as_tensor(state, dtype=torch.float32).reshape(self.num_envs, -1)
+        self.actions[t] = torch.as_tensor(action).reshape(self.num_envs)
+        self.logprobs[t] = torch.as_tensor(logprob).detach().reshape(self.num_envs)
+        self.rewards[t] = torch.as_tensor(reward, dtype=torch.float32).reshape(self.num_envs)
+        self.dones[t] = torch.as_tensor(done, dtype=torch.float32).reshape(self.num_envs)
+        self.values[t] = torch.as_tensor(value).detach().reshape(self.num_envs)
+        self.ptr += 1
+
+    def get(self):
+        """Views (no copy) of the filled part of every field, shape (steps, num_envs, ...)"""
+        t = self.ptr
+        return (
+            self.states[:t],
+            self.actions[:t],
+            self.logprobs[:t],
+            self.rewards[:t],
+            self.dones[:t],
+            self.values[:t],
+        )
 
     def clear(self):
-        self.states = []
-        self.actions = []
-        self.logprobs = []
-        self.rewards = []
-        self.dones = []
-        self.values = []
+        # Storage is reused, only the write position is reset
+        self.ptr = 0
@@ -1,3 +1,5 @@
 from .base import BaseAlgorithm
 from .q_learning.q_learning import QLearningAgent
-from .PPO.ppo_agent import PPO
\ No newline at end of file
+from .q_learning.q_algorithm import QLearningAlgorithm
+from .PPO.ppo_agent import PPO
+from .PPO.ppo_algorithm import PPOAlgorithm
\ No newline at end of file
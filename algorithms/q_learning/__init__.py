@@ -1 +1,4 @@
 from .q_learning import QLearningAgent
+from .q_algorithm import QLearningAlgorithm
+from .discretizer import Discretizer
+from .q_table import SparseQTable
@@ -0,0 +1,69 @@
+import numpy as np
+
+# Empty slot marker of the hashed keys (never produced by Discretizer.keys)
+EMPTY_KEY = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+class Discretizer:
+    """Maps continuous observations to integer state keys from per-feature bin edges.
+
+    Feature i falls in bin b if edges[i][b-1] <= x < edges[i][b] (same convention as
+    np.digitize), so a feature with k inner edges has k + 1 bins. Bins are computed for
+    all features (and a whole batch of observations) with one broadcasted comparison.
+    """
+
+    def __init__(self, bin_edges):
+        self.n_features = len(bin_edges)
+        self.n_bins = np.array([len(edges) + 1 for edges in bin_edges], dtype=np.int64)
+
+        # Pad the edges to a (n_features, max_edges) array, +inf never counts
+        max_edges = max(len(edges) for edges in bin_edges)
+        self.edges = np.full((self.n_features, max_edges), np.inf)
+        for i, edges in enumerate(bin_edges):
+            self.edges[i, :len(edges)] = np.sort(edges)
+
+        # Exact mixed-radix keys when the state count fits in 63 bits, else hashed keys
+        self.n_states = int(np.prod([int(n) for n in self.n_bins], dtype=object))
+        self.exact = self.n_states < 2**63
+        if self.exact:
+            self.radix = np.cumprod(np.concatenate([[1], self.n_bins[:-1]])).astype(np.int64)
+        else:
+            rng = np.random.default_rng(0)
+            self.multipliers = rng.integers(1, 2**63, size=self.n_features, dtype=np.uint64) | np.uint64(1)
+
+    @classmethod
+    def uniform(cls, low, high, n_bins):
+        """n_bins equal-width bins per feature between low and high"""
+        low = np.asarray(low, dtype=np.float64)
+        high = np.asarray(high, dtype=np.float64)
+        return cls([np.linspace(lo, hi, n_bins + 1)[1:-1] for lo, hi in zip(low, high)])
+
+    @classmethod
+    def quantile(cls, samples, n_bins):
+        """Bins holding the same share of the sampled observations (samples: (n, n_features))"""
+        samples = np.asarray(samples, dtype=np.float64)
+        quantiles = np.linspace(0, 1, n_bins + 1)[1:-1]
+        edges = np.quantile(samples, quantiles, axis=0).T
+        # Duplicate edges (e.g. binary features) would create empty bins
+        return cls([np.unique(feature_edges) for feature_edges in edges])
+
+    def bins(self, obs):
+        """Bin index of every feature, shape (..., n_features)"""
+        obs = np.asarray(obs, dtype=np.float64)
+        return (obs[..., :, None] >= self.edges).sum(axis=-1)
+
+    def keys(self, obs):
+        """Integer state key (np.uint64) of an observation or a batch of observations"""
+        bins = self.bins(obs)
+        if self.exact:
+            return (bins @ self.radix).astype(np.uint64)
+        # 64-bit multiplicative hash of the bins (splitmix64 finalizer)
+        with np.errstate(over="ignore"):
+            h = (bins.astype(np.uint64) * self.multipliers).sum(axis=-1, dtype=np.uint64)
+            h ^= h >> np.uint64(31)
+            h *= np.uint64(0xBF58476D1CE4E5B9)
+            h ^= h >> np.uint64(29)
+        return np.minimum(h, EMPTY_KEY - np.uint64(1))
+
+    def __call__(self, obs):
+        return int(self.keys(obs))
@@ -0,0 +1,37 @@
+import numpy as np
+
+from algorithms.base import BaseAlgorithm
+from .discretizer import Discretizer
+from .q_learning import N_BINS, QLearningAgent
+
+
+class QLearningAlgorithm(BaseAlgorithm):
+    """Q-learning behind the BaseAlgorithm interface of run_experiments: the observation
+    features (normalized to [0, 1]) are discretized in n_bins uniform bins, epsilon
+    decays at the end of every episode."""
+
+    def __init__(self, env, n_bins=N_BINS, **params):
+        n_features = env.observation_space.shape[0]
+        discretizer = Discretizer.uniform(np.zeros(n_features), np.ones(n_features), n_bins)
+        self.agent = QLearningAgent(discretizer, env.action_space.n, **params)
+
+    def reset(self):
+        pass
+
+    def select_action(self, obs):
+        return int(self.agent.choose_action(self.agent.discretize(obs)))
+
+    def train_step(self, transition):
+        obs, action, reward, next_obs, done = transition
+        self.agent.update_q(self.agent.discretize(obs), action, reward, self.agent.discretize(next_obs))
+        if done:
+            self.agent.decay()
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, epsilon=self.agent.epsilon, **self.agent.q_table.state_dict())
+
+    def load(self, path):
+        with np.load(path) as state:
+            self.agent.q_table.load_state_dict(state)
+            self.agent.epsilon = float(state["epsilon"])
@@ -1,12 +1,19 @@
 import numpy as np
 import gymnasium as gym
 from custom_env import CUSTOM_ENV_ID
+from .discretizer import Discretizer
+from .q_table import SparseQTable
+
+# Bins per observation feature of the default (uniform) discretization
+N_BINS = 4
 
 # Q-learning agent
 class QLearningAgent:
-    def __init__(self, state_space, action_space, lr=0.1, gamma=0.99,
-                 epsilon=1.0, eps_decay=0.995, eps_min=0.01):
-        self.state_space = state_space
+    def __init__(self, discretizer, action_space, lr=0.1, gamma=0.99,
+                 epsilon=1.0, eps_decay=0.995, eps_min=0.01,
+                 max_states=None, max_memory_mb=256):
+        # discretizer maps observations to integer state keys
+        self.discretizer = discretizer
         self.action_space = action_space
 
         # learning params
@@ -16,21 +23,25 @@ class QLearningAgent:
         self.eps_decay = eps_decay
         self.eps_min = eps_min
 
-        # q table
-        self.q_table = np.zeros(state_space + [action_space])
+        # q table (only visited states, bounded memory)
+        self.q_table = SparseQTable(action_space, max_states=max_states, max_memory_mb=max_memory_mb)
+
+    def discretize(self, obs):
+        # observation -> state key used by choose_action and update_q
+        return self.discretizer(obs)
 
     def choose_action(self, state):
         # epsilon-greedy
         if np.random.random() < self.epsilon:
             return np.random.randint(self.action_space)
         else:
-            return np.argmax(self.q_table[state])
+            return np.argmax(self.q_table.get(state))
 
     def update_q(self, state, action, reward, next_state):
         # basic Q-learning update
-        next_best = np.argmax(self.q_table[next_state])
-        target = reward + self.gamma * self.q_table[next_state][next_best]
-        self.q_table[state][action] += self.lr * (target - self.q_table[state][action])
+        target = reward + self.gamma * np.max(self.q_table.get(next_state))
+        q_row = self.q_table.visit(state)
+        q_row[action] += self.lr * (target - q_row[action])
 
     def decay(self):
         # decrease epsilon each episode
@@ -39,7 +50,7 @@ class QLearningAgent:
 def train(agent, env, episodes=1000):
     for ep in range(episodes):
         state, _ = env.reset()
-        state = tuple(state)  # the env gives array so convert it
+        state = agent.discretize(state)  # the env gives array so convert it
 
         done = False
         total_reward = 0
@@ -47,7 +58,7 @@ def train(agent, env, episodes=1000):
         while not done:
             action = agent.choose_action(state)
             next_state, reward, terminated, truncated, _ = env.step(action)
-            next_state = tuple(next_state)
+            next_state = agent.discretize(next_state)
 
             agent.update_q(state, action, reward, next_state)
 
@@ -63,8 +74,10 @@ def train(agent, env, episodes=1000):
 
 if __name__ == "__main__":
     env = gym.make(CUSTOM_ENV_ID)
-    obs_shape = list(env.observation_space.shape)
+    n_features = env.observation_space.shape[0]
     n_actions = env.action_space.n
 
-    agent = QLearningAgent(obs_shape, n_actions)
+    # observation features are normalized to [0, 1]
+    discretizer = Discretizer.uniform(np.zeros(n_features), np.ones(n_features), N_BINS)
+    agent = QLearningAgent(discretizer, n_actions)
     train(agent, env)
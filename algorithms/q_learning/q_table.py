@@ -0,0 +1,134 @@
+import numpy as np
+
+from .discretizer import EMPTY_KEY
+
+# Fibonacci hashing multiplier (2**64 / golden ratio)
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = 2**64 - 1
+
+
+class SparseQTable:
+    """Memory-bounded Q-table storing only the visited states.
+
+    Q-rows live in preallocated arrays indexed by an open-addressing (linear probing)
+    hash table of the integer state keys. The table doubles while it is under the memory
+    cap; once max_states are stored, the least-visited states are evicted in a batch.
+    """
+
+    def __init__(self, n_actions, max_states=None, max_memory_mb=256, load_factor=0.5,
+                 evict_fraction=0.1, initial_capacity=1024):
+        self.n_actions = int(n_actions)
+        self.load_factor = load_factor
+        self.evict_fraction = evict_fraction
+
+        # Largest power of two capacity within the memory cap (key + q-row + visit count)
+        self.slot_nbytes = 8 + 8 * self.n_actions + 8
+        max_slots = max(2, int(max_memory_mb * 2**20) // self.slot_nbytes)
+        self.max_capacity = 1 << (max_slots.bit_length() - 1)
+        self.max_states = int(self.max_capacity * load_factor)
+        if max_states is not None and max_states < self.max_states:
+            self.max_states = max_states
+            self.max_capacity = 1 << (int(np.ceil(max_states / load_factor)) - 1).bit_length()
+
+        self._allocate(min(self.max_capacity, 1 << (max(2, initial_capacity) - 1).bit_length()))
+        self.evictions = 0
+        self._empty_row = np.zeros(self.n_actions)
+
+    @staticmethod
+    def projected_nbytes(n_states, n_actions, load_factor=0.5):
+        """Memory of a table holding n_states states (power of two capacity)"""
+        capacity = 1 << (max(2, int(np.ceil(n_states / load_factor))) - 1).bit_length()
+        return capacity * (8 + 8 * int(n_actions) + 8)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self._shift = 64 - (capacity.bit_length() - 1)
+        self.keys = np.full(capacity, EMPTY_KEY, dtype=np.uint64)
+        self.q = np.zeros((capacity, self.n_actions))
+        self.visits = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.q.nbytes + self.visits.nbytes
+
+    def _probe(self, key):
+        # Slot holding the key, or the empty slot where it would be inserted
+        key = int(key)
+        mask = self.capacity - 1
+        slot = ((key * _HASH_MULTIPLIER) & _MASK64) >> self._shift
+        keys = self.keys
+        while True:
+            stored = int(keys[slot])
+            if stored == key or stored == EMPTY_KEY:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _find(self, key):
+        slot = self._probe(key)
+        return slot if self.keys[slot] != EMPTY_KEY else -1
+
+    def get(self, key):
+        """Q-values of a state (zeros if the state was never updated), do not modify"""
+        slot = self._find(key)
+        return self.q[slot] if slot >= 0 else self._empty_row
+
+    def row(self, key):
+        """Writable Q-values of a state, inserted (with zeros) if needed"""
+        slot = self._probe(key)
+        if self.keys[slot] == EMPTY_KEY:
+            if self.size >= self.max_states:
+                self._evict()
+            elif self.size + 1 > self.capacity * self.load_factor:
+                self._rehash(self.capacity * 2)
+            else:
+                self.keys[slot] = key
+                self.size += 1
+                return self.q[slot]
+            return self.row(key)
+        return self.q[slot]
+
+    def visit(self, key):
+        """Q-values of a state for an update, counts the visit used by the eviction"""
+        q_row = self.row(key)
+        self.visits[self._probe(key)] += 1
+        return q_row
+
+    def _rehash(self, capacity, keep=None):
+        # Rebuild the table (new capacity and/or only the kept slots)
+        occupied = np.flatnonzero(self.keys != EMPTY_KEY) if keep is None else keep
+        keys, q, visits = self.keys[occupied], self.q[occupied], self.visits[occupied]
+        self._allocate(capacity)
+        for key, q_row, count in zip(keys.tolist(), q, visits):
+            slot = self._probe(key)
+            self.keys[slot] = key
+            self.q[slot] = q_row
+            self.visits[slot] = count
+        self.size = len(keys)
+
+    def _evict(self):
+        # Drop the evict_fraction least-visited states in one rebuild
+        occupied = np.flatnonzero(self.keys != EMPTY_KEY)
+        n_evict = max(1, int(len(occupied) * self.evict_fraction))
+        order = np.argpartition(self.visits[occupied], n_evict - 1)
+        self._rehash(self.capacity, keep=np.sort(occupied[order[n_evict:]]))
+        self.evictions += n_evict
+
+    def state_dict(self):
+        """Arrays of the table (e.g. to save them with np.savez)"""
+        return {"keys": self.keys, "q": self.q, "visits": self.visits, "evictions": np.int64(self.evictions)}
+
+    def load_state_dict(self, state):
+        """Restore a table saved with state_dict (same number of actions)"""
+        self._allocate(len(state["keys"]))
+        self.keys[:] = state["keys"]
+        self.q[:] = state["q"]
+        self.visits[:] = state["visits"]
+        self.size = int((self.keys != EMPTY_KEY).sum())
+        self.evictions = int(state["evictions"])
@@ -0,0 +1,269 @@
+"""-------------------------------------------------------------------------------------
+File: benchmark.py
+Description: Throughput benchmarks (env steps per second) of the custom environment on
+the demo-intersection scenario and on generated grids. Run `python benchmark.py <name>`
+where <name> is one of the keys of BENCHMARKS.
+-------------------------------------------------------------------------------------"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import gymnasium as gym
+import numpy as np
+
+from custom_env import CUSTOM_ENV_ID
+from demand_generator import demand_route_file
+from grid_scenario import make_grid_env
+from traci_trace import load_trace
+from vector_env import SharedMemoryVectorEnv
+
+# Number of env steps (agent decisions) measured per configuration
+BENCHMARK_STEPS = 500
+
+# Fixed SUMO seed so every configuration simulates the same traffic
+BENCHMARK_SEED = 42
+
+# Simulated seconds per episode (the env is reset when an episode ends)
+BENCHMARK_EPISODE_SECONDS = 3600
+
+
+def benchmark_env(num_steps: int = BENCHMARK_STEPS, use_max_pressure: bool = True, **env_kwargs) -> dict:
+    """Steps the custom environment for num_steps and measures the throughput.
+
+    Args:
+        num_steps (int): Number of env steps to measure (reset time excluded).
+        use_max_pressure (bool): Use the max-pressure action, otherwise random actions.
+        **env_kwargs: Extra arguments passed to gym.make (e.g. use_subscriptions=True).
+
+    Returns:
+        dict: steps, seconds and steps_per_sec of the run.
+    """
+    env_kwargs.setdefault("sumo_seed", BENCHMARK_SEED)
+    env_kwargs.setdefault("num_seconds", BENCHMARK_EPISODE_SECONDS)
+    env_kwargs.setdefault("sumo_warnings", False)
+    env = gym.make(CUSTOM_ENV_ID, **env_kwargs)
+    rng = np.random.default_rng(BENCHMARK_SEED)
+
+    env.reset()
+    ts = list(env.unwrapped.traffic_signals.values())[0]
+    elapsed = 0.0
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        if use_max_pressure:
+            action = ts.select_max_pressure_action()
+        else:
+            action = int(rng.integers(env.action_space.n))
+        _, _, terminated, truncated, _ = env.step(action)
+
+        if terminated or truncated:
+            # Do not count the simulator restart in the step throughput
+            elapsed += time.perf_counter() - start
+            env.reset()
+            ts = list(env.unwrapped.traffic_signals.values())[0]
+            start = time.perf_counter()
+    elapsed += time.perf_counter() - start
+    memory = env_memory_mb(env.unwrapped)
+    env.close()
+
+    return {"steps": num_steps, "seconds": elapsed, "steps_per_sec": num_steps / elapsed, **memory}
+
+
+def _proc_memory_mb(pid, field: str) -> float:
+    # Memory field of /proc/<pid>/status in MB (NaN where /proc is not available)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def env_memory_mb(env) -> dict:
+    """Peak resident memory (MB) of the SUMO process of an env (NaN with libsumo) and
+    resident memory of this process"""
+    process = getattr(env.sumo, "_process", None)
+    return {
+        "sumo_peak_mb": _proc_memory_mb(process.pid, "VmHWM") if process is not None else float("nan"),
+        "python_rss_mb": _proc_memory_mb("self", "VmRSS"),
+    }
+
+
+def print_result(label: str, result: dict, baseline: dict = None):
+    """Print one line of benchmark result (with speedup if a baseline is given)"""
+    line = f"  {label:<24} {result['steps_per_sec']:10.1f} steps/sec ({result['seconds']:.2f}s)"
+    if baseline is not None:
+        line += f"  x{result['steps_per_sec'] / baseline['steps_per_sec']:.2f}"
+    print(line)
+
+
+def benchmark_subscriptions(num_steps: int = BENCHMARK_STEPS):
+    """Compare individual TraCI getter calls with the subscription-based state acquisition"""
+    print(f"TraCI subscriptions benchmark ({num_steps} steps, max-pressure)")
+    before = benchmark_env(num_steps)
+    print_result("getters (before)", before)
+    after = benchmark_env(num_steps, use_subscriptions=True)
+    print_result("subscriptions (after)", after, before)
+
+
+def benchmark_reward(num_steps: int = BENCHMARK_STEPS):
+    """Compare the reward features queried every step with the incremental RewardTracker"""
+    print(f"Incremental reward benchmark ({num_steps} steps, max-pressure)")
+    for label, env_kwargs in [("getters", {}), ("subscriptions", {"use_subscriptions": True})]:
+        before = benchmark_env(num_steps, **env_kwargs)
+        print_result(f"{label} (before)", before)
+        after = benchmark_env(num_steps, incremental_reward=True, **env_kwargs)
+        print_result(f"{label} incremental", after, before)
+
+
+def benchmark_traci(num_steps: int = BENCHMARK_STEPS):
+    """Per-method TraCI call report (the profile is printed when the env is closed)"""
+    print(f"TraCI call profile ({num_steps} steps, max-pressure)")
+    for label, env_kwargs in [("getters", {}), ("subscriptions", {"use_subscriptions": True})]:
+        print(f"\n[{label}]")
+        result = benchmark_env(num_steps, profile_traci=True, **env_kwargs)
+        print_result(f"{label} (profiled)", result)
+
+
+def benchmark_replay_env(trace_path: str, **env_kwargs) -> dict:
+    """Replays the recorded episodes of a TraCI trace (recorded actions, no simulator).
+
+    Returns:
+        dict: steps, seconds and steps_per_sec of the replay.
+    """
+    env_kwargs.setdefault("num_seconds", BENCHMARK_EPISODE_SECONDS)
+    env = gym.make(CUSTOM_ENV_ID, replay_traci=trace_path, **env_kwargs)
+    steps = 0
+    elapsed = 0.0
+    for _ in range(len(load_trace(trace_path))):
+        env.reset()
+        start = time.perf_counter()
+        for action in env.unwrapped.replay_actions:
+            env.step(action)
+        elapsed += time.perf_counter() - start
+        steps += len(env.unwrapped.replay_actions)
+    env.close()
+
+    return {"steps": steps, "seconds": elapsed, "steps_per_sec": steps / elapsed}
+
+
+def benchmark_replay(num_steps: int = BENCHMARK_STEPS):
+    """Compare the live env with the replay of the same episode from a TraCI trace"""
+    print(f"TraCI replay benchmark ({num_steps} steps, max-pressure)")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, env_kwargs in [("getters", {}), ("subscriptions", {"use_subscriptions": True})]:
+            trace_path = os.path.join(tmp_dir, f"{label}.trace")
+            live = benchmark_env(num_steps, **env_kwargs)
+            benchmark_env(num_steps, record_traci=trace_path, **env_kwargs)
+            replay = benchmark_replay_env(trace_path, **env_kwargs)
+            print_result(f"{label} (live)", live)
+            print_result(f"{label} (replay)", replay, live)
+
+
+def benchmark_vector_env(num_envs: int, num_steps: int = BENCHMARK_STEPS, **env_kwargs) -> dict:
+    """Steps a SharedMemoryVectorEnv with random actions for num_steps batched steps.
+
+    Returns:
+        dict: total env steps, seconds and steps_per_sec (summed over the envs).
+    """
+    env_kwargs.setdefault("num_seconds", BENCHMARK_EPISODE_SECONDS)
+    env_kwargs.setdefault("sumo_warnings", False)
+    envs = SharedMemoryVectorEnv(num_envs, env_kwargs)
+    rng = np.random.default_rng(BENCHMARK_SEED)
+    try:
+        envs.reset(seed=BENCHMARK_SEED)
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            envs.step(envs.sample_actions(rng))
+        elapsed = time.perf_counter() - start
+    finally:
+        envs.close()
+
+    total_steps = num_envs * num_steps
+    return {"steps": total_steps, "seconds": elapsed, "steps_per_sec": total_steps / elapsed}
+
+
+def benchmark_vector(num_steps: int = BENCHMARK_STEPS):
+    """Steps/sec scaling of the process-parallel vector env with the number of workers"""
+    max_envs = os.cpu_count() or 1
+    num_envs_list = [n for n in (1, 2, 4, 8, 16, 32) if n <= max_envs]
+    print(f"Vector env scaling benchmark ({num_steps} batched steps, random actions, {max_envs} cores)")
+    baseline = None
+    for num_envs in num_envs_list:
+        result = benchmark_vector_env(num_envs, num_steps)
+        print_result(f"{num_envs} worker(s)", result, baseline)
+        baseline = baseline or result
+
+
+def benchmark_grid_env(rows: int, cols: int, num_steps: int = BENCHMARK_STEPS, **env_kwargs) -> dict:
+    """Steps the multi-agent env of a rows x cols grid (max-pressure action of every signal).
+
+    Returns:
+        dict: steps, seconds and steps_per_sec of the run (one step = all the agents).
+    """
+    env_kwargs.setdefault("sumo_seed", BENCHMARK_SEED)
+    env_kwargs.setdefault("num_seconds", BENCHMARK_EPISODE_SECONDS)
+    env_kwargs.setdefault("sumo_warnings", False)
+    env = make_grid_env(rows, cols, **env_kwargs)
+
+    env.reset()
+    elapsed = 0.0
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        signals = env.unwrapped.traffic_signals
+        _, _, dones, _ = env.step({ts_id: ts.select_max_pressure_action() for ts_id, ts in signals.items()})
+
+        if dones["__all__"]:
+            elapsed += time.perf_counter() - start
+            env.reset()
+            start = time.perf_counter()
+    elapsed += time.perf_counter() - start
+    env.close()
+
+    return {"steps": num_steps, "seconds": elapsed, "steps_per_sec": num_steps / elapsed}
+
+
+def benchmark_grid(num_steps: int = BENCHMARK_STEPS):
+    """Per-signal lane queries compared with the shared network lane state on growing grids"""
+    print(f"Grid benchmark ({num_steps} steps, max-pressure on every signal)")
+    for rows, cols in [(1, 2), (2, 2), (3, 3)]:
+        before = benchmark_grid_env(rows, cols, num_steps, shared_lane_state=False)
+        print_result(f"{rows}x{cols} per signal", before)
+        after = benchmark_grid_env(rows, cols, num_steps)
+        print_result(f"{rows}x{cols} shared state", after, before)
+
+
+def benchmark_demand(num_steps: int = BENCHMARK_STEPS):
+    """Steps/sec and memory of the env as the generated demand grows (demand_generator.py)"""
+    print(f"Demand scaling benchmark ({num_steps} steps, max-pressure, demo intersection)")
+    baseline = None
+    for multiplier in (0.25, 0.5, 1, 2, 4):
+        route_file = demand_route_file(multiplier=multiplier)
+        result = benchmark_env(num_steps, route_file=route_file)
+        print_result(f"demand x{multiplier:g}", result, baseline)
+        print(f"  {'':<24} SUMO peak {result['sumo_peak_mb']:.0f} MB, Python {result['python_rss_mb']:.0f} MB")
+        baseline = baseline or result
+
+
+# Benchmarks that can be selected from the command line
+BENCHMARKS = {
+    "subscriptions": benchmark_subscriptions,
+    "vector": benchmark_vector,
+    "reward": benchmark_reward,
+    "traci": benchmark_traci,
+    "replay": benchmark_replay,
+    "grid": benchmark_grid,
+    "demand": benchmark_demand,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Custom environment throughput benchmarks")
+    parser.add_argument("benchmark", choices=list(BENCHMARKS.keys()))
+    parser.add_argument("--steps", type=int, default=BENCHMARK_STEPS)
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args.steps)
@@ -7,6 +7,7 @@ ROUTE_FILE_PATH have to be designed for this to work.
 -------------------------------------------------------------------------------------"""
 
 import numpy as np
+import gymnasium as gym
 from gymnasium import spaces
 from gymnasium.envs.registration import register
 from sumo_rl.environment.env import (
@@ -15,11 +16,22 @@ from sumo_rl.environment.env import (
     ObservationFunction,
     LIBSUMO,
 )
+import sumo_rl.environment.env as sumo_rl_env
 import sumolib
 import traci
+from traci import constants as tc
+import math
+import os
+import shutil
+import tempfile
 import time
 from typing import Union, Optional
 from typing_extensions import Callable
+from traci_profiler import InstrumentedConnection, TraCIProfiler
+from traci_trace import ReplayConnection, ReplayInit, TraceRecorder, load_trace, save_trace
+from reward_tracker import RewardTracker
+from lane_state import NetworkLaneState
+from topology_cache import load_topology
 # Id of the custom environment registered to Gymnasium API
 CUSTOM_ENV_ID = "custom-tsc-env-v0"
 
@@ -28,14 +40,35 @@ DEMO_DIR = "demo-intersection/"
 NET_FILE_PATH = DEMO_DIR + "demo-intersection.net.xml"
 ROUTE_FILE_PATH = DEMO_DIR + "demo-intersection.rou.xml"
 
-"""Number of seconds to wait before starting the GUI simulation (needed for 
-object initialization)"""
+# Id of the multi-agent version (one agent per traffic signal), see grid_scenario.py
+GRID_ENV_ID = "custom-tsc-grid-v0"
+
+"""Maximum number of seconds to wait for the GUI simulation to be ready before 
+starting it (needed for object initialization)"""
 START_SIMULATION_DELAY = 2
 
+# Seconds between two readiness checks of the GUI simulation
+READY_POLL_INTERVAL = 0.05
+
+# Environment reset modes: relaunch SUMO, or reload a saved simulation state
+RESET_MODES = ("relaunch", "snapshot")
+
+# Simulation fidelity levels: SUMO step length (s). The mesoscopic model is not a level,
+# it does not report the per-lane vehicles and waiting times of the observation/reward
+FIDELITY_LEVELS = {
+    "full": 1,
+    "medium": 2,
+    "low": 5,
+}
+
 
 class CustomTrafficSignal(TrafficSignal):
     
     MIN_PED_GAP = 0.5
+    # Speed (m/s) under which a pedestrian is considered halting (same as SUMO vehicles)
+    PED_HALT_SPEED = 0.1
+    # Extra distance (m) added to the range of the TraCI context subscriptions
+    CONTEXT_RANGE_MARGIN = 1.0
     
     def __init__(
         self,
@@ -97,26 +130,317 @@ class CustomTrafficSignal(TrafficSignal):
 
         self.observation_fn = self.env.observation_class(self)
 
+        # Static topology compiled from the net file (see topology_cache.py), None to query TraCI
+        self._topology = self.env.topology.signal(self.id) if self.env.topology is not None else None
+        self._program_logic = None
+
         self._build_phases()
         
         # Separate vehicles and pedestrians
-        all_lanes = list(dict.fromkeys(self.sumo.trafficlight.getControlledLanes(self.id)))
+        if self._topology is not None:
+            all_lanes = list(dict.fromkeys(self._topology.controlled_lanes))
+        else:
+            all_lanes = list(dict.fromkeys(self.sumo.trafficlight.getControlledLanes(self.id)))
         self.lanes = [lane for lane in all_lanes if not lane.startswith(":")]
         self.ped_lanes = [lane for lane in all_lanes if lane.startswith(":")]
         
         # Only compute out_lanes for vehicles
-        out_lanes = set(link[0][1] for link in self.sumo.trafficlight.getControlledLinks(self.id) if link)
+        out_lanes = set(link[1] for link in self._get_controlled_links() if link)
         self.out_lanes = [lane for lane in out_lanes if not lane.startswith(":")]
 
         # Recompute lengths including ped lanes if needed
-        self.lanes_length = {lane: self.sumo.lane.getLength(lane) for lane in self.lanes + self.out_lanes + self.ped_lanes}
+        if self._topology is not None:
+            lanes_length = self._topology.lanes_length
+            self.lanes_length = {lane: lanes_length[lane] for lane in self.lanes + self.out_lanes + self.ped_lanes}
+        else:
+            self.lanes_length = {lane: self.sumo.lane.getLength(lane) for lane in self.lanes + self.out_lanes + self.ped_lanes}
+
+        # Per-step pedestrian snapshot (see _get_pedestrian_snapshot)
+        self._ped_snapshot = {}
+        self._ped_snapshot_step = None
+
+        # Shared network state (see attach_lane_state)
+        self._lane_state = None
+
+        # Phase x link incidence matrix for max-pressure
+        self.compile_signal_program()
 
         self.observation_space = self.observation_fn.observation_space()
         self.action_space = spaces.Discrete(self.num_green_phases)
 
+    def save_state(self) -> dict:
+        """Phase and reward state of the signal, saved with a simulation state (see reset_state)"""
+        return {
+            "green_phase": self.green_phase,
+            "is_yellow": self.is_yellow,
+            "time_since_last_phase_change": self.time_since_last_phase_change,
+            "last_ts_waiting_time": self.last_ts_waiting_time,
+            "signal_state": None if self.env.fixed_ts else self.sumo.trafficlight.getRedYellowGreenState(self.id),
+        }
+
+    def reset_state(self, begin_time: float, state: Optional[dict] = None):
+        """Resets the signal to its first green phase (or to a state from save_state), acting
+        from begin_time, without rebuilding it (used after loading a simulation state)."""
+        self.green_phase = 0 if state is None else state["green_phase"]
+        self.is_yellow = False if state is None else state["is_yellow"]
+        self.time_since_last_phase_change = 0 if state is None else state["time_since_last_phase_change"]
+        self.next_action_time = begin_time
+        self.last_ts_waiting_time = 0.0 if state is None else state["last_ts_waiting_time"]
+        self.last_reward = None
+        self._ped_snapshot = {}
+        self._ped_snapshot_step = None
+        if not self.env.fixed_ts:
+            signal_state = self.all_phases[0].state if state is None else state["signal_state"]
+            self.sumo.trafficlight.setRedYellowGreenState(self.id, signal_state)
+
+    # Group the pedestrians on each controlled pedestrian lane, once per simulation step
+    def _get_pedestrian_snapshot(self) -> dict[str, list[tuple[float, float]]]:
+        """Returns the (speed, waiting time) of the pedestrians on each pedestrian lane.
+
+        The persons in the simulation are scanned a single time per simulation step and 
+        the snapshot is reused by every pedestrian method until `env.sim_step` changes.
+        The waiting time is only queried for halting pedestrians (0.0 otherwise).
+        """
+        if self._lane_state is not None:
+            return self._lane_state.refresh().ped_snapshot
+
+        sim_step = self.env.sim_step
+        if self._ped_snapshot_step == sim_step:
+            return self._ped_snapshot
+
+        snapshot = {lane: [] for lane in self.ped_lanes}
+        if self.env.use_subscriptions:
+            contexts = self.env.get_subscription_results()["junction_context"]
+            for junction in self._ped_junctions:
+                for values in contexts.get(junction, {}).values():
+                    lane = values[tc.VAR_LANE_ID]
+                    if lane in snapshot:
+                        speed = values[tc.VAR_SPEED]
+                        wait = values[tc.VAR_WAITING_TIME] if speed < self.PED_HALT_SPEED else 0.0
+                        snapshot[lane].append((speed, wait))
+            self._ped_snapshot = snapshot
+            self._ped_snapshot_step = sim_step
+            return snapshot
+
+        if self.env.reward_tracker is not None:
+            # Persons grouped by lane by the tracker (no scan of every person)
+            persons = ((lane, ped_id) for lane in self.ped_lanes for ped_id in self.env.reward_tracker.lane_persons(lane))
+        else:
+            persons = ((self.sumo.person.getLaneID(ped_id), ped_id) for ped_id in self.sumo.person.getIDList())
+        for lane, ped_id in persons:
+            if lane not in snapshot:
+                continue
+            speed = self.sumo.person.getSpeed(ped_id)
+            wait = self.sumo.person.getWaitingTime(ped_id) if speed < self.PED_HALT_SPEED else 0.0
+            snapshot[lane].append((speed, wait))
+
+        self._ped_snapshot = snapshot
+        self._ped_snapshot_step = sim_step
+        return snapshot
+
+    # Waiting times of the pedestrians halting on a pedestrian lane
+    def _get_halted_pedestrian_waits(self, lane: str) -> list[float]:
+        return [wait for speed, wait in self._get_pedestrian_snapshot().get(lane, ()) if speed < self.PED_HALT_SPEED]
+
+    def subscribe(self):
+        """Subscribes to the TraCI variables read by the observation, reward and max-pressure 
+        computations (see CustomSumoEnvironment.use_subscriptions).
+
+        - Variable subscriptions on every controlled lane and out-lane.
+        - Vehicle context subscriptions on every controlled lane (accumulated waiting time, speed).
+        - Person context subscriptions on the junction(s) of the pedestrian lanes.
+        """
+        lane_vars = [
+            tc.LAST_STEP_VEHICLE_NUMBER,
+            tc.LAST_STEP_VEHICLE_HALTING_NUMBER,
+            tc.LAST_STEP_LENGTH,
+            tc.LAST_STEP_VEHICLE_ID_LIST,
+        ]
+        for lane in dict.fromkeys(self.lanes + self.out_lanes):
+            self.sumo.lane.subscribe(lane, lane_vars)
+
+        vehicle_vars = [tc.VAR_LANE_ID, tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_SPEED, tc.VAR_ALLOWED_SPEED]
+        for lane in self.lanes:
+            self.sumo.lane.subscribeContext(
+                lane, tc.CMD_GET_VEHICLE_VARIABLE, self.CONTEXT_RANGE_MARGIN, vehicle_vars
+            )
+
+        # Internal lane ids follow the ":<junction id>_<index>_<lane>" SUMO convention
+        self._ped_junctions = {}
+        for lane in self.ped_lanes:
+            junction = self.sumo.lane.getEdgeID(lane)[1:].rsplit("_", 1)[0]
+            self._ped_junctions.setdefault(junction, []).append(lane)
+
+        person_vars = [tc.VAR_LANE_ID, tc.VAR_SPEED, tc.VAR_WAITING_TIME]
+        for junction, lanes in self._ped_junctions.items():
+            jx, jy = self.sumo.junction.getPosition(junction)
+            radius = max(math.hypot(x - jx, y - jy) for lane in lanes for x, y in self.sumo.lane.getShape(lane))
+            self.sumo.junction.subscribeContext(
+                junction, tc.CMD_GET_PERSON_VARIABLE, radius + self.CONTEXT_RANGE_MARGIN, person_vars
+            )
+
+    # Read a lane variable from the subscription results of the current step
+    def _get_subscribed_lane_value(self, lane: str, var: int):
+        return self.env.get_subscription_results()["lane"][lane][var]
+
+    # Vehicles on an incoming lane as {vehicle id: {var: value}} (subscriptions only)
+    def _get_subscribed_lane_vehicles(self, lane: str) -> dict:
+        context = self.env.get_subscription_results()["lane_context"].get(lane, {})
+        return {veh: values for veh, values in context.items() if values[tc.VAR_LANE_ID] == lane}
+
+    def attach_lane_state(self, lane_state: NetworkLaneState):
+        """Read the lane and pedestrian state from the shared NetworkLaneState (indexed slices
+        of its arrays) instead of querying the lanes of this signal"""
+        self._lane_state = lane_state
+        self._in_idx = np.array([lane_state.lane_index[lane] for lane in self.lanes], dtype=np.intp)
+        self._ped_idx = np.array([lane_state.ped_index[lane] for lane in self.ped_lanes], dtype=np.intp)
+        self._pressure_idx = None
+
+    def _get_lane_vehicle_number(self, lane: str) -> int:
+        if self._lane_state is not None:
+            state = self._lane_state.refresh()
+            return state.vehicle_number[state.lane_index[lane]]
+        if self.env.use_subscriptions:
+            return self._get_subscribed_lane_value(lane, tc.LAST_STEP_VEHICLE_NUMBER)
+        return self.sumo.lane.getLastStepVehicleNumber(lane)
+
+    def _get_lane_halting_number(self, lane: str) -> int:
+        if self._lane_state is not None:
+            state = self._lane_state.refresh()
+            return state.halting_number[state.lane_index[lane]]
+        if self.env.use_subscriptions:
+            return self._get_subscribed_lane_value(lane, tc.LAST_STEP_VEHICLE_HALTING_NUMBER)
+        return self.sumo.lane.getLastStepHaltingNumber(lane)
+
+    def _get_lane_vehicle_length(self, lane: str) -> float:
+        if self._lane_state is not None:
+            state = self._lane_state.refresh()
+            return state.vehicle_length[state.lane_index[lane]]
+        if self.env.use_subscriptions:
+            return self._get_subscribed_lane_value(lane, tc.LAST_STEP_LENGTH)
+        return self.sumo.lane.getLastStepLength(lane)
+
+    def _get_veh_list(self):
+        if not self.env.use_subscriptions:
+            return super()._get_veh_list()
+        veh_list = []
+        for lane in self.lanes:
+            veh_list += self._get_subscribed_lane_value(lane, tc.LAST_STEP_VEHICLE_ID_LIST)
+        return veh_list
+
+    def compile_signal_program(self):
+        """Compiles the static signal program into a phase x link incidence matrix.
+
+        `phase_link_matrix[p, k]` is 1 if controlled link k is green (g/G) in phase p of the 
+        program. The in/out lane of each link is stored as an index into `pressure_lanes`
+        (links without a vehicle out-lane point to an extra constant 0 entry) so the 
+        pressure of every green phase is a single matrix-vector product, see 
+        get_phase_pressures(). Recompiled only when the signal program changes (call it 
+        again after changing the program logic outside of _build_phases).
+        """
+        if self._program_logic is not None:
+            # Program built from the cached topology by _build_phases (no TraCI query)
+            logic, green_phase_indices = self._program_logic
+            self._program_logic = None
+        else:
+            logic = self.sumo.trafficlight.getCompleteRedYellowGreenDefinition(self.id)[0]
+            green_phase_indices = None
+        links = self._get_controlled_links()
+
+        # Index of every lane used in the pressure computation
+        lane_index = {}
+        link_ids, in_lanes, out_lanes = [], [], []
+        for i, link in enumerate(links):
+            if not link:
+                continue
+            in_lane, out_lane = link
+            link_ids.append(i)
+            in_lanes.append(lane_index.setdefault(in_lane, len(lane_index)))
+            # Pedestrian links and internal out-lanes have no downstream queue
+            if in_lane.startswith(":") or not out_lane or out_lane.startswith(":"):
+                out_lanes.append(None)
+            else:
+                out_lanes.append(lane_index.setdefault(out_lane, len(lane_index)))
+
+        self.pressure_lanes = list(lane_index.keys())
+        zero_idx = len(self.pressure_lanes)
+        self._link_in_idx = np.array(in_lanes, dtype=np.intp)
+        self._link_out_idx = np.array([zero_idx if k is None else k for k in out_lanes], dtype=np.intp)
+
+        self.phase_link_matrix = np.array(
+            [[1.0 if phase.state[i] in "gG" else 0.0 for i in link_ids] for phase in logic.phases],
+            dtype=np.float64,
+        ).reshape(len(logic.phases), len(link_ids))
+        if green_phase_indices is None:
+            green_phase_indices = self._find_green_phase_indices(logic)
+        self.green_phase_indices = green_phase_indices
+        self._green_link_matrix = self.phase_link_matrix[self.green_phase_indices]
+        self._program_compiled = True
+        self._pressure_idx = None
+
+    # (in lane, out lane) of every link index, None for unused indices
+    def _get_controlled_links(self) -> list:
+        if self._topology is not None:
+            return self._topology.links
+        return [
+            (link_list[0][0], link_list[0][1]) if link_list else None
+            for link_list in self.sumo.trafficlight.getControlledLinks(self.id)
+        ]
+
+    def _build_phases(self):
+        if self._topology is not None:
+            self._build_phases_from_topology()
+        else:
+            super()._build_phases()
+        # The program logic was (re)built, the incidence matrix is out of date
+        self._program_compiled = False
+
+    def _build_phases_from_topology(self):
+        """Same program as TrafficSignal._build_phases (green phases, then the yellow phase of
+        every transition), built from the phases of the cached topology instead of the
+        program logic queried from TraCI. The built logic is kept for compile_signal_program."""
+        topology = self._topology
+        Phase = self.sumo.trafficlight.Phase
+        if self.env.fixed_ts:
+            self.num_green_phases = len(topology.phases) // 2
+            phases = [Phase(duration, state) for state, duration in topology.phases]
+            logic = self.sumo.trafficlight.Logic(topology.program_id, 0, 0, phases=phases)
+            self._program_logic = (logic, list(topology.green_phase_indices))
+            return
+
+        self.green_phases = []
+        self.yellow_dict = {}
+        for state, _ in topology.phases:
+            if "y" not in state and (state.count("r") + state.count("s") != len(state)):
+                self.green_phases.append(Phase(60, state))
+        self.num_green_phases = len(self.green_phases)
+        self.all_phases = self.green_phases.copy()
+
+        for i, p1 in enumerate(self.green_phases):
+            for j, p2 in enumerate(self.green_phases):
+                if i == j:
+                    continue
+                yellow_state = ""
+                for s in range(len(p1.state)):
+                    if (p1.state[s] == "G" or p1.state[s] == "g") and (p2.state[s] == "r" or p2.state[s] == "s"):
+                        yellow_state += "y"
+                    else:
+                        yellow_state += p1.state[s]
+                self.yellow_dict[(i, j)] = len(self.all_phases)
+                self.all_phases.append(Phase(self.yellow_time, yellow_state))
+
+        logic = self.sumo.trafficlight.Logic(topology.program_id, 0, 0, phases=self.all_phases)
+        self.sumo.trafficlight.setProgramLogic(self.id, logic)
+        self.sumo.trafficlight.setRedYellowGreenState(self.id, self.all_phases[0].state)
+        self._program_logic = (logic, None)
+
+    # Recompile the incidence matrix if the signal program was changed
+    def _check_signal_program(self):
+        if not self._program_compiled:
+            self.compile_signal_program()
+
     # Compute the list of absolute phase indices used for green actions
-    def _get_green_phase_indices(self) -> list[int]:
-        logic = self.sumo.trafficlight.getCompleteRedYellowGreenDefinition(self.id)[0]
+    def _find_green_phase_indices(self, logic) -> list[int]:
         g = getattr(self, "green_phases", None)
         if g:
             g_list = list(g)
@@ -136,41 +460,64 @@ class CustomTrafficSignal(TrafficSignal):
                 green_idxs.append(idx)
         return green_idxs
 
+    def _get_green_phase_indices(self) -> list[int]:
+        self._check_signal_program()
+        return list(self.green_phase_indices)
+
+    # Per-link pressure of the current step (upstream value minus downstream queue)
+    def _get_link_pressures(self) -> np.ndarray:
+        if self._lane_state is not None:
+            state = self._lane_state.refresh()
+            if self._pressure_idx is None:
+                # Pressure lanes (then the 0 entry) in the shared pressure values
+                self._pressure_idx = np.array(
+                    [state.pressure_index(lane) for lane in self.pressure_lanes] + [len(state.pressure_values) - 1],
+                    dtype=np.intp,
+                )
+            values = state.pressure_values[self._pressure_idx]
+            return values[self._link_in_idx] - values[self._link_out_idx]
+
+        values = np.zeros(len(self.pressure_lanes) + 1)
+        for k, lane in enumerate(self.pressure_lanes):
+            if lane.startswith(":"):
+                # Pedestrians: count waiting + small bonus for wait time
+                waits = self._get_halted_pedestrian_waits(lane)
+                if waits:
+                    values[k] = len(waits) + 0.1 * (float(sum(waits)) / len(waits))
+            else:
+                # Vehicles: halting vehicles on the lane
+                values[k] = self._get_lane_halting_number(lane)
+        return values[self._link_in_idx] - values[self._link_out_idx]
+
     # Compute instantaneous pressure for a given absolute phase index
     def _phase_pressure(self, abs_phase_idx: int) -> float:
-        logic = self.sumo.trafficlight.getCompleteRedYellowGreenDefinition(self.id)[0]
-        state = logic.phases[abs_phase_idx].state
-        links = self.sumo.trafficlight.getControlledLinks(self.id)
+        self._check_signal_program()
+        return float(self.phase_link_matrix[abs_phase_idx] @ self._get_link_pressures())
 
-        pressure = 0.0
-        for i, link_list in enumerate(links):
-            if not link_list:
-                continue
-            ch = state[i]
-            if ch not in ("g", "G"):
-                continue
-            in_lane = link_list[0][0]
-            out_lane = link_list[0][1]
-
-            # Vehicles: upstream queue minus downstream queue
-            if not in_lane.startswith(":"):
-                up_q = float(self.sumo.lane.getLastStepHaltingNumber(in_lane))
-                down_q = 0.0
-                if out_lane and not out_lane.startswith(":"):
-                    down_q = float(self.sumo.lane.getLastStepHaltingNumber(out_lane))
-                pressure += (up_q - down_q)
-            else:
-                # Pedestrians: count waiting + small bonus for wait time
-                ped_ids = [pid for pid in self.sumo.person.getIDList()
-                           if self.sumo.person.getLaneID(pid) == in_lane and self.sumo.person.getSpeed(pid) < 0.1]
-                ped_count = float(len(ped_ids))
-                avg_wait = 0.0
-                if ped_ids:
-                    waits = [self.sumo.person.getWaitingTime(pid) for pid in ped_ids]
-                    avg_wait = float(sum(waits)) / len(waits)
-                pressure += ped_count + 0.1 * avg_wait
+    def get_phase_pressures(self) -> np.ndarray:
+        """Returns the pressure of every green phase (in action order)."""
+        self._check_signal_program()
+        return self._green_link_matrix @ self._get_link_pressures()
+
+    @property
+    def time_to_act(self) -> bool:
+        """True from the first simulation step at or after next_action_time (a coarse step
+        length can step over the exact time)"""
+        return self.next_action_time <= self.env.sim_step
 
-        return pressure
+    def update(self):
+        """Advances the phase timer by one simulation step (env.step_length seconds) and ends
+        the yellow phase once yellow_time has elapsed."""
+        self.time_since_last_phase_change += self.env.step_length
+        if self.is_yellow and self.time_since_last_phase_change >= self.yellow_time:
+            self.sumo.trafficlight.setRedYellowGreenState(self.id, self.all_phases[self.green_phase].state)
+            self.is_yellow = False
+
+    @property
+    def can_change_phase(self) -> bool:
+        """True if the action of the current decision can change the green phase (otherwise
+        set_next_phase keeps the current phase whatever the action)"""
+        return self.time_since_last_phase_change >= self.yellow_time + self.min_green
 
     # Select the green action index that maximizes pressure
     def select_max_pressure_action(self) -> int:
@@ -179,26 +526,105 @@ class CustomTrafficSignal(TrafficSignal):
         if self.time_since_last_phase_change < self.min_green:
             return self.green_phase
 
-        green_idxs = self._get_green_phase_indices()
-        best_a = self.green_phase
-        best_p = -1e18
-        for a, abs_idx in enumerate(green_idxs):
-            p = self._phase_pressure(abs_idx)
-            if p > best_p:
-                best_p = p
-                best_a = a
-        return best_a
+        pressures = self.get_phase_pressures()
+        if len(pressures) == 0:
+            return self.green_phase
+        return int(np.argmax(pressures))
+
+    def get_accumulated_waiting_time_per_lane(self) -> list[float]:
+        """Returns the accumulated waiting time per lane.
+
+        Returns:
+            List[float]: List of accumulated waiting time of each intersection lane.
+        """
+        tracker = self.env.reward_tracker
+        if tracker is not None:
+            if self.env.use_subscriptions:
+                lane_vehicles = lambda lane: (
+                    (veh, values[tc.VAR_ACCUMULATED_WAITING_TIME])
+                    for veh, values in self._get_subscribed_lane_vehicles(lane).items()
+                )
+            else:
+                lane_vehicles = lambda lane: (
+                    (veh, tracker.accumulated_waiting_time(veh))
+                    for veh in self.sumo.lane.getLastStepVehicleIDs(lane)
+                )
+            return [tracker.lane_waiting_time(lane, lane_vehicles(lane)) for lane in self.lanes]
+        if not self.env.use_subscriptions:
+            return super().get_accumulated_waiting_time_per_lane()
+
+        wait_time_per_lane = []
+        for lane in self.lanes:
+            wait_time = 0.0
+            for veh, values in self._get_subscribed_lane_vehicles(lane).items():
+                acc = values[tc.VAR_ACCUMULATED_WAITING_TIME]
+                if veh not in self.env.vehicles:
+                    self.env.vehicles[veh] = {lane: acc}
+                else:
+                    self.env.vehicles[veh][lane] = acc - sum(
+                        [self.env.vehicles[veh][other] for other in self.env.vehicles[veh].keys() if other != lane]
+                    )
+                wait_time += self.env.vehicles[veh][lane]
+            wait_time_per_lane.append(wait_time)
+        return wait_time_per_lane
+
+    def get_average_speed(self) -> float:
+        """Returns the average speed normalized by the maximum allowed speed of the vehicles in the intersection.
+
+        Obs: If there are no vehicles in the intersection, it returns 1.0.
+        """
+        if not self.env.use_subscriptions:
+            return super().get_average_speed()
+
+        speeds = [
+            values[tc.VAR_SPEED] / values[tc.VAR_ALLOWED_SPEED]
+            for lane in self.lanes
+            for values in self._get_subscribed_lane_vehicles(lane).values()
+        ]
+        if len(speeds) == 0:
+            return 1.0
+        return sum(speeds) / len(speeds)
+
+    def get_pressure(self):
+        """Returns the pressure (#veh leaving - #veh approaching) of the intersection."""
+        return sum(self._get_lane_vehicle_number(lane) for lane in self.out_lanes) - sum(
+            self._get_lane_vehicle_number(lane) for lane in self.lanes
+        )
+
+    def get_out_lanes_density(self) -> list[float]:
+        """Returns the density of the vehicles in the outgoing lanes of the intersection."""
+        lanes_density = [
+            self._get_lane_vehicle_number(lane)
+            / (self.lanes_length[lane] / (self.MIN_GAP + self._get_lane_vehicle_length(lane)))
+            for lane in self.out_lanes
+        ]
+        return [min(1, density) for density in lanes_density]
+
+    def get_lanes_density(self) -> list[float]:
+        """Returns the density [0,1] of the vehicles in the incoming lanes of the intersection."""
+        lanes_density = [
+            self._get_lane_vehicle_number(lane)
+            / (self.lanes_length[lane] / (self.MIN_GAP + self._get_lane_vehicle_length(lane)))
+            for lane in self.lanes
+        ]
+        return [min(1, density) for density in lanes_density]
+
+    def get_lanes_queue(self) -> list[float]:
+        """Returns the queue [0,1] of the vehicles in the incoming lanes of the intersection."""
+        lanes_queue = [
+            self._get_lane_halting_number(lane)
+            / (self.lanes_length[lane] / (self.MIN_GAP + self._get_lane_vehicle_length(lane)))
+            for lane in self.lanes
+        ]
+        return [min(1, queue) for queue in lanes_queue]
 
     def get_pedestrian_density(self) -> list[float]:
         """Returns the density [0,1] of pedestrians in incoming pedestrian lanes."""
+        snapshot = self._get_pedestrian_snapshot()
         densities = []
         for lane in self.ped_lanes:
-            # Count pedestrians on this lane
-            ped_on_lane = sum(
-                1 for ped_id in self.sumo.person.getIDList() if self.sumo.person.getLaneID(ped_id) == lane
-            )
             # Compute density relative to lane length
-            density = ped_on_lane / max(1, self.lanes_length[lane] / self.MIN_PED_GAP)
+            density = len(snapshot[lane]) / max(1, self.lanes_length[lane] / self.MIN_PED_GAP)
             densities.append(min(1, density))
         return densities
 
@@ -206,30 +632,55 @@ class CustomTrafficSignal(TrafficSignal):
         """Returns the queue [0,1] of pedestrians in incoming pedestrian lanes."""
         queues = []
         for lane in self.ped_lanes:
-            ped_on_lane = sum(
-                1 for ped_id in self.sumo.person.getIDList()
-                if self.sumo.person.getLaneID(ped_id) == lane and self.sumo.person.getSpeed(ped_id) < 0.1
-            )
+            ped_on_lane = len(self._get_halted_pedestrian_waits(lane))
             queue = ped_on_lane / max(1, self.lanes_length[lane] / self.MIN_PED_GAP)
             queues.append(min(1, queue))
         return queues
 
+    def write_lanes_density_queue(self, density_out: np.ndarray, queue_out: np.ndarray):
+        """Writes the density and queue [0,1] of the incoming vehicle lanes in place 
+        (same values as get_lanes_density/get_lanes_queue, without temporary lists)."""
+        if self._lane_state is not None:
+            state = self._lane_state.refresh()
+            idx = self._in_idx
+            capacity = state.lane_length[idx] / (self.MIN_GAP + state.vehicle_length[idx])
+            np.minimum(1, state.vehicle_number[idx] / capacity, out=density_out)
+            np.minimum(1, state.halting_number[idx] / capacity, out=queue_out)
+            return
+        for k, lane in enumerate(self.lanes):
+            capacity = self.lanes_length[lane] / (self.MIN_GAP + self._get_lane_vehicle_length(lane))
+            density_out[k] = min(1, self._get_lane_vehicle_number(lane) / capacity)
+            queue_out[k] = min(1, self._get_lane_halting_number(lane) / capacity)
+
+    def write_pedestrian_density_queue(self, density_out: np.ndarray, queue_out: np.ndarray):
+        """Writes the density and queue [0,1] of the pedestrian lanes in place (same values 
+        as get_pedestrian_density/get_pedestrian_queue, without temporary lists)."""
+        if self._lane_state is not None:
+            state = self._lane_state.refresh()
+            idx = self._ped_idx
+            capacity = np.maximum(1, state.ped_lane_length[idx] / self.MIN_PED_GAP)
+            np.minimum(1, state.ped_number[idx] / capacity, out=density_out)
+            np.minimum(1, state.ped_halting[idx] / capacity, out=queue_out)
+            return
+        snapshot = self._get_pedestrian_snapshot()
+        for k, lane in enumerate(self.ped_lanes):
+            capacity = max(1, self.lanes_length[lane] / self.MIN_PED_GAP)
+            peds = snapshot[lane]
+            halted = sum(1 for speed, _ in peds if speed < self.PED_HALT_SPEED)
+            density_out[k] = min(1, len(peds) / capacity)
+            queue_out[k] = min(1, halted / capacity)
+
     def get_total_pedestrian_queued(self) -> int:
         """Returns the total number of pedestrians waiting to cross."""
-        return sum(
-            1 for lane in self.ped_lanes
-            for ped_id in self.sumo.person.getIDList()
-            if self.sumo.person.getLaneID(ped_id) == lane and self.sumo.person.getSpeed(ped_id) < 0.1
-        )
+        return sum(len(self._get_halted_pedestrian_waits(lane)) for lane in self.ped_lanes)
 
     def get_total_queued(self) -> int:
         """Returns the total number of vehicles and pedestrians halting in the intersection."""
-        total_vehicles = super().get_total_queued()  # sums over self.lanes (vehicles)
-        total_peds = sum(
-            1 for lane in self.ped_lanes
-            for ped_id in self.sumo.person.getIDList()
-            if self.sumo.person.getLaneID(ped_id) == lane and self.sumo.person.getSpeed(ped_id) < 0.1
-        )
+        if self._lane_state is not None:
+            state = self._lane_state.refresh()
+            return int(state.halting_number[self._in_idx].sum() + state.ped_halting[self._ped_idx].sum())
+        total_vehicles = sum(self._get_lane_halting_number(lane) for lane in self.lanes)
+        total_peds = self.get_total_pedestrian_queued()
         return total_vehicles + total_peds
 
 
@@ -237,11 +688,311 @@ class CustomSumoEnvironment(SumoEnvironment):
     """
     Custom version of the SumoEnvironment which overrides the _start_simulation() method
     to allow for arbitrary number of pedestrians and vehicles to spawn in the simulation
-    by adding a sleep(delay) before the simulation variables are accessed by the code.
-    This fix gives reasonable time for the simulation to initialize and prevents
-    crashes.
+    by waiting for the GUI to be ready (up to START_SIMULATION_DELAY) before the 
+    simulation variables are accessed by the code. This fix gives reasonable time for 
+    the simulation to initialize and prevents crashes.
+
+    With `reset_mode="snapshot"`, SUMO is only launched on the first reset: the state of 
+    the simulation (with the persons and the random number generators) is saved after 
+    each warm-up time of `snapshot_warmup_times` and the following resets cycle through 
+    these snapshots, reloading the simulation from the state on the same connection 
+    instead of relaunching the simulator. The warm-up runs under the max-pressure
+    controller (the program of the net with fixed_ts) and the phase and reward state of
+    the signals is saved with each snapshot, so an episode reloaded at a warm-up time
+    continues a relaunched run driven by max-pressure until that time.
+
+    With `use_subscriptions=True`, the lane, vehicle and pedestrian state of every 
+    CustomTrafficSignal is delivered through TraCI subscriptions and fetched once per 
+    simulation step instead of with individual getter calls (one round trip each).
+
+    With `profile_traci=True`, the TraCI connection is wrapped in an InstrumentedConnection
+    and a report of the TraCI calls made during the steps (calls and share of the step
+    time per method and caller) is printed at the end of every episode.
+
+    With `record_traci=<path>`, every TraCI request/response of the episodes is recorded
+    and saved to a trace file. With `replay_traci=<path>`, SUMO is not launched (not even
+    to find the traffic signals) and the requests are answered from the recorded episodes
+    (see traci_trace.py), the recorded actions of the current episode are in `replay_actions`.
+
+    With `incremental_reward=True`, the reward features (per-lane waiting times, halting
+    vehicles and pedestrians) are maintained by a RewardTracker that follows the departed
+    and arrived objects instead of querying every object on every lane at every step.
+
+    With `macro_step=True` (single agent), a step fast-forwards through the following
+    decisions where no action can change the phase (yellow or minimum green): the current
+    phase is kept, the reward of every skipped decision is discounted by `macro_gamma`
+    per delta_time of simulated time elapsed since the step started, and
+    `info["macro_intervals"]` (decisions covered) and `info["macro_discount"]`
+    (macro_gamma ** (elapsed seconds / delta_time), to bootstrap the next value) describe
+    the elapsed time. The metrics of every skipped decision are still recorded.
+
+    With `shared_lane_state=True`, the traffic signals read their lanes and pedestrians
+    from a NetworkLaneState refreshed once per simulation step for the whole network
+    (every lane read once, even if it is shared by two signals), see lane_state.py.
+
+    With `cached_topology=True`, the controlled links, lane lengths and signal programs are
+    compiled once per net file into a cache (see topology_cache.py) and the traffic signals
+    of every simulation are built from it instead of TraCI queries.
+
+    With `fidelity` (see FIDELITY_LEVELS), the simulation runs with a coarser step length
+    for cheaper episodes (e.g. pretraining, see fidelity_schedule.py). The observation and
+    action spaces are the same at every level, the phase timers count simulated seconds
+    and a decision happens at the first step at or after its time.
     """
 
+    def __init__(
+        self,
+        *args,
+        use_subscriptions: bool = False,
+        observation_views: bool = False,
+        reset_mode: str = "relaunch",
+        snapshot_warmup_times: list[int] = (0,),
+        profile_traci: bool = False,
+        record_traci: Optional[str] = None,
+        replay_traci: Optional[str] = None,
+        incremental_reward: bool = False,
+        macro_step: bool = False,
+        macro_gamma: float = 0.99,
+        shared_lane_state: bool = False,
+        cached_topology: bool = False,
+        fidelity: str = "full",
+        **kwargs,
+    ):
+        """Initializes the environment (see SumoEnvironment for the other arguments).
+
+        Args:
+            use_subscriptions (bool): If True, read the traffic signals state from TraCI 
+                variable/context subscriptions (see CustomTrafficSignal.subscribe).
+            observation_views (bool): If True, observations are read-only views of the 
+                preallocated observation arrays (no copy per step). They are overwritten
+                at the next step, copy them if they need to be kept.
+            reset_mode (str): "relaunch" (restart SUMO on every reset) or "snapshot" 
+                (restore a saved simulation state, see RESET_MODES).
+            snapshot_warmup_times (list[int]): Simulated seconds after begin_time at which 
+                a snapshot is taken, e.g. [0, 600, 1200] for increasingly loaded states
+                (the signals are controlled by max-pressure until then).
+            profile_traci (bool): If True, profile the TraCI calls of every episode (see
+                traci_profiler.py), the last report is kept in `traci_report`.
+            record_traci (str): Trace file where the TraCI calls of the episodes are saved.
+            replay_traci (str): Trace file of recorded episodes to replay instead of running
+                SUMO (traces recorded before the traffic signal ids were part of the trace
+                still load the network once to find them).
+            incremental_reward (bool): If True, track the reward features incrementally
+                (see reward_tracker.py), the reward values are unchanged.
+            macro_step (bool): If True, skip the decisions where no action can change the
+                phase (single agent only, not with fixed_ts).
+            macro_gamma (float): Discount per delta_time seconds of the rewards accumulated by a
+                macro step.
+            shared_lane_state (bool): If True, share a network-wide lane state between the
+                traffic signals (see lane_state.py).
+            cached_topology (bool): If True, build the traffic signals from the compiled
+                topology of the net file (see topology_cache.py).
+            fidelity (str): Simulation fidelity level, a key of FIDELITY_LEVELS.
+        """
+        assert reset_mode in RESET_MODES, f"Invalid reset mode {reset_mode}, expected one of {RESET_MODES}."
+        assert reset_mode == "relaunch" or (record_traci is None and replay_traci is None), \
+            "TraCI record and replay require the relaunch reset mode."
+        assert record_traci is None or replay_traci is None, "Cannot record and replay TraCI at the same time."
+        assert fidelity in FIDELITY_LEVELS, f"Invalid fidelity {fidelity}, expected one of {list(FIDELITY_LEVELS)}."
+        self.use_subscriptions = use_subscriptions
+        self.observation_views = observation_views
+        self.reset_mode = reset_mode
+        self.snapshot_warmup_times = sorted(snapshot_warmup_times)
+        self._subscription_results = None
+        self._snapshot_dir = None
+        self._snapshots = []
+        self._next_snapshot = 0
+        self._sumo_cmd = None
+        self._snapshot_seed = None
+        self.traci_profiler = TraCIProfiler() if profile_traci else None
+        self.traci_report = None
+        self.record_traci = record_traci
+        self._trace_recorder = None
+        self._recorded_episodes = []
+        self._replay_episodes = load_trace(replay_traci) if replay_traci is not None else None
+        self._next_replay = 0
+        self.replay_actions = None
+        self.reward_tracker = RewardTracker(self) if incremental_reward else None
+        self.macro_step = macro_step
+        self.macro_gamma = macro_gamma
+        self.shared_lane_state = shared_lane_state
+        self.lane_state = None
+        self.fidelity = fidelity
+        self.step_length = FIDELITY_LEVELS[fidelity]
+        if cached_topology:
+            net_file = kwargs["net_file"] if "net_file" in kwargs else args[0]
+            self.topology = load_topology(net_file)
+        else:
+            self.topology = None
+        if self._replay_episodes is not None and ReplayInit.supports(self._replay_episodes[0]):
+            # The init connection (traffic signal ids and topology) answers from the trace
+            init_traci = sumo_rl_env.traci
+            sumo_rl_env.traci = ReplayInit(self._replay_episodes[0])
+            try:
+                super().__init__(*args, **kwargs)
+            finally:
+                sumo_rl_env.traci = init_traci
+        else:
+            super().__init__(*args, **kwargs)
+        self.episode_seconds = self.sim_max_time - self.begin_time
+        assert not macro_step or self.single_agent, "Macro steps require a single agent."
+        assert not (macro_step and self.fixed_ts), "Macro steps require agent-controlled signals (no fixed_ts)."
+        assert self.step_length == 1 or not self.fixed_ts, "Fixed-time signals require a 1 second step length."
+
+    def step(self, action: Union[dict, int]):
+        """Apply the action(s) and simulate until the next decision (profiled if enabled)"""
+        if self._trace_recorder is not None:
+            self._trace_recorder.actions.append(action)
+        step = self._macro_step if self.macro_step else super().step
+        if self.traci_profiler is None:
+            return step(action)
+        with self.traci_profiler.step():
+            return step(action)
+
+    def _macro_step(self, action: int):
+        """Apply the action, then simulate until a decision where the phase can change (or the
+        end of the episode), accumulating the discounted rewards of the skipped decisions"""
+        start_time = self.sim_step
+        if action is None or action == {}:
+            # No action: one decision interval without changing the signal, as SumoEnvironment.step
+            observation, reward, terminated, truncated, info = super().step(action)
+            info["macro_intervals"] = 1
+            info["macro_discount"] = self.macro_gamma ** ((self.sim_step - start_time) / self.delta_time)
+            return observation, reward, terminated, truncated, info
+
+        ts_id = self.ts_ids[0]
+        ts = self.traffic_signals[ts_id]
+        self._apply_actions(action)
+        self._run_steps()
+
+        reward = 0.0
+        discount = 1.0
+        intervals = 1
+        while True:
+            reward += discount * self._compute_rewards()[ts_id]
+            truncated = self._compute_dones()["__all__"]
+            if truncated or ts.can_change_phase:
+                break
+            # Any action keeps the current phase: skip the decision (metrics still recorded),
+            # the decision intervals vary with the step length so discount the elapsed time
+            self._compute_info()
+            discount = self.macro_gamma ** ((self.sim_step - start_time) / self.delta_time)
+            self._apply_actions(ts.green_phase)
+            self._run_steps()
+            intervals += 1
+
+        observation = self._compute_observations()[ts_id]
+        info = self._compute_info()
+        info["macro_intervals"] = intervals
+        info["macro_discount"] = self.macro_gamma ** ((self.sim_step - start_time) / self.delta_time)
+        return observation, reward, False, truncated, info
+
+    def _report_traci_profile(self):
+        """Print the TraCI profile of the episode that ended and start a new one"""
+        if self.traci_profiler is not None and self.traci_profiler.steps > 0:
+            self.traci_report = self.traci_profiler.report()
+            print(self.traci_report)
+            self.traci_profiler.reset()
+
+    def _save_traci_trace(self):
+        """Add the recorded episode to the trace file"""
+        if self._trace_recorder is not None:
+            self._recorded_episodes.append(self._trace_recorder.episode())
+            save_trace(self.record_traci, self._recorded_episodes)
+            self._trace_recorder = None
+
+    def reset(self, seed: Optional[int] = None, **kwargs):
+        """Reset the environment.
+
+        In "snapshot" mode, SUMO is (re)launched only for the first episode or a new seed 
+        (given or set in sumo_seed), then the next saved simulation state of the pool is 
+        loaded."""
+        self._report_traci_profile()
+        if self.reset_mode == "relaunch":
+            return super().reset(seed=seed, **kwargs)
+
+        if self.sumo is None or (self.sumo_seed if seed is None else seed) != self._snapshot_seed:
+            # Launch the simulator once and take the pool of snapshots
+            super().reset(seed=seed, **kwargs)
+            self._take_snapshots()
+            self._snapshot_seed = self.sumo_seed
+        else:
+            gym.Env.reset(self, seed=seed, **kwargs)
+            self.save_csv(self.out_csv_name, self.episode)
+            self.episode += 1
+            self.metrics = []
+
+        snapshot_time, path, signal_states, vehicles = self._snapshots[self._next_snapshot]
+        self._next_snapshot = (self._next_snapshot + 1) % len(self._snapshots)
+        # Reload the simulation from the state (simulation.loadState does not restore the
+        # random number generators consistently: the flows of a reloaded state stop inserting)
+        self.sumo.load(self._sumo_cmd[1:] + ["--load-state", path])
+        # traci.load keeps the subscription results of the client (only a simulation step
+        # clears them): the first observation would read objects of the previous episode
+        for results in getattr(self.sumo, "_subscriptionMapping", {}).values():
+            results.reset()
+        self.sim_max_time = snapshot_time + self.episode_seconds
+
+        # Restart the traffic signals from their state at the time of the snapshot
+        self._subscription_results = None
+        for ts_id, ts in self.traffic_signals.items():
+            ts.reset_state(snapshot_time, signal_states[ts_id])
+            if self.use_subscriptions:
+                ts.subscribe()
+        self.vehicles = {veh: dict(lanes) for veh, lanes in vehicles.items()}
+        if self.reward_tracker is not None:
+            self.reward_tracker.reset()
+        if self.lane_state is not None:
+            self.lane_state.invalidate()
+
+        if self.single_agent:
+            return self._compute_observations()[self.ts_ids[0]], self._compute_info()
+        else:
+            return self._compute_observations()
+
+    def _take_snapshots(self):
+        """Advance the simulation to every warm-up time and save its state (with the state of
+        the traffic signals and of the per-vehicle waiting times)"""
+        if self._snapshot_dir is None:
+            self._snapshot_dir = tempfile.mkdtemp(prefix="sumo_snapshots_")
+        self._snapshots = []
+        self._next_snapshot = 0
+        for warmup in self.snapshot_warmup_times:
+            self._warm_up(self.begin_time + warmup)
+            path = os.path.join(self._snapshot_dir, f"state_{self.label}_{self.sim_step}.xml.gz")
+            self.sumo.simulation.saveState(path)
+            signal_states = {ts_id: ts.save_state() for ts_id, ts in self.traffic_signals.items()}
+            vehicles = {veh: dict(lanes) for veh, lanes in self.vehicles.items()}
+            self._snapshots.append((self.sim_step, path, signal_states, vehicles))
+
+    def _warm_up(self, until: float):
+        """Simulate until the given time as the steps of an episode driven by max-pressure
+        (without observations or metrics); the signals keep cycling, a bare simulationStep
+        would leave them in the phase set at the reset"""
+        while self.sim_step < until:
+            if self.fixed_ts:
+                self._sumo_step()
+                continue
+            actions = {ts_id: ts.select_max_pressure_action() for ts_id, ts in self.traffic_signals.items()}
+            self._apply_actions(actions[self.ts_ids[0]] if self.single_agent else actions)
+            self._run_steps()
+            # Rewards update the waiting time state that the rewards after the snapshot use
+            self._compute_rewards()
+
+    def close(self):
+        """Close the environment and remove the saved snapshots."""
+        self._report_traci_profile()
+        self._save_traci_trace()
+        if self._replay_episodes is not None:
+            # No simulator to close
+            self.sumo = None
+        else:
+            super().close()
+        if self._snapshot_dir is not None:
+            shutil.rmtree(self._snapshot_dir, ignore_errors=True)
+            self._snapshot_dir = None
+        self._snapshots = []
+
     def _build_traffic_signals(self, conn):
         """Build CustomTrafficSignal objects that also keep track of pedestrians"""
         if not isinstance(self.reward_fn, dict):
@@ -264,10 +1015,70 @@ class CustomSumoEnvironment(SumoEnvironment):
             for ts in self.ts_ids
         }
 
+        # Only subscribe on the simulation connection (not the init connection)
+        self._subscription_results = None
+        if self.use_subscriptions and self.sumo is not None:
+            for ts in self.traffic_signals.values():
+                ts.subscribe()
+        if self.reward_tracker is not None and self.sumo is not None:
+            self.reward_tracker.reset()
+        if self.shared_lane_state and self.sumo is not None:
+            self.lane_state = NetworkLaneState(self, list(self.traffic_signals.values()))
+            for ts in self.traffic_signals.values():
+                ts.attach_lane_state(self.lane_state)
+
+    def get_subscription_results(self) -> dict:
+        """Returns the subscription results of the current simulation step, fetched once 
+        per step for the lane, lane context and junction context domains."""
+        if self._subscription_results is None:
+            self._subscription_results = {
+                "lane": self.sumo.lane.getAllSubscriptionResults(),
+                "lane_context": self.sumo.lane.getAllContextSubscriptionResults(),
+                "junction_context": self.sumo.junction.getAllContextSubscriptionResults(),
+            }
+        return self._subscription_results
+
+    def _compute_observations(self):
+        if not self.observation_views:
+            return super()._compute_observations()
+
+        # Hand out the read-only observation views without copying them
+        self.observations.update(
+            {
+                ts: self.traffic_signals[ts].compute_observation()
+                for ts in self.ts_ids
+                if self.traffic_signals[ts].time_to_act or self.fixed_ts
+            }
+        )
+        return {
+            ts: self.observations[ts]
+            for ts in self.observations.keys()
+            if self.traffic_signals[ts].time_to_act or self.fixed_ts
+        }
+
+    def _sumo_step(self):
+        super()._sumo_step()
+        # Subscription results are refreshed by the simulation step
+        self._subscription_results = None
+        if self.reward_tracker is not None:
+            self.reward_tracker.on_sim_step()
+        if self.lane_state is not None:
+            self.lane_state.invalidate()
+
     def _start_simulation(self):
         """This method starts the simulation GUI but properly waits before setting 
         traci.gui.DEFAULT_VIEW for the simulation to have fully initialized 
         (added a sleep(delay)). This prevents a crash when too many sim objects."""
+        if self._replay_episodes is not None:
+            # Replay the next recorded episode instead of launching SUMO
+            episode = self._replay_episodes[self._next_replay]
+            self._next_replay = (self._next_replay + 1) % len(self._replay_episodes)
+            self.sumo = ReplayConnection(episode)
+            self.replay_actions = episode["actions"]
+            if self.traci_profiler is not None:
+                self.sumo = InstrumentedConnection(self.sumo, self.traci_profiler)
+            return
+
         sumo_cmd = [
             self._sumo_binary,
             "-n",
@@ -289,6 +1100,15 @@ class CustomSumoEnvironment(SumoEnvironment):
             sumo_cmd.extend(["--seed", str(self.sumo_seed)])
         if not self.sumo_warnings:
             sumo_cmd.append("--no-warnings")
+        if self.step_length != 1:
+            sumo_cmd.extend(["--step-length", str(self.step_length)])
+        if self.reset_mode == "snapshot":
+            # Save the persons (pedestrians), the random number generators and the positions
+            # and speeds at full precision (2 digits by default) in the snapshots, so that a
+            # reloaded episode follows the relaunched one
+            sumo_cmd.extend(
+                ["--save-state.transportables", "true", "--save-state.rng", "true", "--save-state.precision", "17"]
+            )
         if self.additional_sumo_cmd is not None:
             sumo_cmd.extend(self.additional_sumo_cmd.split())
         if self.use_gui or self.render_mode is not None:
@@ -307,6 +1127,8 @@ class CustomSumoEnvironment(SumoEnvironment):
                 self.disp.start()
                 print("Virtual display started.")
 
+        # Command of the simulation, reloaded from a saved state in snapshot mode
+        self._sumo_cmd = sumo_cmd
         if LIBSUMO:
             traci.start(sumo_cmd)
             self.sumo = traci
@@ -314,70 +1136,116 @@ class CustomSumoEnvironment(SumoEnvironment):
             traci.start(sumo_cmd, label=self.label)
             self.sumo = traci.getConnection(self.label)
 
+        if self.record_traci is not None:
+            self._trace_recorder = TraceRecorder(self.sumo)
+            # Recorded for the replays to find the traffic signals without SUMO
+            self._trace_recorder.trafficlight.getIDList()
+            self.sumo = self._trace_recorder
+        if self.traci_profiler is not None:
+            self.sumo = InstrumentedConnection(self.sumo, self.traci_profiler)
+
         if self.use_gui or self.render_mode is not None:
 
-            # Add a delay to start the simulation so the objects are loaded in memory
-            time.sleep(START_SIMULATION_DELAY)
             try:
                 if "DEFAULT_VIEW" not in dir(
                     traci.gui
                 ):  # traci.gui.DEFAULT_VIEW is not defined in libsumo
                     traci.gui.DEFAULT_VIEW = "View #0"
+                # Wait for the view to exist so the objects are loaded in memory
+                self._wait_until_ready(traci.gui.DEFAULT_VIEW)
                 self.sumo.gui.setSchema(traci.gui.DEFAULT_VIEW, "real world")
             except Exception as e:
                 print(f"Warning: could not set GUI schema: {e}")
 
 
+    def _wait_until_ready(self, view: str):
+        """Readiness probe of the GUI simulation: poll until the view exists, at most for 
+        START_SIMULATION_DELAY seconds."""
+        deadline = time.perf_counter() + START_SIMULATION_DELAY
+        while time.perf_counter() < deadline:
+            try:
+                if view in self.sumo.gui.getIDList():
+                    return
+            except traci.exceptions.TraCIException:
+                pass
+            time.sleep(READY_POLL_INTERVAL)
+
+
 class CustomObservationFunction(ObservationFunction):
     """
     Custom observation function that includes both vehicles and pedestrians.
     Includes: phase ID, min green flag, current time, vehicle queue, and pedestrian queue.
+
+    Every segment is written in place into an array preallocated by observation_space(),
+    whose `layout` gives the slice of each segment in the observation. If the env was 
+    created with `observation_views=True`, a read-only view of that array is returned 
+    instead of a copy: it is overwritten by the next observation, so copy it to keep it.
     """
 
     def __init__(self, ts: CustomTrafficSignal):
         """Initialize custom observation function."""
         super().__init__(ts)
+        self.layout = {}
+        self._buffer = None
+        self._readonly_view = None
 
     def __call__(self) -> np.ndarray:
         """Return the observation including pedestrians."""
+        obs = self._buffer
+        layout = self.layout
+
         # Current traffic signal phase (one-hot encoded)
-        phase_id = [1 if self.ts.green_phase == i else 0 for i in range(self.ts.num_green_phases)]
+        phase_id = obs[layout["phase_id"]]
+        phase_id.fill(0)
+        phase_id[self.ts.green_phase] = 1
         
         # Whether minimum green time has elapsed
-        min_green = [0 if self.ts.time_since_last_phase_change < self.ts.min_green + self.ts.yellow_time else 1]
+        obs[layout["min_green"]] = 0 if self.ts.time_since_last_phase_change < self.ts.min_green + self.ts.yellow_time else 1
         
         # Current simulation time (normalized to [0,1] for 1 hour episode)
-        current_time = [self.ts.env.sim_step / 3600.0]
+        obs[layout["current_time"]] = self.ts.env.sim_step / 3600.0
 
         # Vehicle lanes: density and queue
-        vehicle_density = self.ts.get_lanes_density()
-        vehicle_queue = self.ts.get_lanes_queue()
+        self.ts.write_lanes_density_queue(obs[layout["vehicle_density"]], obs[layout["vehicle_queue"]])
 
         # Pedestrian lanes: density and queue
-        ped_density = self.ts.get_pedestrian_density()
-        ped_queue = self.ts.get_pedestrian_queue()
-
-        observation = np.array(
-            phase_id + min_green + current_time + 
-            vehicle_density + vehicle_queue + 
-            ped_density + ped_queue, 
-            dtype=np.float32
-        )
-        return observation
+        self.ts.write_pedestrian_density_queue(obs[layout["ped_density"]], obs[layout["ped_queue"]])
+
+        if self.ts.env.observation_views:
+            return self._readonly_view
+        return obs.copy()
 
     def observation_space(self) -> spaces.Box:
-        """Return the observation space."""
+        """Return the observation space (and compute the layout of the observation)."""
         total_vehicle_lanes = len(self.ts.lanes)
         total_ped_lanes = len(self.ts.ped_lanes)
 
         # phase_id + min_green + current_time + 2*(vehicles) + 2*(pedestrians)
-        obs_len = self.ts.num_green_phases + 1 + 1 + 2 * (total_vehicle_lanes + total_ped_lanes)
+        segments = [
+            ("phase_id", self.ts.num_green_phases),
+            ("min_green", 1),
+            ("current_time", 1),
+            ("vehicle_density", total_vehicle_lanes),
+            ("vehicle_queue", total_vehicle_lanes),
+            ("ped_density", total_ped_lanes),
+            ("ped_queue", total_ped_lanes),
+        ]
+        self.layout = {}
+        offset = 0
+        for name, size in segments:
+            self.layout[name] = slice(offset, offset + size)
+            offset += size
+        obs_len = offset
+
+        # Preallocated observation (and its read-only view handed out with observation_views)
+        self._buffer = np.zeros(obs_len, dtype=np.float32)
+        self._readonly_view = self._buffer.view()
+        self._readonly_view.flags.writeable = False
 
         return spaces.Box(low=np.zeros(obs_len, dtype=np.float32),
                         high=np.ones(obs_len, dtype=np.float32) * 1000)  # Allow values > 1 for time
 
 
-
 def custom_reward_fn(ts: CustomTrafficSignal):
     """
     Custom reward function that penalizes waiting time and queue length
@@ -417,3 +1285,17 @@ register(
         "observation_class": CustomObservationFunction,  # NEED TO IMPLEMENT ABOVE
     },
 )
+
+"""Register the multi-agent version (net_file and route_file to be given, e.g. by
+grid_scenario.make_grid_env), every traffic signal reads the shared lane state"""
+register(
+    id=GRID_ENV_ID,
+    entry_point="custom_env:CustomSumoEnvironment",
+    disable_env_checker=True,
+    kwargs={
+        "single_agent": False,
+        "reward_fn": custom_reward_fn,
+        "observation_class": CustomObservationFunction,
+        "shared_lane_state": True,
+    },
+)
@@ -0,0 +1,220 @@
+"""-------------------------------------------------------------------------------------
+File: demand_generator.py
+Description: Parametric vehicle and pedestrian demand for the existing networks. The
+fringe edges of a net (edges without predecessor/successor) are the origins and
+destinations, every origin emits Poisson arrivals at the configured rate scaled by a
+demand multiplier and a time-of-day profile, and the destination is drawn from the
+turning ratios (straight/left/right of the entry heading). The trips are streamed to the
+route file in departure order, one chunk of simulated time at a time, so millions of
+trips never build an XML tree in memory (a .gz route file is written compressed).
+Run `python demand_generator.py --multiplier 2` for the demo intersection.
+-------------------------------------------------------------------------------------"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+import sumolib
+
+from custom_env import NET_FILE_PATH
+
+# Folder of the generated route files
+DEMAND_ROOT = Path("demand-scenarios")
+
+# Demand parameters (multiplier 1 is the demand of demo-intersection.rou.xml)
+DEMAND_CONFIG = {
+    "vehicle_rate": 864.0,  # vehicles/h per origin edge
+    "pedestrian_rate": 540.0,  # persons/h per origin edge
+    "turn_ratios": {"straight": 1 / 3, "left": 1 / 3, "right": 1 / 3},
+    "profile": "flat",  # key of DEMAND_PROFILES
+    "end_time": 3600,  # s of generated demand
+    "seed": 42,
+}
+
+# Time-of-day profiles: (fraction of end_time, rate factor) knots, linearly interpolated
+DEMAND_PROFILES = {
+    "flat": [(0.0, 1.0), (1.0, 1.0)],
+    "peak": [(0.0, 0.5), (0.5, 1.5), (1.0, 0.5)],
+    "double-peak": [(0.0, 0.4), (0.25, 1.6), (0.5, 0.6), (0.75, 1.6), (1.0, 0.4)],
+    "ramp": [(0.0, 0.25), (1.0, 1.75)],
+}
+
+# Simulated seconds generated (and written) at once
+DEMAND_CHUNK_SECONDS = 600
+
+# Types of the generated trips (same as demo-intersection.rou.xml)
+VEHICLE_TYPE = '<vType id="car" accel="2.0" decel="4.5" length="5" maxSpeed="50" sigma="0.5" vClass="passenger"/>'
+PEDESTRIAN_TYPE = '<vType id="pedestrian" vClass="pedestrian" width="0.5" length="0.3" desiredMaxSpeed="1.3"/>'
+
+
+def _heading(edge) -> float:
+    # Direction (degrees) of an edge from its start node to its end node
+    (x1, y1), (x2, y2) = edge.getFromNode().getCoord(), edge.getToNode().getCoord()
+    return math.degrees(math.atan2(y2 - y1, x2 - x1))
+
+
+def _turn(from_edge, to_edge) -> str:
+    """Turn from the heading of an origin edge to the heading of a destination edge"""
+    angle = (_heading(to_edge) - _heading(from_edge) + 180.0) % 360.0 - 180.0
+    if abs(angle) <= 45.0:
+        return "straight"
+    if abs(angle) >= 135.0:
+        return "uturn"
+    return "left" if angle > 0 else "right"
+
+
+def fringe_od(net, vclass: str, turn_ratios: dict) -> tuple:
+    """Origins, destinations and destination probabilities of a vehicle class.
+
+    Returns:
+        (origins, destinations, probabilities): edge ids and an origins x destinations
+        matrix, the turn ratios being split equally between the destinations of a turn
+        (renormalized over the turns available from the origin, no u-turns). Vehicle
+        destinations must be reachable through the connections of the net (pedestrians
+        walk in both directions and cross on the crossings, SUMO routes them).
+    """
+    edges = [edge for edge in net.getEdges() if edge.allows(vclass)]
+    origins = [edge for edge in edges if not edge.getIncoming()]
+    destinations = [edge for edge in edges if not edge.getOutgoing()]
+
+    probabilities = np.zeros((len(origins), len(destinations)))
+    for i, origin in enumerate(origins):
+        turns = {}
+        for j, destination in enumerate(destinations):
+            turn = _turn(origin, destination)
+            if turn not in turn_ratios or destination.getToNode() == origin.getFromNode():
+                continue
+            if vclass != "pedestrian" and net.getShortestPath(origin, destination, vClass=vclass)[0] is None:
+                continue
+            turns.setdefault(turn, []).append(j)
+        for turn, columns in turns.items():
+            probabilities[i, columns] = turn_ratios[turn] / len(columns)
+        if probabilities[i].sum() > 0:
+            probabilities[i] /= probabilities[i].sum()
+
+    # Origins without any destination do not emit
+    keep = probabilities.sum(axis=1) > 0
+    return ([edge.getID() for edge, k in zip(origins, keep) if k],
+            [edge.getID() for edge in destinations],
+            probabilities[keep])
+
+
+def demand_profile(name: str, end_time: int) -> np.ndarray:
+    """Rate factor of every second of [0, end_time)"""
+    knots = np.array(DEMAND_PROFILES[name], dtype=np.float64)
+    return np.interp((np.arange(end_time) + 0.5) / end_time, knots[:, 0], knots[:, 1])
+
+
+def _sample_trips(rng, rate: float, factors: np.ndarray, start: int, probabilities: np.ndarray) -> tuple:
+    # Poisson arrivals of every origin in the seconds [start, start + len(factors)), sorted
+    counts = rng.poisson(rate / 3600.0 * factors[:, None], size=(len(factors), len(probabilities)))
+    seconds, origins = np.nonzero(counts)
+    repeats = counts[seconds, origins]
+    seconds, origins = np.repeat(seconds, repeats), np.repeat(origins, repeats)
+    departs = start + seconds + rng.random(len(seconds))
+    order = np.argsort(departs, kind="stable")
+    departs, origins = departs[order], origins[order]
+
+    # Destination by inverse transform sampling of the row of the origin
+    cumulative = np.cumsum(probabilities, axis=1)
+    u = rng.random(len(origins)) * cumulative[origins, -1]
+    destinations = (cumulative[origins] <= u[:, None]).sum(axis=1)
+    return departs, origins, np.minimum(destinations, probabilities.shape[1] - 1)
+
+
+def generate_demand(net_file, route_file, multiplier: float = 1.0, demand_config: dict = DEMAND_CONFIG) -> dict:
+    """Stream a route file of vehicle trips and walking persons for a network.
+
+    Args:
+        net_file: Network (.net.xml).
+        route_file: Output route file (gzip compressed if it ends with .gz).
+        multiplier (float): Scale of the vehicle and pedestrian rates.
+        demand_config (dict): Rates, turn ratios, profile, end time and seed (see DEMAND_CONFIG).
+
+    Returns:
+        dict: Number of vehicles and persons written.
+    """
+    net = sumolib.net.readNet(str(net_file))
+    end_time = demand_config["end_time"]
+    factors = demand_profile(demand_config["profile"], end_time)
+    rng = np.random.default_rng(demand_config["seed"])
+
+    streams = []
+    for kind, vclass, rate in [("veh", "passenger", demand_config["vehicle_rate"]),
+                               ("ped", "pedestrian", demand_config["pedestrian_rate"])]:
+        origins, destinations, probabilities = fringe_od(net, vclass, demand_config["turn_ratios"])
+        if origins and rate * multiplier > 0:
+            streams.append((kind, rate * multiplier, origins, destinations, probabilities))
+
+    route_file = Path(route_file)
+    route_file.parent.mkdir(parents=True, exist_ok=True)
+    opener = gzip.open if route_file.suffix == ".gz" else open
+    counts = {"vehicles": 0, "persons": 0}
+    with opener(route_file, "wt", encoding="UTF-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<routes>\n')
+        f.write(f"    {VEHICLE_TYPE}\n    {PEDESTRIAN_TYPE}\n")
+        for start in range(0, end_time, DEMAND_CHUNK_SECONDS):
+            chunk = factors[start:start + DEMAND_CHUNK_SECONDS]
+            lines = []
+            for kind, rate, origins, destinations, probabilities in streams:
+                departs, from_idx, to_idx = _sample_trips(rng, rate, chunk, start, probabilities)
+                if kind == "veh":
+                    first = counts["vehicles"]
+                    counts["vehicles"] += len(departs)
+                    lines += [
+                        (depart, f'    <trip id="veh{first + k}" type="car" depart="{depart:.2f}" '
+                                 f'from="{origins[o]}" to="{destinations[d]}" departLane="best" departSpeed="max"/>\n')
+                        for k, (depart, o, d) in enumerate(zip(departs.tolist(), from_idx.tolist(), to_idx.tolist()))
+                    ]
+                else:
+                    first = counts["persons"]
+                    counts["persons"] += len(departs)
+                    lines += [
+                        (depart, f'    <person id="ped{first + k}" type="pedestrian" depart="{depart:.2f}">'
+                                 f'<walk from="{origins[o]}" to="{destinations[d]}"/></person>\n')
+                        for k, (depart, o, d) in enumerate(zip(departs.tolist(), from_idx.tolist(), to_idx.tolist()))
+                    ]
+            # Vehicles and persons of the chunk in departure order
+            lines.sort(key=lambda line: line[0])
+            f.writelines(line for _, line in lines)
+        f.write("</routes>\n")
+    return counts
+
+
+def demand_route_file(net_file=NET_FILE_PATH, multiplier: float = 1.0, demand_config: dict = DEMAND_CONFIG,
+                      root: Path = DEMAND_ROOT, compress: bool = False) -> str:
+    """Route file of a demand (generated in root once per net, multiplier and config)"""
+    key = hashlib.sha256(json.dumps([str(net_file), multiplier, demand_config], sort_keys=True).encode()).hexdigest()
+    name = f"{Path(net_file).name.split('.')[0]}-x{multiplier:g}-{key[:10]}.rou.xml"
+    route_file = Path(root) / (name + ".gz" if compress else name)
+    if not route_file.exists():
+        # Write aside and rename, an interrupted generation is not reused
+        tmp_file = route_file.with_name("tmp-" + route_file.name)
+        generate_demand(net_file, tmp_file, multiplier, demand_config)
+        tmp_file.replace(route_file)
+    return str(route_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a parametric demand route file for a network")
+    parser.add_argument("--net", default=NET_FILE_PATH)
+    parser.add_argument("--out", type=Path, default=None, help="Route file (default in demand-scenarios/)")
+    parser.add_argument("--multiplier", type=float, default=1.0)
+    parser.add_argument("--profile", choices=list(DEMAND_PROFILES), default=DEMAND_CONFIG["profile"])
+    parser.add_argument("--end-time", type=int, default=DEMAND_CONFIG["end_time"])
+    parser.add_argument("--seed", type=int, default=DEMAND_CONFIG["seed"])
+    parser.add_argument("--turn-ratios", type=float, nargs=3, metavar=("STRAIGHT", "LEFT", "RIGHT"),
+                        default=[DEMAND_CONFIG["turn_ratios"][turn] for turn in ("straight", "left", "right")])
+    args = parser.parse_args()
+
+    config = dict(DEMAND_CONFIG, profile=args.profile, end_time=args.end_time, seed=args.seed,
+                  turn_ratios=dict(zip(("straight", "left", "right"), args.turn_ratios)))
+    if args.out is not None:
+        counts = generate_demand(args.net, args.out, args.multiplier, config)
+        print(f"{counts['vehicles']:,} vehicles and {counts['persons']:,} persons in {args.out}")
+    else:
+        print(demand_route_file(args.net, args.multiplier, config))
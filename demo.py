@@ -25,32 +25,28 @@ def print_observation_details(obs, env):
     # Get the traffic signal
     ts = list(env.unwrapped.traffic_signals.values())[0]
     
-    idx = 0
+    # Slice of each observation segment (see CustomObservationFunction.observation_space)
+    layout = ts.observation_fn.layout
     
     # Phase ID
     num_phases = ts.num_green_phases
-    phase_id = obs[idx:idx+num_phases]
+    phase_id = obs[layout["phase_id"]]
     current_phase = np.argmax(phase_id)
     print(f"  Current Phase: {current_phase} (out of {num_phases} phases)")
-    idx += num_phases
     
     # Min green flag
-    min_green_ok = obs[idx]
+    min_green_ok = obs[layout["min_green"]][0]
     print(f"  Min Green Time Elapsed: {'Yes' if min_green_ok else 'No'}")
-    idx += 1
     
     # Current time (normalized)
-    current_time = obs[idx]
+    current_time = obs[layout["current_time"]][0]
     time_seconds = current_time * 3600.0  # Convert back from normalized
     print(f"  Simulation Time: {time_seconds:.1f}s ({current_time*100:.1f}% complete)")
-    idx += 1
     
     # Vehicle lanes
     num_vehicle_lanes = len(ts.lanes)
-    vehicle_density = obs[idx:idx+num_vehicle_lanes]
-    idx += num_vehicle_lanes
-    vehicle_queue = obs[idx:idx+num_vehicle_lanes]
-    idx += num_vehicle_lanes
+    vehicle_density = obs[layout["vehicle_density"]]
+    vehicle_queue = obs[layout["vehicle_queue"]]
     
     print(f"  Vehicle Lanes ({num_vehicle_lanes} lanes):")
     print(f"    Avg Density: {np.mean(vehicle_density):.3f}")
@@ -58,10 +54,8 @@ def print_observation_details(obs, env):
     
     # Pedestrian lanes
     num_ped_lanes = len(ts.ped_lanes)
-    ped_density = obs[idx:idx+num_ped_lanes]
-    idx += num_ped_lanes
-    ped_queue = obs[idx:idx+num_ped_lanes]
-    idx += num_ped_lanes
+    ped_density = obs[layout["ped_density"]]
+    ped_queue = obs[layout["ped_queue"]]
     
     print(f"  Pedestrian Lanes ({num_ped_lanes} lanes):")
     print(f"    Avg Density: {np.mean(ped_density):.3f}")
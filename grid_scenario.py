@@ -0,0 +1,102 @@
+"""-------------------------------------------------------------------------------------
+File: grid_scenario.py
+Description: N x M grid scenarios for the multi-agent version of the custom environment.
+generate_grid() builds the network (netgenerate, signalized junctions with sidewalks and
+pedestrian crossings) and random vehicle and pedestrian demand (randomTrips.py) once in
+GRID_ROOT/grid-<rows>x<cols>/, and make_grid_env() creates the GRID_ENV_ID env on it
+(one agent per traffic signal, sharing a NetworkLaneState).
+-------------------------------------------------------------------------------------"""
+
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import gymnasium as gym
+
+from custom_env import GRID_ENV_ID
+
+# Folder of the generated grid scenarios
+GRID_ROOT = Path("grid-scenarios")
+
+# Geometry and demand of the generated grids
+GRID_CONFIG = {
+    "edge_length": 200,  # m between two junctions
+    "attach_length": 150,  # m of the fringe edges
+    "end_time": 3600,  # s of generated demand
+    "vehicle_period": 2.0,  # s between two vehicle departures (whole network)
+    "pedestrian_period": 4.0,  # s between two pedestrian departures
+    "seed": 42,
+}
+
+
+def _run(cmd: list):
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(map(str, cmd))} failed:\n{result.stderr}")
+
+
+def _merge_routes(route_files: list, out_file: Path):
+    # Single route file with the vehicles and persons sorted by departure time
+    root = None
+    items = []
+    for path in route_files:
+        tree = ET.parse(path)
+        if root is None:
+            root = ET.Element(tree.getroot().tag, tree.getroot().attrib)
+        for element in tree.getroot():
+            if "depart" in element.attrib:
+                items.append(element)
+            else:
+                root.append(element)
+    items.sort(key=lambda element: float(element.attrib["depart"]))
+    root.extend(items)
+    ET.ElementTree(root).write(out_file, encoding="UTF-8", xml_declaration=True)
+
+
+def generate_grid(rows: int, cols: int, grid_config: dict = GRID_CONFIG, root: Path = GRID_ROOT) -> tuple:
+    """Generate (or reuse) the network and route files of a rows x cols grid.
+
+    Returns:
+        (net_file, route_file): paths of the scenario files.
+    """
+    out_dir = Path(root) / f"grid-{rows}x{cols}"
+    net_file = out_dir / "grid.net.xml"
+    route_file = out_dir / "grid.rou.xml"
+    if net_file.exists() and route_file.exists():
+        return str(net_file), str(route_file)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sumo_home = Path(os.environ["SUMO_HOME"])
+    _run([
+        sumo_home / "bin" / "netgenerate", "--grid",
+        "--grid.x-number", str(cols), "--grid.y-number", str(rows),
+        "--grid.length", str(grid_config["edge_length"]),
+        "--grid.attach-length", str(grid_config["attach_length"]),
+        "--default-junction-type", "traffic_light",
+        "--tls.default-type", "static",
+        "--sidewalks.guess", "--crossings.guess", "--no-turnarounds",
+        "--no-warnings", "-o", net_file,
+    ])
+
+    random_trips = sumo_home / "tools" / "randomTrips.py"
+    common = ["-n", net_file, "-e", str(grid_config["end_time"]), "--seed", str(grid_config["seed"])]
+    _run([
+        sys.executable, random_trips, *common, "--fringe-factor", "10", "--validate",
+        "-p", str(grid_config["vehicle_period"]), "--prefix", "veh",
+        "-o", out_dir / "vehicles.trips.xml", "-r", out_dir / "vehicles.rou.xml",
+    ])
+    _run([
+        sys.executable, random_trips, *common, "--pedestrians",
+        "-p", str(grid_config["pedestrian_period"]), "--prefix", "ped",
+        "-o", out_dir / "persons.trips.xml", "-r", out_dir / "persons.rou.xml",
+    ])
+    _merge_routes([out_dir / "vehicles.rou.xml", out_dir / "persons.rou.xml"], route_file)
+    return str(net_file), str(route_file)
+
+
+def make_grid_env(rows: int, cols: int, **env_kwargs) -> gym.Env:
+    """Multi-agent custom environment on a rows x cols grid (scenario generated if needed)"""
+    net_file, route_file = generate_grid(rows, cols)
+    return gym.make(GRID_ENV_ID, net_file=net_file, route_file=route_file, **env_kwargs)
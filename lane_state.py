@@ -0,0 +1,131 @@
+"""-------------------------------------------------------------------------------------
+File: lane_state.py
+Description: Network-wide lane and pedestrian state of the custom environment, shared by
+all its traffic signals. The vehicle lanes (incoming and outgoing lanes of every signal,
+without duplicates) and pedestrian lanes are read once per simulation step into arrays,
+and every CustomTrafficSignal computes its observation, queue and pressure from indexed
+slices of these arrays. On a grid, the out-lane of a signal that is the in-lane of its
+neighbour is read once, so the per-step cost grows with the network size rather than
+with signals x neighbours (see `shared_lane_state` in CustomSumoEnvironment).
+-------------------------------------------------------------------------------------"""
+
+import numpy as np
+from traci import constants as tc
+
+
+class NetworkLaneState:
+    """Per-step arrays of the vehicle lanes (vehicle number, halting number, mean vehicle
+    length) and pedestrian lanes (persons, halting persons, waiting time of the halting
+    persons) of all the traffic signals of an environment.
+
+    `refresh()` reads the simulation only once per step (`invalidate()` is called by the
+    env after every simulation step).
+    """
+
+    # Speed (m/s) under which a pedestrian is considered halting (same as CustomTrafficSignal)
+    PED_HALT_SPEED = 0.1
+
+    def __init__(self, env, traffic_signals: list):
+        self.env = env
+        self.lanes = list(dict.fromkeys(lane for ts in traffic_signals for lane in ts.lanes + ts.out_lanes))
+        self.ped_lanes = list(dict.fromkeys(lane for ts in traffic_signals for lane in ts.ped_lanes))
+        self.lane_index = {lane: i for i, lane in enumerate(self.lanes)}
+        self.ped_index = {lane: i for i, lane in enumerate(self.ped_lanes)}
+
+        lanes_length = {}
+        for ts in traffic_signals:
+            lanes_length.update(ts.lanes_length)
+        self.lane_length = np.array([lanes_length[lane] for lane in self.lanes], dtype=np.float64)
+        self.ped_lane_length = np.array([lanes_length[lane] for lane in self.ped_lanes], dtype=np.float64)
+
+        n, n_ped = len(self.lanes), len(self.ped_lanes)
+        self.vehicle_number = np.zeros(n)
+        self.halting_number = np.zeros(n)
+        self.vehicle_length = np.zeros(n)
+        self.ped_number = np.zeros(n_ped)
+        self.ped_halting = np.zeros(n_ped)
+        self.ped_halted_wait = np.zeros(n_ped)
+        # Pressure value of every lane (vehicle lanes, pedestrian lanes, then a 0 entry)
+        self.pressure_values = np.zeros(n + n_ped + 1)
+        # (speed, waiting time) of the persons on every pedestrian lane
+        self.ped_snapshot = {lane: [] for lane in self.ped_lanes}
+        self._valid = False
+
+    def invalidate(self):
+        """Mark the state as out of date (the simulation advanced)"""
+        self._valid = False
+
+    def pressure_index(self, lane: str) -> int:
+        """Index of a lane in pressure_values"""
+        if lane in self.ped_index:
+            return len(self.lanes) + self.ped_index[lane]
+        return self.lane_index[lane]
+
+    def refresh(self) -> "NetworkLaneState":
+        """Read the state of the current simulation step (once per step)"""
+        if self._valid:
+            return self
+        self._read_vehicle_lanes()
+        self._read_pedestrians()
+
+        n = len(self.lanes)
+        self.pressure_values[:n] = self.halting_number
+        # Pedestrians: count waiting + small bonus for wait time
+        halting = self.ped_halting
+        ped_values = self.pressure_values[n:-1]
+        ped_values.fill(0.0)
+        waiting = halting > 0
+        ped_values[waiting] = halting[waiting] + 0.1 * (self.ped_halted_wait[waiting] / halting[waiting])
+        self._valid = True
+        return self
+
+    def _read_vehicle_lanes(self):
+        if self.env.use_subscriptions:
+            results = self.env.get_subscription_results()["lane"]
+            for i, lane in enumerate(self.lanes):
+                values = results[lane]
+                self.vehicle_number[i] = values[tc.LAST_STEP_VEHICLE_NUMBER]
+                self.halting_number[i] = values[tc.LAST_STEP_VEHICLE_HALTING_NUMBER]
+                self.vehicle_length[i] = values[tc.LAST_STEP_LENGTH]
+            return
+
+        lane_domain = self.env.sumo.lane
+        for i, lane in enumerate(self.lanes):
+            self.vehicle_number[i] = lane_domain.getLastStepVehicleNumber(lane)
+            self.halting_number[i] = lane_domain.getLastStepHaltingNumber(lane)
+            self.vehicle_length[i] = lane_domain.getLastStepLength(lane)
+
+    def _read_pedestrians(self):
+        # One scan of the persons for all the pedestrian lanes of the network
+        snapshot = {lane: [] for lane in self.ped_lanes}
+        sumo = self.env.sumo
+        if self.env.use_subscriptions:
+            persons = {}
+            for context in self.env.get_subscription_results()["junction_context"].values():
+                persons.update(context)
+            for values in persons.values():
+                lane = values[tc.VAR_LANE_ID]
+                if lane in snapshot:
+                    speed = values[tc.VAR_SPEED]
+                    wait = values[tc.VAR_WAITING_TIME] if speed < self.PED_HALT_SPEED else 0.0
+                    snapshot[lane].append((speed, wait))
+        else:
+            if self.env.reward_tracker is not None:
+                persons = ((lane, ped_id) for lane in self.ped_lanes
+                           for ped_id in self.env.reward_tracker.lane_persons(lane))
+            else:
+                persons = ((sumo.person.getLaneID(ped_id), ped_id) for ped_id in sumo.person.getIDList())
+            for lane, ped_id in persons:
+                if lane not in snapshot:
+                    continue
+                speed = sumo.person.getSpeed(ped_id)
+                wait = sumo.person.getWaitingTime(ped_id) if speed < self.PED_HALT_SPEED else 0.0
+                snapshot[lane].append((speed, wait))
+
+        for i, lane in enumerate(self.ped_lanes):
+            peds = snapshot[lane]
+            waits = [wait for speed, wait in peds if speed < self.PED_HALT_SPEED]
+            self.ped_number[i] = len(peds)
+            self.ped_halting[i] = len(waits)
+            self.ped_halted_wait[i] = sum(waits)
+        self.ped_snapshot = snapshot
@@ -0,0 +1,138 @@
+"""-------------------------------------------------------------------------------------
+File: metrics_writer.py
+Description: Low-overhead streaming log of the per-step training metrics. The training
+loop writes one record per step into a fixed-size NumPy ring buffer and a background
+thread appends the new records in bulk to a CSV file (pandas), so the file can be
+tailed while the algorithm trains and a crash only loses the last flush interval.
+-------------------------------------------------------------------------------------"""
+
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Columns of the metrics log (per-stage timings are in seconds)
+METRICS_DTYPE = np.dtype([
+    ("step", np.int64),
+    ("reward", np.float64),
+    ("queue", np.float64),
+    ("waiting_time", np.float64),
+    ("action", np.int64),
+    ("select_time", np.float64),
+    ("env_time", np.float64),
+    ("train_time", np.float64),
+])
+
+# Records kept in memory between two flushes
+METRICS_BUFFER_SIZE = 4096
+
+# Maximum seconds between two flushes of the background thread
+METRICS_FLUSH_INTERVAL = 1.0
+
+
+class MetricsWriter:
+    """Streams per-step metrics records to an append-only CSV file.
+
+    `log` stores the record in the ring buffer (it only waits if the writer thread is a
+    whole buffer behind). The thread flushes the buffer when it is half full or every
+    flush_interval seconds, `close` flushes the remaining records.
+    """
+
+    def __init__(self, path: Path, buffer_size: int = METRICS_BUFFER_SIZE,
+                 flush_interval: float = METRICS_FLUSH_INTERVAL, dtype: np.dtype = METRICS_DTYPE):
+        """Opens the CSV file (appends if it exists) and starts the writer thread.
+
+        Args:
+            path (Path): CSV file of the log.
+            buffer_size (int): Capacity of the ring buffer (records).
+            flush_interval (float): Maximum seconds between two flushes.
+            dtype (np.dtype): Structured dtype of a record (the CSV columns).
+        """
+        self.path = Path(path)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = np.zeros(buffer_size, dtype=dtype)
+
+        # Records [0, head) were logged and [0, tail) were written to the file
+        self._head = 0
+        self._tail = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_header = not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, "a", newline="")
+        if write_header:
+            self._file.write(",".join(dtype.names) + "\n")
+            self._file.flush()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log(self, *record):
+        """Store one record (values in the order of the dtype fields)"""
+        if self._head - self._tail >= self.buffer_size:
+            # Buffer full: wait for the writer thread
+            with self._cond:
+                self._cond.notify_all()
+                while self._head - self._tail >= self.buffer_size:
+                    self._cond.wait()
+        self._buffer[self._head % self.buffer_size] = record
+        self._head += 1
+        if self._head - self._tail == self.buffer_size // 2:
+            with self._cond:
+                self._cond.notify_all()
+
+    def _flush(self):
+        head = self._head
+        if head == self._tail:
+            return
+        indices = np.arange(self._tail, head) % self.buffer_size
+        pd.DataFrame(self._buffer[indices]).to_csv(self._file, header=False, index=False)
+        self._file.flush()
+        with self._cond:
+            self._tail = head
+            self._cond.notify_all()
+
+    def _run(self):
+        # Writer thread: bulk flush when notified or every flush_interval
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self._flush()
+            if closed:
+                break
+
+    def close(self):
+        """Flush the remaining records and close the file"""
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def truncate_metrics(path: Path, end_step: int):
+    """Drop the records of the steps >= end_step from a metrics log (e.g. the steps of an
+    interrupted training that is run again), the file is replaced atomically"""
+    path = Path(path)
+    if not path.exists() or path.stat().st_size == 0:
+        return
+    metrics = pd.read_csv(path)
+    if len(metrics) == 0 or metrics["step"].max() < end_step:
+        return
+    tmp_path = path.with_name(path.name + ".tmp")
+    metrics[metrics["step"] < end_step].to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
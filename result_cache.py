@@ -0,0 +1,194 @@
+"""-------------------------------------------------------------------------------------
+File: result_cache.py
+Description: Content-addressed cache of the experiment results. An experiment is
+identified by a hash of the algorithm (class and sources of its package), the env
+code (ENV_SOURCES), the training loop (TRAINING_SOURCES), its hyperparameters, the
+training config, the seed, the env arguments and the contents of the scenario files
+(NET_FILE_PATH/ROUTE_FILE_PATH).
+Cached entries hold the model and the train/eval logs. Entries that only differ by a
+smaller train_steps or by the evaluation config (same "lineage") are used as
+checkpoints to resume longer trainings or to evaluate again.
+-------------------------------------------------------------------------------------"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import custom_env
+import metrics_writer
+from custom_env import NET_FILE_PATH, ROUTE_FILE_PATH
+
+# Files of a cache entry (meta.json is written last and marks a complete entry)
+CACHED_FILES = ["model.zip", "train.json", "train_metrics.csv", "eval.json"]
+META_FILE = "meta.json"
+
+# Folder of the modules of this repository
+REPO_ROOT = Path(__file__).resolve().parent
+
+# Prefix of the training config keys only used by the evaluation (not in the lineage)
+EVAL_KEY_PREFIX = "eval_"
+
+
+def file_digest(path) -> str:
+    """sha256 of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_digest(paths: list) -> str:
+    """sha256 of the contents of source files and of every .py file under source folders"""
+    files = []
+    for path in map(Path, paths):
+        files += sorted(path.rglob("*.py")) if path.is_dir() else [path]
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(f"{path.name}:{file_digest(path)}\n".encode())
+    return digest.hexdigest()
+
+
+def local_sources(module) -> list:
+    """Source file of a module and of the modules of this repository it uses (imported
+    modules, classes and functions), recursively"""
+    sources = set()
+    pending = [module]
+    while pending:
+        module = pending.pop()
+        path = Path(inspect.getsourcefile(module)).resolve()
+        if path in sources:
+            continue
+        sources.add(path)
+        for value in vars(module).values():
+            if inspect.ismodule(value):
+                dependency = value
+            elif inspect.isclass(value) or inspect.isfunction(value):
+                dependency = sys.modules.get(value.__module__)
+            else:
+                continue
+            source = getattr(dependency, "__file__", None)
+            if source is not None and REPO_ROOT in Path(source).resolve().parents:
+                pending.append(dependency)
+    return sorted(sources)
+
+
+# Source files of the env (custom_env and the reward, observation, signal and TraCI
+# modules it delegates to) and of the training loop (train_algorithm in run_experiments,
+# which imports this module) in the key of every experiment
+ENV_SOURCES = local_sources(custom_env)
+TRAINING_SOURCES = [REPO_ROOT / "run_experiments.py", *local_sources(metrics_writer)]
+
+
+def algorithm_sources(algo_class) -> list:
+    """Folder of the package of an algorithm class (its source file for a top-level module)"""
+    module = sys.modules[algo_class.__module__]
+    source = Path(inspect.getsourcefile(algo_class))
+    return [source.parent] if module.__package__ else [source]
+
+
+def _hash(data: dict) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_cache_keys(algo_class, params_dict: dict, training_config: dict, seed=None, env_kwargs: dict = None) -> tuple:
+    """Key of the experiment and key of its lineage (same training for any train_steps and
+    evaluation config).
+
+    Changing the code of an algorithm package only invalidates the entries of that
+    algorithm, changing the env code or the training loop invalidates every entry.
+    """
+    env_kwargs = env_kwargs or {}
+    lineage = {
+        "algo": f"{algo_class.__module__}.{algo_class.__qualname__}",
+        "algo_source": source_digest(algorithm_sources(algo_class)),
+        "env_source": source_digest(ENV_SOURCES),
+        "training_source": source_digest(TRAINING_SOURCES),
+        "params": params_dict,
+        "training_config": {
+            k: v for k, v in training_config.items() if k != "train_steps" and not k.startswith(EVAL_KEY_PREFIX)
+        },
+        "seed": seed,
+        "env_kwargs": env_kwargs,
+        "net_file": file_digest(env_kwargs.get("net_file", NET_FILE_PATH)),
+        "route_file": file_digest(env_kwargs.get("route_file", ROUTE_FILE_PATH)),
+    }
+    lineage_key = _hash(lineage)
+    key = _hash({
+        "lineage": lineage_key,
+        "train_steps": training_config["train_steps"],
+        "eval_config": {k: v for k, v in training_config.items() if k.startswith(EVAL_KEY_PREFIX)},
+    })
+    return key, lineage_key
+
+
+def _entries(cache_root: Path, lineage_key: str):
+    # Complete entries of a lineage: (train_steps, entry dir)
+    lineage_dir = Path(cache_root) / lineage_key
+    if not lineage_dir.is_dir():
+        return []
+    entries = []
+    for entry in lineage_dir.iterdir():
+        meta_path = entry / META_FILE
+        if meta_path.exists():
+            entries.append((json.loads(meta_path.read_text())["train_steps"], entry))
+    return entries
+
+
+def lookup(cache_root: Path, key: str, lineage_key: str, train_steps: int) -> tuple:
+    """Find the cached results of an experiment.
+
+    Returns:
+        ("hit", entry dir) if the experiment is cached, ("partial", entry dir) for the
+        longest cached training of the same lineage up to train_steps (a checkpoint to
+        resume from, or to evaluate again if only the evaluation config differs), or
+        (None, None).
+    """
+    entry = Path(cache_root) / lineage_key / key
+    if (entry / META_FILE).exists():
+        return "hit", entry
+
+    shorter = [(steps, entry) for steps, entry in _entries(cache_root, lineage_key) if steps <= train_steps]
+    if shorter:
+        return "partial", max(shorter, key=lambda item: item[0])[1]
+    return None, None
+
+
+def restore(entry: Path, save_dir: Path):
+    """Copy the files of a cache entry into an experiment folder"""
+    save_dir.mkdir(parents=True, exist_ok=True)
+    for name in CACHED_FILES:
+        if (entry / name).exists():
+            shutil.copy2(entry / name, save_dir / name)
+
+
+def store(cache_root: Path, key: str, lineage_key: str, train_steps: int, save_dir: Path):
+    """Add the results of an experiment folder to the cache.
+
+    The entry is written in a temporary folder and renamed, so readers (e.g. parallel
+    sweep workers) never see a partial entry.
+    """
+    lineage_dir = Path(cache_root) / lineage_key
+    lineage_dir.mkdir(parents=True, exist_ok=True)
+    entry = lineage_dir / key
+    if entry.exists():
+        return entry
+
+    tmp_dir = Path(tempfile.mkdtemp(dir=lineage_dir, prefix=".tmp_"))
+    for name in CACHED_FILES:
+        if (save_dir / name).exists():
+            shutil.copy2(save_dir / name, tmp_dir / name)
+    with open(tmp_dir / META_FILE, "w") as f:
+        json.dump({"train_steps": train_steps, "source": str(save_dir)}, f, indent=4)
+
+    try:
+        os.rename(tmp_dir, entry)
+    except OSError:
+        # Stored meanwhile by another process
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return entry
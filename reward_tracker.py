@@ -0,0 +1,116 @@
+"""-------------------------------------------------------------------------------------
+File: reward_tracker.py
+Description: Incremental tracking of the reward features of the custom environment
+(per-lane vehicle waiting times and pedestrians). Vehicles and persons are followed
+through the departed/arrived id lists of the simulation: each one is subscribed once
+when it departs (accumulated waiting time of the vehicles, lane of the persons), so a
+step reads their state with one request instead of querying every object on every lane
+(see `incremental_reward` in CustomSumoEnvironment).
+-------------------------------------------------------------------------------------"""
+
+import traci.constants as tc
+
+
+class RewardTracker:
+    """Reward features of the current simulation step, shared by the traffic signals of
+    an environment.
+
+    The per-lane waiting times follow the sumo-rl bookkeeping of `env.vehicles` (the
+    waiting time of a vehicle is split between the lanes it waited on), but the share of
+    the other lanes is only recomputed when a vehicle changes lane, and the arrived
+    vehicles are removed from `env.vehicles`. With `env.use_subscriptions`, the objects
+    are not subscribed (the lane and junction context subscriptions already deliver them).
+    """
+
+    SIMULATION_VARS = [
+        tc.VAR_DEPARTED_VEHICLES_IDS,
+        tc.VAR_ARRIVED_VEHICLES_IDS,
+        tc.VAR_DEPARTED_PERSONS_IDS,
+    ]
+    VEHICLE_VARS = [tc.VAR_ACCUMULATED_WAITING_TIME]
+    PERSON_VARS = [tc.VAR_LANE_ID]
+
+    def __init__(self, env):
+        self.env = env
+        self._bases = {}
+        self._waiting_times = {}
+        self._lane_persons = {}
+        self._version = 0
+        self._read_version = None
+
+    @property
+    def subscribe_objects(self) -> bool:
+        return not self.env.use_subscriptions
+
+    def reset(self):
+        """Start tracking a (re)started or reloaded simulation: subscribe to the departed and
+        arrived lists and to the objects already in the simulation"""
+        sumo = self.env.sumo
+        sumo.simulation.subscribe(self.SIMULATION_VARS)
+        if self.subscribe_objects:
+            for veh in sumo.vehicle.getIDList():
+                sumo.vehicle.subscribe(veh, self.VEHICLE_VARS)
+            for person in sumo.person.getIDList():
+                sumo.person.subscribe(person, self.PERSON_VARS)
+        self._bases = {}
+        self._version += 1
+
+    def on_sim_step(self):
+        """Follow the departures and arrivals of the last simulation step"""
+        sumo = self.env.sumo
+        lists = sumo.simulation.getSubscriptionResults()
+        if self.subscribe_objects:
+            for veh in lists[tc.VAR_DEPARTED_VEHICLES_IDS]:
+                sumo.vehicle.subscribe(veh, self.VEHICLE_VARS)
+            for person in lists[tc.VAR_DEPARTED_PERSONS_IDS]:
+                sumo.person.subscribe(person, self.PERSON_VARS)
+        for veh in lists[tc.VAR_ARRIVED_VEHICLES_IDS]:
+            self.env.vehicles.pop(veh, None)
+            self._bases.pop(veh, None)
+        self._version += 1
+
+    def _read(self):
+        # Subscription results of the objects, read once per simulation step
+        if self._read_version == self._version:
+            return
+        sumo = self.env.sumo
+        self._waiting_times = {
+            veh: values[tc.VAR_ACCUMULATED_WAITING_TIME]
+            for veh, values in sumo.vehicle.getAllSubscriptionResults().items()
+        }
+        lane_persons = {}
+        for person, values in sumo.person.getAllSubscriptionResults().items():
+            lane_persons.setdefault(values[tc.VAR_LANE_ID], []).append(person)
+        self._lane_persons = lane_persons
+        self._read_version = self._version
+
+    def accumulated_waiting_time(self, veh: str) -> float:
+        """Accumulated waiting time of a subscribed vehicle"""
+        self._read()
+        acc = self._waiting_times.get(veh)
+        if acc is None:
+            # Not delivered yet (subscribed in this step)
+            acc = self.env.sumo.vehicle.getAccumulatedWaitingTime(veh)
+        return acc
+
+    def lane_persons(self, lane: str) -> list[str]:
+        """Ids of the subscribed persons on a lane"""
+        self._read()
+        return self._lane_persons.get(lane, [])
+
+    def lane_waiting_time(self, lane: str, vehicles) -> float:
+        """Waiting time of the vehicles of a lane given as (vehicle id, accumulated waiting time)
+        pairs, split between the lanes as in TrafficSignal.get_accumulated_waiting_time_per_lane"""
+        known = self.env.vehicles
+        bases = self._bases
+        wait_time = 0.0
+        for veh, acc in vehicles:
+            base = bases.get(veh)
+            if base is None or base[0] != lane:
+                # New vehicle or lane change: waiting time attributed to its other lanes
+                lanes = known.setdefault(veh, {})
+                base = bases[veh] = (lane, sum(value for other, value in lanes.items() if other != lane))
+            value = acc - base[1]
+            known[veh][lane] = value
+            wait_time += value
+        return wait_time
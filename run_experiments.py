@@ -1,22 +1,33 @@
 from itertools import product
+import argparse
 import json
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import os
+import shutil
+import time
+import traceback
 from pathlib import Path
 from datetime import datetime
+from statistics import NormalDist
 import numpy as np
+import torch
 
 from algorithms.base import BaseAlgorithm
-from algorithms.PPO import PPO
-from algorithms.q_learning import QLearningAgent
+from algorithms.PPO import PPOAlgorithm
+from algorithms.q_learning import QLearningAlgorithm
 #from algorithms.MaxPressure import MaxPressure
 
 import gymnasium as gym
-from custom_env import CUSTOM_ENV_ID
+from custom_env import CUSTOM_ENV_ID, SumoEnvironment
+import result_cache
+from metrics_writer import MetricsWriter, METRICS_BUFFER_SIZE
 
-# Reference for the algorithms evaluated
+# Reference for the algorithms evaluated (BaseAlgorithm classes built with (env, **params))
 ALGORITHMS = {
-    "ppo": PPO,
+    "ppo": PPOAlgorithm,
     #"max_pressure": MaxPressureAlgorithm,
-    "q-learning": QLearningAgent,
+    "q-learning": QLearningAlgorithm,
 }
 
 # Hyperparameter grid
@@ -27,6 +38,9 @@ PARAM_GRID = {
         "clip": 0.2,
         "gae_lambda": 0.95,
         "K": 4,
+        # Minibatches of the update epochs (None: full batch) and gradient clipping (None: off)
+        "minibatch_size": None,
+        "max_grad_norm": None,
     },
     "q-learning": {
         "lr": 0.1,
@@ -43,35 +57,93 @@ PARAM_GRID = {
 TRAINING_CONFIG = {
     "train_steps": 500000,
     "log_interval": 1000,
-    "eval_episodes": 10
+    "eval_episodes": 10,
+    "metrics_buffer_size": METRICS_BUFFER_SIZE,
+    # Evaluation episode i uses sumo_seed eval_seed + i (common to every algorithm)
+    "eval_seed": 10000,
+    # Processes running the evaluation episodes (1: sequential on the training env)
+    "eval_workers": 1,
+    # Stop the evaluation once the confidence interval of the mean return is narrower
+    # (None: always run eval_episodes)
+    "eval_ci_width": None,
+    "eval_confidence": 0.95,
+    "eval_min_episodes": 3
 }
 
+# Per-step training metrics streamed in every experiment folder
+METRICS_FILE = "train_metrics.csv"
+
 # Where to store the results
 RESULTS_ROOT = Path("Results")
 
+# Where to cache the results of the experiments (None disables the cache)
+CACHE_ROOT = RESULTS_ROOT / "cache"
+
+# Parallel sweep parameters (num_workers None = one worker per CPU core)
+SWEEP_CONFIG = {
+    "num_workers": None,
+    "seeds": [None],
+    "pin_cpus": False,
+    # Torch intra-op threads of every worker so the workers do not oversubscribe the CPU
+    # (None keeps the torch default)
+    "torch_threads": 1,
+    "start_method": "spawn",
+    "env_kwargs": {},
+}
+
 def get_file_date():
     """Function to print the date"""
     return datetime.now().strftime("%Y%m%d_%H%M%S")
 
-def train_algorithm(env:gym.Env, algo: BaseAlgorithm, training_config:dict, save_dir: Path):
-    """Loop to train the algorithm using the trasining config dict"""
+def expand_grid(params_grid:dict):
+    """List every combination of the hyperparameter grid (scalar values count as a single choice)"""
+    params_keys = list(params_grid.keys())
+    params_values = [v if isinstance(v, (list, tuple)) else [v] for v in params_grid.values()]
+    return [dict(zip(params_keys, params_tuple)) for params_tuple in product(*params_values)]
+
+def get_experiment_name(algo_name:str, params_dict:dict, seed=None):
+    """Folder name of an experiment: algo_lr_...(_seed_...)"""
+    name = algo_name + "_" + "_".join(f"{k}_{v}" for k, v in params_dict.items())
+    if seed is not None:
+        name += f"_seed_{seed}"
+    return name
+
+def train_algorithm(env:gym.Env, algo: BaseAlgorithm, training_config:dict, save_dir: Path, start_step:int=0):
+    """Loop to train the algorithm using the trasining config dict.
+
+    Every step (reward, queue, waiting time, action and time spent in each stage) is
+    streamed to save_dir/train_metrics.csv. Steps are numbered from start_step (number of
+    steps already trained when resuming a checkpoint)."""
     results = []
     obs, _ = env.reset()
     algo.reset()
 
-    # Train the algorithm for the number of steps
-    for step in range(training_config["train_steps"]):
-        action = algo.select_action(obs)
-        next_obs, reward, done, truncated,_ = env.step(action)
+    metrics = MetricsWriter(save_dir / METRICS_FILE, training_config.get("metrics_buffer_size", METRICS_BUFFER_SIZE))
+    try:
+        # Train the algorithm for the number of steps
+        for step in range(start_step, start_step + training_config["train_steps"]):
+            t_start = time.perf_counter()
+            action = algo.select_action(obs)
+            t_select = time.perf_counter()
+            next_obs, reward, done, truncated, info = env.step(action)
+            t_env = time.perf_counter()
+
+            algo.train_step((obs, action, reward, next_obs, done or truncated))
+            t_train = time.perf_counter()
 
-        algo.train_step((obs, action, reward, next_obs, done or truncated))
+            metrics.log(
+                step, reward, info.get("system_total_stopped", np.nan), info.get("system_total_waiting_time", np.nan),
+                int(action), t_select - t_start, t_env - t_select, t_train - t_env,
+            )
 
-        obs = next_obs
-        if done or truncated:
-            obs, _ = env.reset()
+            obs = next_obs
+            if done or truncated:
+                obs, _ = env.reset()
 
-        if step % training_config["log_interval"] == 0:
-            results.append({"step": step, "reward": float(reward)})
+            if step % training_config["log_interval"] == 0:
+                results.append({"step": step, "reward": float(reward)})
+    finally:
+        metrics.close()
 
     # Save the current model state
     algo.save(save_dir / "model.zip")
@@ -79,37 +151,258 @@ def train_algorithm(env:gym.Env, algo: BaseAlgorithm, training_config:dict, save
     return results
 
 
-def evaluate_algorithm(env:gym.Env, algo:BaseAlgorithm, config:dict):
-    """Function to evaluate the algorithm performance"""
-    rewards = []
-
-    # Evaluate the algorithm for the number of episodes
-    for _ in range(config["eval_episodes"]):
-        obs, _ = env.reset()
-        total = 0
-        done = False
-        truncated = False
-
-        while not (done or truncated):
-            action = algo.select_action(obs)
-            obs, reward, done, truncated, _ = env.step(action)
-            total += reward
-
-        rewards.append(total)
+# Degrees of freedom up to which the t quantile is computed exactly (Cornish-Fisher above)
+EXACT_T_MAX_DOF = 5
+
+
+def _t_coverage(t:float, dof:int):
+    """P(|T| < t) for a Student-t with an integer number of degrees of freedom (closed
+    form, Abramowitz & Stegun 26.7.3 and 26.7.4)"""
+    theta = np.arctan(t / np.sqrt(dof))
+    cos2 = np.cos(theta) ** 2
+    term, total = 1.0, 1.0
+    if dof % 2 == 0:
+        for k in range(1, dof // 2):
+            term *= cos2 * (2 * k - 1) / (2 * k)
+            total += term
+        return np.sin(theta) * total
+    if dof == 1:
+        return 2 / np.pi * theta
+    for k in range(1, (dof - 1) // 2):
+        term *= cos2 * 2 * k / (2 * k + 1)
+        total += term
+    return 2 / np.pi * (theta + np.sin(theta) * np.cos(theta) * total)
+
+
+def t_quantile(confidence:float, dof:int):
+    """Two-sided quantile of the Student-t: exact (bisection of the closed form CDF) up to
+    EXACT_T_MAX_DOF degrees of freedom, Cornish-Fisher expansion above (within 0.3%)"""
+    if dof <= EXACT_T_MAX_DOF:
+        low, high = 0.0, 1.0
+        while _t_coverage(high, dof) < confidence:
+            high *= 2
+        for _ in range(100):
+            mid = (low + high) / 2
+            low, high = (mid, high) if _t_coverage(mid, dof) < confidence else (low, mid)
+        return (low + high) / 2
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    return (z + (z**3 + z) / (4 * dof) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * dof**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * dof**3))
+
+
+def confidence_interval_width(rewards:list, confidence:float=0.95):
+    """Width of the Student-t confidence interval of the mean of the rewards"""
+    n = len(rewards)
+    if n < 2:
+        return float("inf")
+    t = t_quantile(confidence, n - 1)
+    return float(2 * t * np.std(rewards, ddof=1) / np.sqrt(n))
+
+
+def get_eval_seed(config:dict, episode:int):
+    """SUMO seed of an evaluation episode (the same for every algorithm)"""
+    return None if config.get("eval_seed") is None else config["eval_seed"] + episode
+
+
+def stop_evaluation(rewards:list, config:dict):
+    """Sequential stopping rule: the confidence interval of the mean return is narrow enough"""
+    target = config.get("eval_ci_width")
+    if target is None or len(rewards) < config.get("eval_min_episodes", 3):
+        return False
+    return confidence_interval_width(rewards, config.get("eval_confidence", 0.95)) < target
+
+
+def run_episode(env:gym.Env, algo:BaseAlgorithm, seed=None):
+    """Run one evaluation episode and return its total reward"""
+    obs, _ = env.reset(seed=seed)
+    total = 0
+    done = False
+    truncated = False
+
+    while not (done or truncated):
+        action = algo.select_action(obs)
+        obs, reward, done, truncated, _ = env.step(action)
+        total += reward
+
+    return float(total)
+
+
+def _evaluate_episode(algo_class, params_dict:dict, checkpoint:Path, seed, env_kwargs:dict):
+    """Evaluation episode in a worker process: rebuilds the algorithm from its checkpoint"""
+    env = gym.make(CUSTOM_ENV_ID, **(env_kwargs or {}))
+    try:
+        algo = algo_class(env, **params_dict)
+        algo.load(checkpoint)
+        return run_episode(env, algo, seed)
+    finally:
+        env.close()
+
+
+def evaluate_algorithm(
+    env:gym.Env,
+    algo:BaseAlgorithm,
+    config:dict,
+    checkpoint:Path=None,
+    params_dict:dict=None,
+    env_kwargs:dict=None
+):
+    """Function to evaluate the algorithm performance.
+
+    Episode i is simulated with sumo_seed config["eval_seed"] + i, and the evaluation stops
+    before config["eval_episodes"] once the confidence interval of the mean return is
+    narrower than config["eval_ci_width"]. If config["eval_workers"] > 1 and the model
+    checkpoint is given, the episodes run on worker processes that rebuild the algorithm
+    (class of algo with params_dict) from the checkpoint. Otherwise they run on env, whose
+    sumo_seed is restored afterwards (reset(seed=...) keeps the seed for the next episodes).
+    """
+    if config.get("eval_workers", 1) > 1 and checkpoint is not None:
+        rewards = _evaluate_parallel(type(algo), params_dict or {}, checkpoint, config, env_kwargs)
+    else:
+        rewards = []
+        train_seed = env.unwrapped.sumo_seed
+
+        # Evaluate the algorithm for the number of episodes
+        try:
+            for episode in range(config["eval_episodes"]):
+                rewards.append(run_episode(env, algo, get_eval_seed(config, episode)))
+                if stop_evaluation(rewards, config):
+                    break
+        finally:
+            env.unwrapped.sumo_seed = train_seed
 
     # Return the result metrics
     return {
         "avg_reward": float(np.mean(rewards)),
         "std_reward": float(np.std(rewards)),
-        "all_rewards": rewards
+        "all_rewards": rewards,
+        "seeds": [get_eval_seed(config, episode) for episode in range(len(rewards))],
+        "ci_width": confidence_interval_width(rewards, config.get("eval_confidence", 0.95)),
     }
 
 
+def _evaluate_parallel(algo_class, params_dict:dict, checkpoint:Path, config:dict, env_kwargs:dict):
+    """Total rewards of the evaluation episodes run on config["eval_workers"] processes"""
+    tasks = [
+        (f"eval_episode_{episode}", _evaluate_episode, {
+            "algo_class": algo_class,
+            "params_dict": params_dict,
+            "checkpoint": checkpoint,
+            "seed": get_eval_seed(config, episode),
+            "env_kwargs": env_kwargs,
+        })
+        for episode in range(config["eval_episodes"])
+    ]
+    episode_index = {name: episode for episode, (name, _, _) in enumerate(tasks)}
+
+    # Episodes end in any order, the stopping rule only uses the first consecutive ones
+    results = {}
+    rewards = []
+    episodes = run_processes(tasks, {"num_workers": config["eval_workers"]}, verbose=False)
+    try:
+        for name, status, result in episodes:
+            if status != "ok":
+                raise RuntimeError(f"Evaluation {name} failed:\n{result}")
+            results[episode_index[name]] = result
+            while len(rewards) in results:
+                rewards.append(results[len(rewards)])
+            if stop_evaluation(rewards, config):
+                break
+    finally:
+        # Terminates the episodes still running
+        episodes.close()
+
+    return rewards
+
+
+def run_experiment(
+    algo_class,
+    params_dict:dict,
+    training_config:dict,
+    save_dir:Path,
+    env:gym.Env=None,
+    seed=None,
+    env_kwargs:dict=None,
+    cache_root:Path=None
+):
+    """Train and evaluate one configuration and save its train.json/eval.json logs.
+
+    With a cache_root, cached results of the same experiment are copied instead of
+    retraining, and a cached shorter training is resumed for the remaining steps (a
+    cached training of the same length with another evaluation config is only evaluated).
+    """
+    save_dir.mkdir(parents=True, exist_ok=True)
+    train_steps = training_config["train_steps"]
+
+    # Reuse the cached results (or the longest cached checkpoint)
+    checkpoint = None
+    previous_metrics = []
+    trained_steps = 0
+    if cache_root is not None:
+        key, lineage_key = result_cache.get_cache_keys(algo_class, params_dict, training_config, seed, env_kwargs)
+        status, entry = result_cache.lookup(cache_root, key, lineage_key, train_steps)
+        if status == "hit":
+            print(f"Using cached results {entry}")
+            result_cache.restore(entry, save_dir)
+            with open(save_dir / "eval.json") as f:
+                return json.load(f)
+        if status == "partial":
+            with open(entry / result_cache.META_FILE) as f:
+                trained_steps = json.load(f)["train_steps"]
+            with open(entry / "train.json") as f:
+                previous_metrics = json.load(f)
+            if (entry / METRICS_FILE).exists():
+                shutil.copy2(entry / METRICS_FILE, save_dir / METRICS_FILE)
+            checkpoint = entry / "model.zip"
+            print(f"Resuming cached checkpoint {entry} ({trained_steps} steps)")
+
+    # Own env (seeded SUMO) if no env is shared
+    own_env = env is None
+    if own_env:
+        train_env_kwargs = dict(env_kwargs or {})
+        if seed is not None:
+            train_env_kwargs["sumo_seed"] = seed
+        env = gym.make(CUSTOM_ENV_ID, **train_env_kwargs)
+    if seed is not None:
+        np.random.seed(seed)
+
+    try:
+        # Initialize algorithm with the current iteration of its hyperparameters
+        algo = algo_class(env, **params_dict)
+        if checkpoint is not None:
+            algo.load(checkpoint)
+
+        # Train and log the metrics
+        train_metrics = train_algorithm(
+            env, algo, {**training_config, "train_steps": train_steps - trained_steps}, save_dir, start_step=trained_steps
+        )
+        eval_metrics = evaluate_algorithm(env, algo, training_config, save_dir / "model.zip", params_dict, env_kwargs)
+    finally:
+        if own_env:
+            env.close()
+
+    # Metrics of the resumed steps follow the cached ones
+    train_metrics = previous_metrics + train_metrics
+
+    # Save JSON logs
+    with open(save_dir / "train.json", "w") as f:
+        json.dump(train_metrics, f, indent=4)
+
+    with open(save_dir / "eval.json", "w") as f:
+        json.dump(eval_metrics, f, indent=4)
+
+    if cache_root is not None:
+        result_cache.store(cache_root, key, lineage_key, train_steps, save_dir)
+
+    return eval_metrics
+
+
 def run(
     algorithms:dict=ALGORITHMS, 
     hyperparams:dict=PARAM_GRID, 
     training_config:dict=TRAINING_CONFIG, 
-    results_root:Path=RESULTS_ROOT
+    results_root:Path=RESULTS_ROOT,
+    cache_root:Path=CACHE_ROOT
 ):
     env = gym.make(CUSTOM_ENV_ID)
 
@@ -118,38 +411,169 @@ def run(
     base_dir.mkdir(parents=True, exist_ok=True)
 
     for algo_name, algo_class in algorithms.items():
-        
-        # Get the hyperparameter lists
-        params_keys = list(hyperparams[algo_name].keys())
-        params_values = list(hyperparams[algo_name].values())
 
         # Try all combinations of all parameters
-        for params_tuple in product(*params_values):
-            
-            # Create the dict for keeping track of current config
-            params_dict = dict(zip(params_keys, params_tuple))
+        for params_dict in expand_grid(hyperparams[algo_name]):
 
             print(f"Running {algo_name} with {params_dict}")
 
             # Create folder: Results/timestamp/algo_lr=...
-            name = algo_name + "_" + "_".join(f"{k}_{v}" for k, v in params_dict.items())
-            save_dir = base_dir / name
-            save_dir.mkdir(parents=True, exist_ok=True)
+            save_dir = base_dir / get_experiment_name(algo_name, params_dict)
+
+            run_experiment(algo_class, params_dict, training_config, save_dir, env=env, cache_root=cache_root)
+
+
+def _sweep_worker(conn, label:int, cpu, torch_threads, fn, kwargs:dict):
+    """Process running one task of a sweep, sends back the result of fn(**kwargs)"""
+    try:
+        # Pin the process (and the SUMO child it launches) to its CPU
+        if cpu is not None:
+            os.sched_setaffinity(0, {cpu})
+        if torch_threads is not None:
+            torch.set_num_threads(torch_threads)
+
+        # Unique connection label per task (read from the base class by sumo-rl)
+        SumoEnvironment.CONNECTION_LABEL = label
+
+        conn.send(("ok", fn(**kwargs)))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_processes(tasks:list, sweep_config:dict=SWEEP_CONFIG, verbose:bool=True):
+    """Run tasks (name, fn, kwargs) on worker processes, one process per task.
+
+    At most num_workers tasks run at the same time. Yields (name, status, result) as the
+    tasks end: status "ok" with the return value of fn, or "error" with the traceback
+    (or exit code if the process died, e.g. SUMO segfault with libsumo). Closing the
+    generator terminates the tasks still running.
+    """
+    num_workers = sweep_config.get("num_workers") or os.cpu_count() or 1
+    ctx = mp.get_context(sweep_config.get("start_method", "spawn"))
+
+    # CPUs available to the workers (round-robin pinning)
+    cpus = sorted(os.sched_getaffinity(0)) if sweep_config.get("pin_cpus") else None
+
+    running = {}  # process sentinel -> (process, conn, name, slot)
+    free_slots = list(range(num_workers))
+    next_task = 0
+
+    try:
+        while next_task < len(tasks) or running:
+
+            # Start tasks while workers are free
+            while next_task < len(tasks) and free_slots:
+                name, fn, kwargs = tasks[next_task]
+                slot = free_slots.pop(0)
+                cpu = cpus[slot % len(cpus)] if cpus else None
+
+                # Not daemonic so the task can start its own processes (parallel evaluation)
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                process = ctx.Process(
+                    target=_sweep_worker,
+                    args=(child_conn, next_task, cpu, sweep_config.get("torch_threads"), fn, kwargs),
+                )
+                process.start()
+                child_conn.close()
+                running[process.sentinel] = (process, parent_conn, name, slot)
+                if verbose:
+                    print(f"Running {name} (worker {slot}{'' if cpu is None else f', cpu {cpu}'})")
+                next_task += 1
+
+            # Wait for any task to end
+            for sentinel in wait(list(running.keys())):
+                process, conn, name, slot = running.pop(sentinel)
+                process.join()
+                free_slots.append(slot)
+
+                # No message means the process died
+                try:
+                    status, result = conn.recv()
+                except EOFError:
+                    status, result = "error", f"Worker exited with code {process.exitcode}"
+                conn.close()
+                yield name, status, result
+    finally:
+        for process, conn, _, _ in running.values():
+            process.terminate()
+            process.join()
+            conn.close()
+
+
+def write_error(save_dir:Path, error:str):
+    """Save the error of a failed experiment in its folder"""
+    save_dir.mkdir(parents=True, exist_ok=True)
+    with open(save_dir / "error.json", "w") as f:
+        json.dump({"error": error}, f, indent=4)
+
+
+def run_parallel(
+    algorithms:dict=ALGORITHMS,
+    hyperparams:dict=PARAM_GRID,
+    training_config:dict=TRAINING_CONFIG,
+    results_root:Path=RESULTS_ROOT,
+    sweep_config:dict=SWEEP_CONFIG,
+    cache_root:Path=CACHE_ROOT
+):
+    """Run the sweep (configurations x seeds) on a pool of worker processes.
 
-            # Initialize algorithm with the current iteration of its hyperparameters
-            algo = algo_class(env, **params_dict)
+    Every experiment runs in its own process with its own env, so a crashed SUMO or
+    worker only fails that experiment (an error.json is written in its folder) and the
+    sweep goes on. Returns {name: eval metrics or None if failed}.
+    """
+    seeds = sweep_config.get("seeds") or [None]
 
-            # Train and log the metrics
-            train_metrics = train_algorithm(env, algo, training_config, save_dir)
-            eval_metrics = evaluate_algorithm(env, algo, training_config)
+    # Create specific results directory under Results
+    base_dir = results_root / get_file_date()
+    base_dir.mkdir(parents=True, exist_ok=True)
 
-            # Save JSON logs
-            with open(save_dir / "train.json", "w") as f:
-                json.dump(train_metrics, f, indent=4)
+    # Every (algorithm, configuration, seed) experiment of the sweep
+    tasks = []
+    for algo_name, algo_class in algorithms.items():
+        for params_dict in expand_grid(hyperparams[algo_name]):
+            for seed in seeds:
+                name = get_experiment_name(algo_name, params_dict, seed)
+                tasks.append((name, run_experiment, {
+                    "algo_class": algo_class,
+                    "params_dict": params_dict,
+                    "training_config": training_config,
+                    "save_dir": base_dir / name,
+                    "seed": seed,
+                    "env_kwargs": sweep_config.get("env_kwargs"),
+                    "cache_root": cache_root,
+                }))
+    print(f"Sweep of {len(tasks)} experiments -> {base_dir}")
+
+    results = {}
+    for name, status, result in run_processes(tasks, sweep_config):
+        if status == "ok":
+            results[name] = result
+            print(f"[{len(results)}/{len(tasks)}] {name}: avg_reward={result['avg_reward']:.2f}")
+        else:
+            results[name] = None
+            write_error(base_dir / name, result)
+            print(f"[{len(results)}/{len(tasks)}] {name}: FAILED (see {base_dir / name / 'error.json'})")
 
-            with open(save_dir / "eval.json", "w") as f:
-                json.dump(eval_metrics, f, indent=4)
+    return results
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep of the algorithms")
+    parser.add_argument("--workers", type=int, default=None, help="Run the sweep in parallel on this many processes")
+    parser.add_argument("--seeds", type=int, nargs="+", default=None, help="SUMO seeds of every configuration (parallel sweep)")
+    parser.add_argument("--pin-cpus", action="store_true", help="Pin every worker to one CPU core")
+    parser.add_argument("--no-cache", action="store_true", help="Retrain even if the results are cached")
+    args = parser.parse_args()
+    cache_root = None if args.no_cache else CACHE_ROOT
+
+    if args.workers is None:
+        run(cache_root=cache_root)
+    else:
+        run_parallel(sweep_config={
+            **SWEEP_CONFIG,
+            "num_workers": args.workers,
+            "seeds": args.seeds or SWEEP_CONFIG["seeds"],
+            "pin_cpus": args.pin_cpus,
+        }, cache_root=cache_root)
@@ -4,12 +4,31 @@ State Space Analysis Tool for Q-learning
 Author: Gator Guo
 """
 
+import argparse
+
+import gymnasium as gym
 import numpy as np
 
+from custom_env import CUSTOM_ENV_ID
+from algorithms.q_learning import Discretizer, SparseQTable
+
+# Candidate numbers of bins per feature (uniform, and quantile if a warmup is given)
+CANDIDATE_BINS = [2, 3, 5, 10]
+
+# Resolution of the per-feature value histograms (features are normalized to [0, 1])
+HISTOGRAM_BINS = 10
+
+# Number of points of the distinct-states growth curve
+GROWTH_POINTS = 10
+
+# Characters of the histogram sparklines (empty to full)
+SPARK_CHARS = " ▁▂▃▄▅▆▇█"
+
+
 def analyze_state_space(n_features, n_actions):
     """
     Analyze Q-table requirements for different discretization strategies.
-    
+
     Args:
         n_features: number of state features
         n_actions: number of possible actions
@@ -19,23 +38,222 @@ def analyze_state_space(n_features, n_actions):
     print("=" * 60)
     print(f"State Features: {n_features}")
     print(f"Actions: {n_actions}\n")
-    
+
     print("Q-TABLE SIZE ESTIMATES:")
     for bins in [5, 10, 15, 20]:
         n_states = bins ** n_features
         qtable_size = n_states * n_actions
         memory_mb = qtable_size * 8 / (1024**2)
-        
+
         status = "✓ Good" if qtable_size < 1_000_000 else "⚠ Large"
         print(f"  {bins} bins/feature: {n_states:,} states, "
               f"{qtable_size:,} Q-values, {memory_mb:.1f}MB [{status}]")
-    
+
     print("\nRECOMMENDATIONS:")
     print("  - Start with 10 bins per feature")
     print("  - If Q-table is too large, reduce bins or use fewer features")
     print("  - Monitor convergence during training")
     print("=" * 60)
 
+
+def feature_names(layout):
+    """Name of every observation feature from the observation layout"""
+    names = []
+    for segment, segment_slice in layout.items():
+        size = segment_slice.stop - segment_slice.start
+        names += [segment] if size == 1 else [f"{segment}[{i}]" for i in range(size)]
+    return names
+
+
+class StateSpaceProfile:
+    """
+    Streaming statistics of the observations of a rollout.
+
+    Per-feature moments and histograms are accumulated in fixed-size arrays, and for
+    every candidate discretization only the set of visited state keys is kept.
+    """
+
+    def __init__(self, n_features, candidates):
+        self.candidates = candidates
+        self.steps = 0
+
+        # Per-feature value distributions
+        self.total = np.zeros(n_features)
+        self.total_sq = np.zeros(n_features)
+        self.min = np.full(n_features, np.inf)
+        self.max = np.full(n_features, -np.inf)
+        self.zeros = np.zeros(n_features, dtype=np.int64)
+        self.histogram = np.zeros((n_features, HISTOGRAM_BINS), dtype=np.int64)
+
+        # Per-candidate visited states, bins used by every feature and growth curve
+        self.visited = {name: set() for name in candidates}
+        self.bins_used = {name: np.zeros((n_features, d.n_bins.max()), dtype=bool)
+                          for name, d in candidates.items()}
+        self.growth = {name: [] for name in candidates}
+
+    def update(self, obs):
+        obs = np.asarray(obs, dtype=np.float64)
+        self.steps += 1
+        self.total += obs
+        self.total_sq += obs * obs
+        np.minimum(self.min, obs, out=self.min)
+        np.maximum(self.max, obs, out=self.max)
+        self.zeros += obs == 0
+        hist_idx = np.clip((obs * HISTOGRAM_BINS).astype(np.int64), 0, HISTOGRAM_BINS - 1)
+        self.histogram[np.arange(len(obs)), hist_idx] += 1
+
+        for name, discretizer in self.candidates.items():
+            bins = discretizer.bins(obs)
+            self.bins_used[name][np.arange(len(obs)), bins] = True
+            self.visited[name].add(int(discretizer.keys(obs)))
+
+    def record_growth(self):
+        for name, visited in self.visited.items():
+            self.growth[name].append((self.steps, len(visited)))
+
+    def new_state_rate(self, name):
+        # Share of new states over the last growth interval (near 0 once saturated)
+        points = [(0, 0)] + self.growth[name]
+        (s0, n0), (s1, n1) = points[-2], points[-1]
+        return (n1 - n0) / max(1, s1 - s0)
+
+
+def _sparkline(counts):
+    if counts.sum() == 0:
+        return ""
+    levels = np.ceil(counts / counts.max() * (len(SPARK_CHARS) - 1)).astype(int)
+    return "".join(SPARK_CHARS[level] for level in levels)
+
+
+def _format_bytes(nbytes):
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if nbytes < 1024:
+            return f"{nbytes:.1f}{unit}"
+        nbytes /= 1024
+    return f"{nbytes:.3g}PB"
+
+
+def profile_state_space(num_steps=2000, policy="random", candidate_bins=CANDIDATE_BINS,
+                        quantile_warmup=0, seed=None, **env_kwargs):
+    """
+    Roll out a policy on the custom environment and measure the visited state space.
+
+    Args:
+        num_steps: number of env steps of the rollout (episodes are chained)
+        policy: "random" or "max-pressure"
+        candidate_bins: numbers of bins per feature of the candidate discretizations
+        quantile_warmup: if > 0, also fit quantile discretizations on the first
+            quantile_warmup observations
+        seed: seed of the random policy and of SUMO
+        **env_kwargs: extra arguments passed to gym.make
+
+    Returns:
+        (profile, names, n_actions): StateSpaceProfile, feature names, number of actions
+    """
+    if seed is not None:
+        env_kwargs.setdefault("sumo_seed", seed)
+    env_kwargs.setdefault("sumo_warnings", False)
+    env = gym.make(CUSTOM_ENV_ID, **env_kwargs)
+    rng = np.random.default_rng(seed)
+
+    obs, _ = env.reset()
+    ts = list(env.unwrapped.traffic_signals.values())[0]
+    names = feature_names(ts.observation_fn.layout)
+    n_features = len(names)
+    n_actions = env.action_space.n
+
+    candidates = {f"uniform-{bins}": Discretizer.uniform(np.zeros(n_features), np.ones(n_features), bins)
+                  for bins in candidate_bins}
+
+    # Observations buffered until the quantile discretizations are fitted
+    warmup = [] if quantile_warmup > 0 else None
+    profile = None if warmup is not None else StateSpaceProfile(n_features, candidates)
+    growth_every = max(1, num_steps // GROWTH_POINTS)
+
+    try:
+        for step in range(1, num_steps + 1):
+            if warmup is not None:
+                warmup.append(np.array(obs))
+                if len(warmup) == quantile_warmup or step == num_steps:
+                    samples = np.stack(warmup)
+                    for bins in candidate_bins:
+                        candidates[f"quantile-{bins}"] = Discretizer.quantile(samples, bins)
+                    profile = StateSpaceProfile(n_features, candidates)
+                    for i, sample in enumerate(warmup, 1):
+                        profile.update(sample)
+                        if i % growth_every == 0:
+                            profile.record_growth()
+                    warmup = None
+            else:
+                profile.update(obs)
+                if step % growth_every == 0:
+                    profile.record_growth()
+
+            if policy == "max-pressure":
+                action = ts.select_max_pressure_action()
+            else:
+                action = int(rng.integers(n_actions))
+            obs, _, terminated, truncated, _ = env.step(action)
+            if terminated or truncated:
+                obs, _ = env.reset()
+                ts = list(env.unwrapped.traffic_signals.values())[0]
+    finally:
+        env.close()
+
+    if profile.steps % growth_every != 0:
+        profile.record_growth()
+    return profile, names, n_actions
+
+
+def print_profile(profile, names, n_actions):
+    """Print the per-feature distributions and the per-candidate occupancy report."""
+    print("=" * 78)
+    print("Q-LEARNING EMPIRICAL STATE SPACE PROFILE")
+    print("=" * 78)
+    print(f"Steps: {profile.steps}  Features: {len(names)}  Actions: {n_actions}\n")
+
+    print("FEATURE DISTRIBUTIONS:")
+    mean = profile.total / profile.steps
+    std = np.sqrt(np.maximum(profile.total_sq / profile.steps - mean ** 2, 0))
+    print(f"  {'feature':<20} {'min':>6} {'mean':>6} {'std':>6} {'max':>6} {'zero':>6}  histogram [0, 1]")
+    for i, name in enumerate(names):
+        print(f"  {name:<20} {profile.min[i]:6.3f} {mean[i]:6.3f} {std[i]:6.3f} {profile.max[i]:6.3f} "
+              f"{profile.zeros[i] / profile.steps:6.1%}  |{_sparkline(profile.histogram[i])}|")
+
+    print("\nDISCRETIZATIONS:")
+    print(f"  {'candidate':<14} {'worst-case':>11} {'dense':>9} {'visited':>8} {'bins used':>10} "
+          f"{'new rate':>9} {'sparse':>9}")
+    for name, discretizer in profile.candidates.items():
+        n_visited = len(profile.visited[name])
+        dense_nbytes = float(discretizer.n_states) * n_actions * 8
+        sparse_nbytes = SparseQTable.projected_nbytes(n_visited, n_actions)
+        bins_used = profile.bins_used[name].sum(axis=1).mean()
+        print(f"  {name:<14} {float(discretizer.n_states):11.3g} {_format_bytes(dense_nbytes):>9} "
+              f"{n_visited:8,} {bins_used:10.2f} {profile.new_state_rate(name):9.3f} "
+              f"{_format_bytes(sparse_nbytes):>9}")
+
+    print("\nDISTINCT STATES GROWTH (steps: visited):")
+    for name, growth in profile.growth.items():
+        print(f"  {name:<14} " + " ".join(f"{n}" for _, n in growth))
+    print(f"  {'steps':<14} " + " ".join(f"{s}" for s, _ in next(iter(profile.growth.values()))))
+
+    print("\nNOTES:")
+    print("  - worst-case/dense: every bin combination stored in a dense table")
+    print("  - sparse: SparseQTable holding the visited states (default load factor)")
+    print("  - new rate: share of new states in the last interval, near 0 once saturated")
+    print("=" * 78)
+
+
 if __name__ == "__main__":
-    # Example: 8 features, 4 actions (typical traffic signal)
-    analyze_state_space(n_features=8, n_actions=4)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Empirical state space profile of the custom environment")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--policy", choices=["random", "max-pressure"], default="random")
+    parser.add_argument("--bins", type=int, nargs="+", default=CANDIDATE_BINS)
+    parser.add_argument("--quantile-warmup", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    profile, names, n_actions = profile_state_space(
+        args.steps, args.policy, args.bins, args.quantile_warmup, args.seed
+    )
+    print_profile(profile, names, n_actions)
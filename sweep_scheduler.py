@@ -0,0 +1,272 @@
+"""-------------------------------------------------------------------------------------
+File: sweep_scheduler.py
+Description: Successive-halving scheduler of the hyperparameter sweep. Every
+configuration of the grid is trained for a small budget and evaluated, the best 1/eta
+are kept and resumed from their checkpoint for eta times the budget, until the full
+TRAINING_CONFIG["train_steps"]. The scheduler state is saved in the sweep folder after
+every trial, run `python sweep_scheduler.py --resume Results/<timestamp>` to continue
+an interrupted sweep. A trial resumes the checkpoint of the last rung it completed
+(model_<steps>.zip), an interrupted trial is trained again from it.
+-------------------------------------------------------------------------------------"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+
+import gymnasium as gym
+import numpy as np
+
+from custom_env import CUSTOM_ENV_ID
+from metrics_writer import truncate_metrics
+from run_experiments import (
+    ALGORITHMS,
+    METRICS_FILE,
+    PARAM_GRID,
+    RESULTS_ROOT,
+    SWEEP_CONFIG,
+    TRAINING_CONFIG,
+    evaluate_algorithm,
+    expand_grid,
+    get_experiment_name,
+    get_file_date,
+    run_processes,
+    train_algorithm,
+    write_error,
+)
+
+# Successive halving parameters (budgets in env steps, max_steps None = train_steps)
+SCHEDULER_CONFIG = {
+    "min_steps": 25000,
+    "max_steps": None,
+    "eta": 3,
+}
+
+# Name of the scheduler state file in the sweep folder
+STATE_FILE = "scheduler_state.json"
+
+# Checkpoint of a trial after a completed rung (number of trained steps)
+RUNG_CHECKPOINT = "model_{steps}.zip"
+
+
+def get_rungs(min_steps: int, max_steps: int, eta: int) -> list:
+    """Training budget of every rung: min_steps, min_steps * eta, ... up to max_steps"""
+    rungs = []
+    budget = min_steps
+    while budget < max_steps:
+        rungs.append(int(budget))
+        budget *= eta
+    rungs.append(int(max_steps))
+    return rungs
+
+
+def run_trial(
+    algo_class,
+    params_dict: dict,
+    training_config: dict,
+    save_dir: Path,
+    train_steps: int,
+    trained_steps: int = 0,
+    seed=None,
+    env_kwargs: dict = None,
+):
+    """Train a configuration for train_steps more steps (resuming its checkpoint) and evaluate it.
+
+    The training resumes the rung checkpoint of trained_steps (model_<trained_steps>.zip)
+    and saves the one of trained_steps + train_steps once evaluated. The train.json and
+    train_metrics.csv logs are extended with the new metrics (after dropping the steps of
+    an interrupted run of the same trial) and eval.json holds the last evaluation.
+    """
+    save_dir.mkdir(parents=True, exist_ok=True)
+    train_env_kwargs = dict(env_kwargs or {})
+    if seed is not None:
+        train_env_kwargs["sumo_seed"] = seed
+        np.random.seed(seed)
+
+    # An interrupted run already wrote the metrics of some of these steps
+    truncate_metrics(save_dir / METRICS_FILE, trained_steps)
+
+    env = gym.make(CUSTOM_ENV_ID, **train_env_kwargs)
+    algo = algo_class(env, **params_dict)
+    if trained_steps > 0:
+        algo.load(save_dir / RUNG_CHECKPOINT.format(steps=trained_steps))
+    checkpoint = save_dir / "model.zip"
+
+    try:
+        train_metrics = train_algorithm(
+            env, algo, {**training_config, "train_steps": train_steps}, save_dir, start_step=trained_steps
+        )
+        eval_metrics = evaluate_algorithm(env, algo, training_config, checkpoint, params_dict, env_kwargs)
+    finally:
+        env.close()
+
+    # Append to the training log of the previous rungs
+    train_log = save_dir / "train.json"
+    previous = json.loads(train_log.read_text()) if trained_steps > 0 and train_log.exists() else []
+    previous = [entry for entry in previous if entry["step"] < trained_steps]
+    with open(train_log, "w") as f:
+        json.dump(previous + train_metrics, f, indent=4)
+
+    with open(save_dir / "eval.json", "w") as f:
+        json.dump(eval_metrics, f, indent=4)
+
+    # Checkpoint of the completed rung, written aside and renamed (never partial)
+    rung_checkpoint = save_dir / RUNG_CHECKPOINT.format(steps=trained_steps + train_steps)
+    tmp_path = rung_checkpoint.with_name("tmp-" + rung_checkpoint.name)
+    shutil.copy2(checkpoint, tmp_path)
+    os.replace(tmp_path, rung_checkpoint)
+
+    return eval_metrics
+
+
+def save_state(sweep_dir: Path, state: dict):
+    """Atomically write the scheduler state (a crash never leaves a partial file)"""
+    tmp_path = sweep_dir / (STATE_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, sweep_dir / STATE_FILE)
+
+
+def init_state(algorithms: dict, hyperparams: dict, training_config: dict, scheduler_config: dict, seeds: list) -> dict:
+    """Initial scheduler state: every (algorithm, configuration, seed) trial is active"""
+    max_steps = scheduler_config.get("max_steps") or training_config["train_steps"]
+    trials = {}
+    for algo_name in algorithms:
+        for params_dict in expand_grid(hyperparams[algo_name]):
+            for seed in seeds:
+                trials[get_experiment_name(algo_name, params_dict, seed)] = {
+                    "algo": algo_name,
+                    "params": params_dict,
+                    "seed": seed,
+                    "steps": 0,
+                    "scores": {},
+                    "status": "active",
+                }
+    return {
+        "rungs": get_rungs(scheduler_config["min_steps"], max_steps, scheduler_config["eta"]),
+        "eta": scheduler_config["eta"],
+        "rung": 0,
+        "training_config": training_config,
+        "trials": trials,
+    }
+
+
+def successive_halving(
+    algorithms: dict = ALGORITHMS,
+    hyperparams: dict = PARAM_GRID,
+    training_config: dict = TRAINING_CONFIG,
+    results_root: Path = RESULTS_ROOT,
+    scheduler_config: dict = SCHEDULER_CONFIG,
+    sweep_config: dict = SWEEP_CONFIG,
+    resume_dir: Path = None,
+) -> dict:
+    """Run (or resume) a successive-halving sweep, returns the final scheduler state.
+
+    Args:
+        algorithms (dict): Algorithm classes by name.
+        hyperparams (dict): Hyperparameter grid of every algorithm.
+        training_config (dict): Training parameters (train_steps is the full budget).
+        results_root (Path): Where the sweep folder is created.
+        scheduler_config (dict): min_steps, max_steps and eta of the halving.
+        sweep_config (dict): Worker pool parameters (see run_experiments.SWEEP_CONFIG).
+        resume_dir (Path): Folder of an interrupted sweep to continue.
+    """
+    if resume_dir is not None:
+        sweep_dir = Path(resume_dir)
+        state = json.loads((sweep_dir / STATE_FILE).read_text())
+        training_config = state["training_config"]
+        print(f"Resuming sweep {sweep_dir} at rung {state['rung']}")
+    else:
+        sweep_dir = results_root / get_file_date()
+        sweep_dir.mkdir(parents=True, exist_ok=True)
+        state = init_state(algorithms, hyperparams, training_config, scheduler_config,
+                           sweep_config.get("seeds") or [None])
+        save_state(sweep_dir, state)
+
+    rungs = state["rungs"]
+    trials = state["trials"]
+
+    while state["rung"] < len(rungs):
+        rung = state["rung"]
+        budget = rungs[rung]
+        key = str(rung)
+
+        # Active trials not evaluated yet at this rung (all of them unless resuming)
+        pending = [name for name, t in trials.items() if t["status"] == "active" and key not in t["scores"]]
+        print(f"Rung {rung}: {len(pending)} trials to train up to {budget} steps")
+
+        tasks = [
+            (name, run_trial, {
+                "algo_class": algorithms[trials[name]["algo"]],
+                "params_dict": trials[name]["params"],
+                "training_config": training_config,
+                "save_dir": sweep_dir / name,
+                "train_steps": budget - trials[name]["steps"],
+                "trained_steps": trials[name]["steps"],
+                "seed": trials[name]["seed"],
+                "env_kwargs": sweep_config.get("env_kwargs"),
+            })
+            for name in pending
+        ]
+        for name, status, result in run_processes(tasks, sweep_config):
+            trial = trials[name]
+            if status == "ok":
+                trial["steps"] = budget
+                trial["scores"][key] = result["avg_reward"]
+                print(f"  {name}: avg_reward={result['avg_reward']:.2f}")
+            else:
+                trial["status"] = "failed"
+                write_error(sweep_dir / name, result)
+                print(f"  {name}: FAILED (see {sweep_dir / name / 'error.json'})")
+            save_state(sweep_dir, state)
+
+        # Keep the best 1/eta of the rung (the last rung keeps everything)
+        ranked = sorted(
+            (name for name, t in trials.items() if t["status"] == "active"),
+            key=lambda name: trials[name]["scores"][key],
+            reverse=True,
+        )
+        if rung < len(rungs) - 1:
+            n_keep = max(1, math.ceil(len(ranked) / state["eta"]))
+            for name in ranked[n_keep:]:
+                trials[name]["status"] = "stopped"
+        state["rung"] += 1
+        save_state(sweep_dir, state)
+
+    print_summary(state)
+    return state
+
+
+def print_summary(state: dict):
+    """Print the final ranking and the training budget saved by the early stopping"""
+    trials = state["trials"]
+    last = str(len(state["rungs"]) - 1)
+    finished = sorted(
+        (name for name, t in trials.items() if last in t["scores"]),
+        key=lambda name: trials[name]["scores"][last],
+        reverse=True,
+    )
+    print("Final ranking:")
+    for rank, name in enumerate(finished, 1):
+        print(f"  {rank}. {name}: avg_reward={trials[name]['scores'][last]:.2f}")
+
+    used = sum(t["steps"] for t in trials.values())
+    full = len(trials) * state["rungs"][-1]
+    print(f"Trained {used:,} steps instead of {full:,} for the full grid ({used / full:.1%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive-halving hyperparameter sweep")
+    parser.add_argument("--resume", type=Path, default=None, help="Folder of the sweep to resume")
+    parser.add_argument("--min-steps", type=int, default=SCHEDULER_CONFIG["min_steps"])
+    parser.add_argument("--eta", type=int, default=SCHEDULER_CONFIG["eta"])
+    parser.add_argument("--workers", type=int, default=SWEEP_CONFIG["num_workers"])
+    args = parser.parse_args()
+
+    successive_halving(
+        scheduler_config={**SCHEDULER_CONFIG, "min_steps": args.min_steps, "eta": args.eta},
+        sweep_config={**SWEEP_CONFIG, "num_workers": args.workers},
+        resume_dir=args.resume,
+    )
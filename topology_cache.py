@@ -0,0 +1,174 @@
+"""-------------------------------------------------------------------------------------
+File: topology_cache.py
+Description: Compiled static topology of the traffic signals of a network. The .net.xml
+is parsed once with sumolib into compact arrays (controlled links, lane lengths, signal
+programs and their green phases) saved in TOPOLOGY_ROOT/<sha256 of the net file>.npz,
+so the CustomTrafficSignal objects of every (re)started simulation are built from the
+cache instead of TraCI queries (see `cached_topology` in CustomSumoEnvironment).
+-------------------------------------------------------------------------------------"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import sumolib
+
+# Folder of the compiled topologies
+TOPOLOGY_ROOT = Path("topology-cache")
+
+# Format of the compiled topologies (part of the cache key)
+TOPOLOGY_VERSION = 1
+
+
+def net_digest(net_file) -> str:
+    """Cache key of a network: sha256 of the contents of the net file and of the format"""
+    digest = hashlib.sha256(f"topology-{TOPOLOGY_VERSION}".encode())
+    with open(net_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def green_phase_indices(states: list[str]) -> list[int]:
+    """Phases with a green (g/G) and no yellow (y/Y) signal"""
+    return [
+        idx for idx, state in enumerate(states)
+        if any(c in "gG" for c in state) and not any(c in "yY" for c in state)
+    ]
+
+
+class SignalTopology:
+    """Static description of a traffic signal, as the TraCI getters return it at the start
+    of a simulation (before sumo-rl rebuilds its program).
+
+    Attributes:
+        links (list): (in lane, out lane) of every link index, None for unused indices
+            (first connection of trafficlight.getControlledLinks).
+        lanes_length (dict): Length of every in-lane and out-lane of the links.
+        program_id (str): Id of the initial program.
+        phases (list): (state, duration) of the phases of the initial program.
+        green_phase_indices (list): Green phases of the initial program.
+    """
+
+    def __init__(self, ts_id: str, links: list, lanes_length: dict, program_id: str, phases: list,
+                 green_phase_indices: list):
+        self.id = ts_id
+        self.links = links
+        self.lanes_length = lanes_length
+        self.program_id = program_id
+        self.phases = phases
+        self.green_phase_indices = green_phase_indices
+
+    @property
+    def controlled_lanes(self) -> list[str]:
+        """In-lane of every link (trafficlight.getControlledLanes)"""
+        return [link[0] for link in self.links if link is not None]
+
+
+class NetworkTopology:
+    """Topology of all the traffic signals of a network, stored as flat arrays (strings,
+    lengths and per-signal offsets), see compile_topology()."""
+
+    def __init__(self, arrays: dict):
+        self.arrays = arrays
+        self.ts_ids = [str(ts_id) for ts_id in arrays["ts_ids"]]
+        self._ts_index = {ts_id: i for i, ts_id in enumerate(self.ts_ids)}
+        self._lanes_length = dict(zip(arrays["lane_ids"].tolist(), arrays["lane_lengths"].tolist()))
+        self._signals = {}
+
+    def signal(self, ts_id: str) -> SignalTopology:
+        """Topology of a traffic signal (built once from the arrays)"""
+        signal = self._signals.get(ts_id)
+        if signal is not None:
+            return signal
+
+        a = self.arrays
+        i = self._ts_index[ts_id]
+        start, end = a["link_offsets"][i], a["link_offsets"][i + 1]
+        links = [
+            (in_lane, out_lane) if in_lane else None
+            for in_lane, out_lane in zip(a["link_in"][start:end].tolist(), a["link_out"][start:end].tolist())
+        ]
+        lanes = dict.fromkeys(lane for link in links if link is not None for lane in link)
+        start, end = a["phase_offsets"][i], a["phase_offsets"][i + 1]
+        phases = list(zip(a["phase_states"][start:end].tolist(), a["phase_durations"][start:end].tolist()))
+        start, end = a["green_offsets"][i], a["green_offsets"][i + 1]
+
+        signal = self._signals[ts_id] = SignalTopology(
+            ts_id,
+            links,
+            {lane: self._lanes_length[lane] for lane in lanes},
+            str(a["program_ids"][i]),
+            phases,
+            a["green_indices"][start:end].tolist(),
+        )
+        return signal
+
+
+def compile_topology(net_file) -> NetworkTopology:
+    """Parse the traffic signals of a net file with sumolib (with the internal lanes and the
+    pedestrian crossings)"""
+    net = sumolib.net.readNet(str(net_file), withInternal=True, withPedestrianConnections=True, withPrograms=True)
+
+    ts_ids, program_ids = [], []
+    link_offsets, link_in, link_out = [0], [], []
+    phase_offsets, phase_states, phase_durations = [0], [], []
+    green_offsets, green_indices = [0], []
+    lane_lengths = {}
+    for tls in net.getTrafficLights():
+        ts_ids.append(tls.getID())
+
+        # First connection of every link index ("" for unused indices)
+        links = {}
+        for in_lane, out_lane, link_index in tls.getConnections():
+            links.setdefault(link_index, (in_lane.getID(), out_lane.getID()))
+            for lane in (in_lane, out_lane):
+                lane_lengths[lane.getID()] = lane.getLength()
+        num_links = max(links) + 1 if links else 0
+        for k in range(num_links):
+            in_lane, out_lane = links.get(k, ("", ""))
+            link_in.append(in_lane)
+            link_out.append(out_lane)
+        link_offsets.append(len(link_in))
+
+        # Initial program: the first one of the net file
+        program_id, program = next(iter(tls.getPrograms().items()))
+        program_ids.append(program_id)
+        states = [phase.state for phase in program.getPhases()]
+        phase_states += states
+        phase_durations += [float(phase.duration) for phase in program.getPhases()]
+        phase_offsets.append(len(phase_states))
+        green_indices += green_phase_indices(states)
+        green_offsets.append(len(green_indices))
+
+    return NetworkTopology({
+        "ts_ids": np.array(ts_ids, dtype=str),
+        "program_ids": np.array(program_ids, dtype=str),
+        "link_offsets": np.array(link_offsets, dtype=np.int64),
+        "link_in": np.array(link_in, dtype=str),
+        "link_out": np.array(link_out, dtype=str),
+        "phase_offsets": np.array(phase_offsets, dtype=np.int64),
+        "phase_states": np.array(phase_states, dtype=str),
+        "phase_durations": np.array(phase_durations, dtype=np.float64),
+        "green_offsets": np.array(green_offsets, dtype=np.int64),
+        "green_indices": np.array(green_indices, dtype=np.int64),
+        "lane_ids": np.array(list(lane_lengths), dtype=str),
+        "lane_lengths": np.array(list(lane_lengths.values()), dtype=np.float64),
+    })
+
+
+def load_topology(net_file, root: Path = TOPOLOGY_ROOT) -> NetworkTopology:
+    """Compiled topology of a net file, from the cache (compiled and saved on the first use)"""
+    path = Path(root) / f"{net_digest(net_file)}.npz"
+    if path.exists():
+        with np.load(path, allow_pickle=False) as data:
+            return NetworkTopology({key: data[key] for key in data.files})
+
+    topology = compile_topology(net_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Atomic write, concurrent envs never load a partial file
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+    np.savez(tmp_path, **topology.arrays)
+    os.replace(tmp_path, path)
+    return topology
@@ -0,0 +1,141 @@
+"""-------------------------------------------------------------------------------------
+File: traci_profiler.py
+Description: Instrumentation of the TraCI connection used by the custom environment.
+InstrumentedConnection stands in for `env.sumo` (TraCI connection or libsumo module)
+and times every call made during the env steps per TraCI method and per caller, so
+TraCIProfiler.report() shows where the time of a step goes, e.g.
+"person.getLaneID: 18,400 calls, 61.0% of step time".
+-------------------------------------------------------------------------------------"""
+
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class TraCIProfiler:
+    """Call counts and latencies of the TraCI methods (and of their callers).
+
+    Only the calls made inside `step()` sections are recorded, the time of these sections
+    is the "step time" of the report.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clear the statistics (start of an episode)"""
+        # (method, caller) -> [calls, seconds]
+        self.stats = defaultdict(lambda: [0, 0.0])
+        self.active = False
+        self.steps = 0
+        self.sim_steps = 0
+        self.step_time = 0.0
+
+    @contextmanager
+    def step(self):
+        """Section of an env step, the TraCI calls inside are recorded"""
+        self.active = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.step_time += time.perf_counter() - start
+            self.steps += 1
+            self.active = False
+
+    def record(self, method: str, caller: str, seconds: float):
+        stat = self.stats[(method, caller)]
+        stat[0] += 1
+        stat[1] += seconds
+        if method == "simulationStep":
+            self.sim_steps += 1
+
+    def method_stats(self) -> dict:
+        """{method: [calls, seconds]} summed over the callers"""
+        totals = defaultdict(lambda: [0, 0.0])
+        for (method, _), (calls, seconds) in self.stats.items():
+            totals[method][0] += calls
+            totals[method][1] += seconds
+        return dict(totals)
+
+    def report(self, top: int = 15, callers: int = 3) -> str:
+        """Text report of the most expensive TraCI methods and their main callers"""
+        if self.steps == 0:
+            return "TraCI profile: no step recorded"
+
+        step_time = max(self.step_time, 1e-12)
+        methods = sorted(self.method_stats().items(), key=lambda item: item[1][1], reverse=True)
+        traci_calls = sum(calls for calls, _ in self.stats.values())
+        traci_time = sum(seconds for _, seconds in self.stats.values())
+
+        lines = [
+            f"TraCI profile: {self.steps:,} env steps, {self.sim_steps:,} sim steps, "
+            f"{self.step_time:.2f}s step time ({1000 * self.step_time / self.steps:.2f}ms/step)",
+            f"  all TraCI calls: {traci_calls:,} calls ({traci_calls / self.steps:.1f}/step), "
+            f"{traci_time / step_time:.1%} of step time",
+        ]
+        for method, (calls, seconds) in methods[:top]:
+            lines.append(
+                f"  {method}: {calls:,} calls, {seconds / step_time:.1%} of step time "
+                f"({calls / self.steps:.1f} calls/step, {1e6 * seconds / calls:.1f}us/call)"
+            )
+            method_callers = sorted(
+                ((caller, stat) for (m, caller), stat in self.stats.items() if m == method),
+                key=lambda item: item[1][1],
+                reverse=True,
+            )
+            for caller, (caller_calls, caller_seconds) in method_callers[:callers]:
+                lines.append(f"      {caller}: {caller_calls:,} calls, {caller_seconds / step_time:.1%}")
+        return "\n".join(lines)
+
+
+class _InstrumentedDomain:
+    """Proxy of a TraCI domain (e.g. conn.lane) timing its methods"""
+
+    def __init__(self, domain, name: str, profiler: TraCIProfiler):
+        self._domain = domain
+        self._name = name
+        self._profiler = profiler
+
+    def __getattr__(self, attr):
+        value = getattr(self._domain, attr)
+        if callable(value):
+            value = _instrument(value, f"{self._name}.{attr}", self._profiler)
+        # Cache the wrapper (next lookups do not go through __getattr__)
+        setattr(self, attr, value)
+        return value
+
+
+class InstrumentedConnection:
+    """Proxy of a TraCI connection (or of the libsumo module) recording every call in a
+    TraCIProfiler. Domains (lane, person, ...) and methods are wrapped on first access."""
+
+    def __init__(self, connection, profiler: TraCIProfiler):
+        self._connection = connection
+        self._profiler = profiler
+
+    def __getattr__(self, attr):
+        value = getattr(self._connection, attr)
+        if hasattr(value, "subscribe"):
+            # Domain object (TraCI) or domain class (libsumo)
+            value = _InstrumentedDomain(value, attr, self._profiler)
+        elif callable(value) and not isinstance(value, type):
+            value = _instrument(value, attr, self._profiler)
+        setattr(self, attr, value)
+        return value
+
+
+def _instrument(method, name: str, profiler: TraCIProfiler):
+    def call(*args, **kwargs):
+        if not profiler.active:
+            return method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            caller = sys._getframe(1).f_code
+            profiler.record(name, getattr(caller, "co_qualname", caller.co_name), elapsed)
+
+    return call
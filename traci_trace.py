@@ -0,0 +1,256 @@
+"""-------------------------------------------------------------------------------------
+File: traci_trace.py
+Description: Record and replay of the TraCI traffic of the custom environment.
+TraceRecorder stands in for `env.sumo` during a real episode and stores every request
+and its response per simulation step, save_trace() writes the episodes to a compact
+binary file. ReplayConnection answers the same requests from the trace without any
+simulator, so the observation, reward and max-pressure code paths can be benchmarked
+deterministically (see `replay_traci` in CustomSumoEnvironment). The traffic signal ids
+are recorded with the first step (INIT_CALL), whose requests also build the traffic
+signals, so ReplayInit can replace the init connection of SumoEnvironment.
+-------------------------------------------------------------------------------------"""
+
+import pickle
+import sys
+import zlib
+from pathlib import Path
+
+# Header of the trace files (format version)
+TRACE_MAGIC = b"TRACI-TRACE-1\n"
+
+# zlib level of the trace files
+TRACE_COMPRESSION = 6
+
+# Argument types used as they are in the lookup keys (others are keyed by their repr)
+_PRIMITIVES = (str, int, float, bool, type(None))
+
+# Request recorded at the first step of every episode (traffic signal ids of the network)
+INIT_CALL = ("trafficlight.getIDList", ())
+
+
+class TraceMismatchError(KeyError):
+    """The replayed code made a TraCI request that was not recorded at this simulation step
+    (different code path or actions than the recorded episode)"""
+
+
+class _RecordedException:
+    """Exception raised by a recorded call, raised again when replayed"""
+
+    def __init__(self, exception: Exception):
+        self.exception = exception
+
+
+def _freeze(value):
+    # Hashable key of a call argument (lists/dicts as tuples, TraCI objects by their repr)
+    if isinstance(value, _PRIMITIVES):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((_freeze(k), _freeze(v)) for k, v in value.items()))
+    return (type(value).__name__, repr(value))
+
+
+def _call_key(name: str, args: tuple, kwargs: dict):
+    if not all(type(arg) in _PRIMITIVES for arg in args):
+        args = _freeze(args)
+    if kwargs:
+        return name, args, _freeze(kwargs)
+    return name, args
+
+
+def _intern(value):
+    # Share the repeated strings (ids) of the responses, the pickle stores them once
+    if type(value) is str:
+        return sys.intern(value)
+    if type(value) is tuple:
+        return tuple(_intern(item) for item in value)
+    if type(value) is list:
+        return [_intern(item) for item in value]
+    if type(value) is dict:
+        return {_intern(k): _intern(v) for k, v in value.items()}
+    return value
+
+
+class TraceRecorder:
+    """Proxy of a TraCI connection (or of the libsumo module) recording every call.
+
+    The episode is a list of simulation steps, each a dict {(method, args): [responses]}
+    (several responses if the call was repeated after a setter changed its value).
+    simulationStep closes the current step.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self.steps = [{}]
+        self.actions = []
+        self.domains = set()
+        self.types = {}
+
+    def __getattr__(self, attr):
+        value = getattr(self._connection, attr)
+        if hasattr(value, "subscribe"):
+            # Domain object (TraCI) or domain class (libsumo)
+            self.domains.add(attr)
+            value = _RecorderDomain(value, attr, self)
+        elif callable(value) and not isinstance(value, type):
+            value = self._record(value, attr)
+        setattr(self, attr, value)
+        return value
+
+    def _record(self, method, name: str):
+        name = sys.intern(name)
+
+        def call(*args, **kwargs):
+            key = _call_key(name, _intern(args), kwargs)
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                self.steps[-1].setdefault(key, []).append(_RecordedException(e))
+                raise
+            self.steps[-1].setdefault(key, []).append(_intern(result))
+            if name == "simulationStep":
+                self.steps.append({})
+            return result
+
+        return call
+
+    def episode(self) -> dict:
+        """Recorded episode (as stored in the trace files)"""
+        return {"steps": self.steps, "actions": self.actions, "domains": sorted(self.domains), "types": self.types}
+
+
+class _RecorderDomain:
+    """Proxy of a TraCI domain (e.g. conn.lane) recording its calls"""
+
+    def __init__(self, domain, name: str, recorder: TraceRecorder):
+        self._domain = domain
+        self._name = name
+        self._recorder = recorder
+
+    def __getattr__(self, attr):
+        value = getattr(self._domain, attr)
+        if isinstance(value, type):
+            # e.g. trafficlight.Phase, needed to replay the code building phases
+            self._recorder.types[f"{self._name}.{attr}"] = value
+        elif callable(value):
+            value = self._recorder._record(value, f"{self._name}.{attr}")
+        setattr(self, attr, value)
+        return value
+
+
+class ReplayConnection:
+    """Stand-in for a TraCI connection answering from a recorded episode.
+
+    Requests are looked up by (method, arguments) in the current simulation step, so the
+    replayed code may repeat, reorder or skip calls, but a request that was not recorded
+    at this step raises TraceMismatchError. Responses are the recorded objects, not
+    copies, they must not be modified.
+    """
+
+    def __init__(self, episode: dict):
+        self.episode = episode
+        self.actions = episode["actions"]
+        self._steps = episode["steps"]
+        self._step = 0
+        self._cursors = {}
+        self._domains = set(episode["domains"])
+        self._types = episode["types"]
+
+    @property
+    def replayed_steps(self) -> int:
+        """Number of simulation steps replayed so far"""
+        return self._step
+
+    def __getattr__(self, attr):
+        if attr in self._domains:
+            value = _ReplayDomain(self, attr)
+        else:
+            value = self._replay(attr)
+        setattr(self, attr, value)
+        return value
+
+    def _replay(self, name: str):
+        def call(*args, **kwargs):
+            key = _call_key(name, args, kwargs)
+            if self._step >= len(self._steps):
+                raise TraceMismatchError(f"{name}{args}: the recorded episode has ended")
+            responses = self._steps[self._step].get(key)
+            if responses is None:
+                raise TraceMismatchError(
+                    f"{name}{args} was not recorded at simulation step {self._step} "
+                    "(the replayed code or actions differ from the recorded episode)"
+                )
+            # Repeated calls return the next response, then the last one
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            result = responses[min(index, len(responses) - 1)]
+
+            if name == "simulationStep":
+                self._step += 1
+                self._cursors = {}
+            if type(result) is _RecordedException:
+                raise result.exception
+            return result
+
+        return call
+
+
+class _ReplayDomain:
+    """Replayed TraCI domain (e.g. conn.lane)"""
+
+    def __init__(self, connection: ReplayConnection, name: str):
+        self._connection = connection
+        self._name = name
+
+    def __getattr__(self, attr):
+        name = f"{self._name}.{attr}"
+        value = self._connection._types.get(name)
+        if value is None:
+            value = self._connection._replay(name)
+        setattr(self, attr, value)
+        return value
+
+
+class ReplayInit:
+    """Stand-in for the traci module while SumoEnvironment.__init__ opens its init
+    connection (traffic signal ids and topology): start() launches nothing and the
+    connection answers from the first step of a recorded episode."""
+
+    def __init__(self, episode: dict):
+        self._connection = ReplayConnection(episode)
+
+    @staticmethod
+    def supports(episode: dict) -> bool:
+        """The episode recorded the requests of the init connection (INIT_CALL)"""
+        return INIT_CALL in episode["steps"][0]
+
+    def start(self, cmd, label=None, **kwargs):
+        pass
+
+    def getConnection(self, label=None):
+        return self
+
+    def close(self):
+        pass
+
+    def __getattr__(self, attr):
+        return getattr(self._connection, attr)
+
+
+def save_trace(path: Path, episodes: list):
+    """Write recorded episodes (TraceRecorder.episode()) to a trace file"""
+    data = zlib.compress(pickle.dumps(episodes, protocol=pickle.HIGHEST_PROTOCOL), TRACE_COMPRESSION)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(TRACE_MAGIC)
+        f.write(data)
+
+
+def load_trace(path: Path) -> list:
+    """Read the episodes of a trace file"""
+    with open(path, "rb") as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a TraCI trace file")
+        return pickle.loads(zlib.decompress(f.read()))
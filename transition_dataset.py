@@ -0,0 +1,254 @@
+"""-------------------------------------------------------------------------------------
+File: transition_dataset.py
+Description: Offline transition datasets of the custom environment. DatasetWriter wraps
+the env and streams every (obs, action, reward, next_obs, terminated, truncated, info
+metrics) transition into fixed-size shards, one fixed-dtype .npy file per field, listed
+in a manifest.json. TransitionDataset memory-maps the shards and yields shuffled batches
+(only the rows of a batch are read). Run `python transition_dataset.py --policy
+max-pressure --steps 100000 --out Datasets/max_pressure` to collect a dataset once and
+reuse it for many offline runs.
+-------------------------------------------------------------------------------------"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import gymnasium as gym
+import numpy as np
+
+from custom_env import CUSTOM_ENV_ID
+
+# Transitions per shard
+DATASET_SHARD_SIZE = 65536
+
+# Numeric info metrics stored with every transition (NaN if missing)
+DATASET_INFO_KEYS = [
+    "step",
+    "system_total_stopped",
+    "system_total_waiting_time",
+    "system_mean_waiting_time",
+    "system_mean_speed",
+    "agents_total_stopped",
+    "agents_total_accumulated_waiting_time",
+]
+
+# Name of the manifest file in the dataset folder
+MANIFEST_FILE = "manifest.json"
+
+DATASETS_ROOT = Path("Datasets")
+
+
+def _shard_file(shard: int, field: str) -> str:
+    return f"shard_{shard:05d}.{field}.npy"
+
+
+def _write_manifest(path: Path, manifest: dict):
+    # Atomic write, readers never see a partial manifest
+    tmp_path = path / (MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, path / MANIFEST_FILE)
+
+
+class DatasetWriter(gym.Wrapper):
+    """Env wrapper recording the transitions of a single-agent env into a dataset folder.
+
+    The transitions are copied into preallocated shard buffers (observation views are
+    safe), a full shard is saved and added to the manifest, `close` saves the last
+    partial shard. Only the manifest shards are part of the dataset, so an interrupted
+    collection keeps every complete shard.
+    """
+
+    def __init__(self, env: gym.Env, path: Path, shard_size: int = DATASET_SHARD_SIZE,
+                 info_keys: list = DATASET_INFO_KEYS, metadata: dict = None):
+        """Creates the dataset folder (it must not contain a dataset yet).
+
+        Args:
+            env (gym.Env): Single-agent environment to record.
+            path (Path): Dataset folder.
+            shard_size (int): Transitions per shard.
+            info_keys (list): Info metrics stored with the transitions.
+            metadata (dict): Extra description saved in the manifest (policy, env args...).
+        """
+        super().__init__(env)
+        self.path = Path(path)
+        self.shard_size = shard_size
+        self.info_keys = list(info_keys)
+        if (self.path / MANIFEST_FILE).exists():
+            raise FileExistsError(f"{self.path} already contains a dataset")
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        obs_space = env.observation_space
+        action_space = env.action_space
+        self.fields = {
+            "obs": (obs_space.dtype, obs_space.shape),
+            "action": (action_space.dtype, action_space.shape),
+            "reward": (np.dtype(np.float32), ()),
+            "next_obs": (obs_space.dtype, obs_space.shape),
+            "terminated": (np.dtype(bool), ()),
+            "truncated": (np.dtype(bool), ()),
+            "info": (np.dtype(np.float64), (len(self.info_keys),)),
+        }
+        self._buffers = {field: np.zeros((shard_size, *shape), dtype=dtype)
+                         for field, (dtype, shape) in self.fields.items()}
+        self._size = 0
+        self._obs = None
+
+        self.manifest = {
+            "env_id": CUSTOM_ENV_ID,
+            "fields": {field: {"dtype": np.dtype(dtype).str, "shape": list(shape)}
+                       for field, (dtype, shape) in self.fields.items()},
+            "info_keys": self.info_keys,
+            "metadata": metadata or {},
+            "num_transitions": 0,
+            "shards": [],
+        }
+        _write_manifest(self.path, self.manifest)
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        self._obs = np.array(obs)
+        return obs, info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+
+        i = self._size
+        buffers = self._buffers
+        buffers["obs"][i] = self._obs
+        buffers["action"][i] = action
+        buffers["reward"][i] = reward
+        buffers["next_obs"][i] = obs
+        buffers["terminated"][i] = terminated
+        buffers["truncated"][i] = truncated
+        buffers["info"][i] = [info.get(key, np.nan) for key in self.info_keys]
+        self._size += 1
+        if self._size == self.shard_size:
+            self.flush()
+
+        self._obs = np.array(obs)
+        return obs, reward, terminated, truncated, info
+
+    def flush(self):
+        """Save the buffered transitions as a new shard"""
+        if self._size == 0:
+            return
+        shard = len(self.manifest["shards"])
+        for field, buffer in self._buffers.items():
+            np.save(self.path / _shard_file(shard, field), buffer[:self._size])
+        self.manifest["shards"].append({"index": shard, "size": self._size})
+        self.manifest["num_transitions"] += self._size
+        _write_manifest(self.path, self.manifest)
+        self._size = 0
+
+    def close(self):
+        self.flush()
+        return super().close()
+
+
+class TransitionDataset:
+    """Read-only transition dataset, the shards are memory-mapped (not loaded)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / MANIFEST_FILE).read_text())
+        self.info_keys = self.manifest["info_keys"]
+        self.fields = list(self.manifest["fields"])
+
+        # {field: [memmap of every shard]}
+        self.shards = {
+            field: [np.load(self.path / _shard_file(shard["index"], field), mmap_mode="r")
+                    for shard in self.manifest["shards"]]
+            for field in self.fields
+        }
+        sizes = [shard["size"] for shard in self.manifest["shards"]]
+        # First global index of every shard
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def gather(self, indices: np.ndarray, fields: list = None) -> dict:
+        """Rows of the given global indices (sorted indices read the shards sequentially)"""
+        fields = fields or self.fields
+        indices = np.asarray(indices, dtype=np.int64)
+        shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        batch = {}
+        for field in fields:
+            spec = self.manifest["fields"][field]
+            out = np.empty((len(indices), *spec["shape"]), dtype=np.dtype(spec["dtype"]))
+            for shard in np.unique(shard_ids):
+                rows = shard_ids == shard
+                out[rows] = self.shards[field][shard][indices[rows] - self.offsets[shard]]
+            batch[field] = out
+        return batch
+
+    def batches(self, batch_size: int, shuffle: bool = True, seed=None, fields: list = None,
+                drop_last: bool = False):
+        """Yields dicts {field: array} of batch_size transitions, one pass over the dataset.
+
+        With shuffle, the batches are drawn from a uniform permutation of all the shards.
+        The indices of a batch are sorted before reading, so each batch reads the pages
+        of the memory-mapped shards in order.
+        """
+        n = len(self)
+        order = np.random.default_rng(seed).permutation(n) if shuffle else np.arange(n)
+        end = n - n % batch_size if drop_last else n
+        for start in range(0, end, batch_size):
+            yield self.gather(np.sort(order[start:start + batch_size]), fields)
+
+    def info(self, key: str) -> np.ndarray:
+        """Column of an info metric over the whole dataset (loaded in memory)"""
+        column = self.info_keys.index(key)
+        return np.concatenate([shard[:, column] for shard in self.shards["info"]])
+
+
+def collect_dataset(path: Path, num_steps: int, policy: str = "max-pressure", seed=None,
+                    shard_size: int = DATASET_SHARD_SIZE, **env_kwargs) -> TransitionDataset:
+    """Roll out a policy on the custom environment and record its transitions.
+
+    Args:
+        path (Path): Dataset folder.
+        num_steps (int): Number of transitions (episodes are chained).
+        policy (str): "random" or "max-pressure".
+        seed: Seed of the random policy and of SUMO.
+        shard_size (int): Transitions per shard.
+        **env_kwargs: Extra arguments passed to gym.make.
+    """
+    if seed is not None:
+        env_kwargs.setdefault("sumo_seed", seed)
+    env_kwargs.setdefault("sumo_warnings", False)
+    metadata = {"policy": policy, "seed": seed, "env_kwargs": env_kwargs}
+    env = DatasetWriter(gym.make(CUSTOM_ENV_ID, **env_kwargs), path, shard_size, metadata=metadata)
+    rng = np.random.default_rng(seed)
+
+    try:
+        env.reset()
+        ts = list(env.unwrapped.traffic_signals.values())[0]
+        for _ in range(num_steps):
+            if policy == "max-pressure":
+                action = ts.select_max_pressure_action()
+            else:
+                action = int(rng.integers(env.action_space.n))
+            _, _, terminated, truncated, _ = env.step(action)
+            if terminated or truncated:
+                env.reset()
+                ts = list(env.unwrapped.traffic_signals.values())[0]
+    finally:
+        env.close()
+    return TransitionDataset(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect an offline transition dataset of the custom environment")
+    parser.add_argument("--steps", type=int, default=10000)
+    parser.add_argument("--policy", choices=["random", "max-pressure"], default="max-pressure")
+    parser.add_argument("--out", type=Path, default=None, help="Dataset folder (default Datasets/<policy>)")
+    parser.add_argument("--shard-size", type=int, default=DATASET_SHARD_SIZE)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    dataset = collect_dataset(args.out or DATASETS_ROOT / args.policy, args.steps, args.policy,
+                              args.seed, args.shard_size)
+    print(f"{len(dataset):,} transitions in {len(dataset.manifest['shards'])} shard(s) at {dataset.path}")
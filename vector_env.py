@@ -0,0 +1,265 @@
+"""-------------------------------------------------------------------------------------
+File: vector_env.py
+Description: Process-parallel vectorized version of the custom environment. Each worker
+process runs its own CustomSumoEnvironment (own libsumo instance or TraCI connection
+label) and writes its observations, rewards and done flags into shared memory arrays,
+so a batched step only sends the actions and small info dicts through the pipes.
+-------------------------------------------------------------------------------------"""
+
+import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
+
+import gymnasium as gym
+import numpy as np
+
+from custom_env import CUSTOM_ENV_ID, SumoEnvironment
+
+# Start method of the worker processes ("spawn" is safe with open TraCI sockets)
+DEFAULT_START_METHOD = "spawn"
+
+
+def _attach_array(name: str, shape: tuple, dtype) -> tuple:
+    """Attach to an existing shared memory block and wrap it in a numpy array"""
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _worker(index: int, conn, env_id: str, env_kwargs: dict):
+    """Worker process loop: owns one environment and serves the commands of the parent.
+
+    Commands (cmd, data) received through the pipe:
+        "attach": shared memory layout {name: (shm_name, shape, dtype)} of the batch arrays
+        "reset": seed (or None), writes the observation in shared memory
+        "step": action, writes obs/reward/terminated/truncated (auto-reset on episode end)
+        "max_pressure": returns the max-pressure action of the first traffic signal
+        "close": closes the environment and exits
+    """
+    shms = []
+    env = None
+    try:
+        # Unique connection label per worker (also keeps the metrics csv files apart)
+        SumoEnvironment.CONNECTION_LABEL = index
+        env = gym.make(env_id, **env_kwargs)
+        conn.send(("ok", (env.observation_space, env.action_space)))
+
+        arrays = {}
+        while True:
+            cmd, data = conn.recv()
+
+            if cmd == "attach":
+                for key, (shm_name, shape, dtype) in data.items():
+                    shm, arrays[key] = _attach_array(shm_name, shape, dtype)
+                    shms.append(shm)
+                conn.send(("ok", None))
+
+            elif cmd == "reset":
+                obs, info = env.reset(seed=data)
+                arrays["obs"][index] = obs
+                conn.send(("ok", info))
+
+            elif cmd == "step":
+                obs, reward, terminated, truncated, info = env.step(data)
+                if terminated or truncated:
+                    # Auto-reset: keep the last observation of the episode in the info
+                    info = {"final_observation": np.array(obs), "final_info": info}
+                    obs, reset_info = env.reset()
+                    info.update(reset_info)
+                arrays["obs"][index] = obs
+                arrays["rewards"][index] = reward
+                arrays["terminated"][index] = terminated
+                arrays["truncated"][index] = truncated
+                conn.send(("ok", info))
+
+            elif cmd == "max_pressure":
+                ts = list(env.unwrapped.traffic_signals.values())[0]
+                conn.send(("ok", ts.select_max_pressure_action()))
+
+            elif cmd == "close":
+                conn.send(("ok", None))
+                break
+
+            else:
+                raise ValueError(f"Unknown command {cmd}")
+
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+
+    finally:
+        if env is not None:
+            env.close()
+        for shm in shms:
+            shm.close()
+        conn.close()
+
+
+class SharedMemoryVectorEnv:
+    """Runs num_envs custom environments in separate processes with batched reset/step.
+
+    The batch observations, rewards and done flags live in `multiprocessing.shared_memory`
+    arrays written directly by the workers. Environments are automatically reset at the
+    end of their episode (the last observation is in info["final_observation"]).
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        env_kwargs: dict = None,
+        env_id: str = CUSTOM_ENV_ID,
+        start_method: str = DEFAULT_START_METHOD,
+        copy: bool = True,
+    ):
+        """Starts the worker processes and allocates the shared memory arrays.
+
+        Args:
+            num_envs (int): Number of environments (worker processes).
+            env_kwargs (dict): Arguments passed to gym.make in every worker.
+            env_id (str): Id of the registered environment.
+            start_method (str): Multiprocessing start method of the workers.
+            copy (bool): If True, reset/step return copies of the shared arrays, otherwise
+                views that are overwritten by the next call.
+        """
+        # Resources released by close() first (a failed __init__ still reaches __del__)
+        self.closed = False
+        self._shms = []
+        self._conns = []
+        self._processes = []
+        self.num_envs = num_envs
+        self.copy = copy
+
+        ctx = mp.get_context(start_method)
+        for index in range(num_envs):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(index, child_conn, env_id, env_kwargs or {}),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+        spaces = self._receive_all()
+        self.single_observation_space, self.single_action_space = spaces[0]
+
+        # Batch arrays in shared memory
+        obs_shape = self.single_observation_space.shape
+        layout = {
+            "obs": ((num_envs,) + obs_shape, np.float32),
+            "rewards": ((num_envs,), np.float64),
+            "terminated": ((num_envs,), np.bool_),
+            "truncated": ((num_envs,), np.bool_),
+        }
+        self._arrays = {}
+        shm_layout = {}
+        for key, (shape, dtype) in layout.items():
+            nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._shms.append(shm)
+            self._arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            shm_layout[key] = (shm.name, shape, dtype)
+
+        self._send_all("attach", [shm_layout] * num_envs)
+        self._receive_all()
+
+    def _send_all(self, cmd: str, data: list):
+        for conn, item in zip(self._conns, data):
+            conn.send((cmd, item))
+
+    def _receive_all(self) -> list:
+        results = []
+        errors = []
+        for index, conn in enumerate(self._conns):
+            status, result = conn.recv()
+            if status == "error":
+                errors.append(f"Worker {index} failed:\n{result}")
+            results.append(result)
+        if errors:
+            self.close(terminate=True)
+            raise RuntimeError("\n".join(errors))
+        return results
+
+    def _output(self, key: str) -> np.ndarray:
+        return self._arrays[key].copy() if self.copy else self._arrays[key]
+
+    def reset(self, seed=None):
+        """Resets every environment.
+
+        Args:
+            seed (Union[int, list, None]): Seed of every env (int: seed + env index).
+
+        Returns:
+            (observations, infos) with observations of shape (num_envs, obs_dim).
+        """
+        if seed is None or isinstance(seed, (list, tuple)):
+            seeds = seed or [None] * self.num_envs
+        else:
+            seeds = [seed + i for i in range(self.num_envs)]
+        self._send_all("reset", seeds)
+        infos = self._receive_all()
+        return self._output("obs"), infos
+
+    def step_async(self, actions):
+        """Sends the actions to the workers without waiting for the results"""
+        self._send_all("step", [int(a) for a in actions])
+
+    def step_wait(self):
+        """Waits for the results of step_async.
+
+        Returns:
+            (observations, rewards, terminated, truncated, infos) batched over the envs.
+        """
+        infos = self._receive_all()
+        return (
+            self._output("obs"),
+            self._output("rewards"),
+            self._output("terminated"),
+            self._output("truncated"),
+            infos,
+        )
+
+    def step(self, actions):
+        """Steps every environment with its action (see step_wait for the outputs)"""
+        self.step_async(actions)
+        return self.step_wait()
+
+    def max_pressure_actions(self) -> np.ndarray:
+        """Returns the max-pressure action of every environment"""
+        self._send_all("max_pressure", [None] * self.num_envs)
+        return np.array(self._receive_all(), dtype=np.int64)
+
+    def sample_actions(self, rng: np.random.Generator = None) -> np.ndarray:
+        """Returns one random action per environment"""
+        rng = rng or np.random.default_rng()
+        return rng.integers(self.single_action_space.n, size=self.num_envs)
+
+    def close(self, terminate: bool = False):
+        """Stops the workers and frees the shared memory"""
+        if self.closed:
+            return
+        self.closed = True
+
+        if not terminate:
+            for conn, process in zip(self._conns, self._processes):
+                if process.is_alive():
+                    try:
+                        conn.send(("close", None))
+                        conn.recv()
+                    except (BrokenPipeError, EOFError):
+                        pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+
+    def __del__(self):
+        # Not even the resources exist if __init__ failed on its first line
+        if not getattr(self, "closed", True):
+            self.close()